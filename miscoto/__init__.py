@@ -16,6 +16,7 @@ from miscoto.miscoto_instance import run_instance
 from miscoto.miscoto_mincom import run_mincom
 from miscoto.miscoto_scopes import run_scopes
 from miscoto.miscoto_focus import run_focus
+from miscoto.miscoto_cache import run_cache
 
 
 __version__="3.2.0"
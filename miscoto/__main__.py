@@ -22,6 +22,8 @@ from miscoto.miscoto_instance import run_instance
 from miscoto.miscoto_mincom import run_mincom
 from miscoto.miscoto_scopes import run_scopes
 from miscoto.miscoto_focus import run_focus
+from miscoto.miscoto_cache import run_cache
+from miscoto import commons
 from shutil import which
 
 LICENSE = """Copyright (C) Dyliss
@@ -107,6 +109,227 @@ def main():
         required=False,
     )
 
+    parent_parser_j = argparse.ArgumentParser(add_help=False)
+    parent_parser_j.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help="number of processes reading symbiont networks, and solving the chunks of focus and the groups or targets of mincom (default: 1)",
+        required=False,
+        type=int,
+        default=1,
+    )
+
+    parent_parser_c = argparse.ArgumentParser(add_help=False)
+    parent_parser_c.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="cache of symbiont facts and groundings, reused between runs (default if no directory given: " + commons.CACHE_DIR + ")",
+        required=False,
+        nargs="?",
+        const=commons.CACHE_DIR,
+        default=None,
+    )
+
+    parent_parser_backend = argparse.ArgumentParser(add_help=False)
+    parent_parser_backend.add_argument(
+        "--backend",
+        dest="backend",
+        help="solver backend: binary runs clingo in a subprocess, module uses the clingo Python API in-process (default: binary)",
+        required=False,
+        choices=commons.SOLVER_BACKENDS,
+        default="binary",
+    )
+
+    parent_parser_seeds_batch = argparse.ArgumentParser(add_help=False)
+    parent_parser_seeds_batch.add_argument(
+        "--seeds-batch",
+        dest="seeds_batch",
+        help="directory of seeds SBML files: the community is read once and the scopes are computed for each seed set, replacing the seeds of the instance and of -s",
+        required=False,
+        default=None,
+    )
+    parent_parser_seeds_batch.add_argument(
+        "--keep-instance-seeds",
+        dest="keep_instance_seeds",
+        help="add each seed set of --seeds-batch to the seeds of the instance and of -s instead of replacing them",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_seeds_batch.add_argument(
+        "--batch-output-dir",
+        dest="batch_output_dir",
+        help="directory receiving one json per seed set of --seeds-batch",
+        required=False,
+        default=None,
+    )
+    parent_parser_seeds_batch.add_argument(
+        "--batch-table",
+        dest="batch_table",
+        help="tsv file summarizing the scopes of all the seed sets of --seeds-batch",
+        required=False,
+        default=None,
+    )
+
+    parent_parser_engine = argparse.ArgumentParser(add_help=False)
+    parent_parser_engine.add_argument(
+        "--engine",
+        dest="engine",
+        help="scope engine: asp solves the ASP encoding, native computes the scopes in Python without grounding (default: asp)",
+        required=False,
+        choices=commons.SCOPE_ENGINES,
+        default="asp",
+    )
+
+    parent_parser_chunk_size = argparse.ArgumentParser(add_help=False)
+    parent_parser_chunk_size.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        help="number of focused species per program, chunks being solved in --jobs processes (default: 0, a single program)",
+        required=False,
+        type=int,
+        default=0,
+    )
+
+    parent_parser_threads = argparse.ArgumentParser(add_help=False)
+    parent_parser_threads.add_argument(
+        "--threads",
+        dest="threads",
+        help="number of solver threads (default: 1)",
+        required=False,
+        type=int,
+        default=1,
+    )
+    parent_parser_threads.add_argument(
+        "--parallel-mode",
+        dest="parallel_mode",
+        help="parallel mode of the solver threads (default: compete with a portfolio of configurations for the optimal solution, union and intersection, split for the enumeration)",
+        required=False,
+        choices=commons.PARALLEL_MODES,
+        default=None,
+    )
+    parent_parser_threads.add_argument(
+        "--concurrent",
+        dest="concurrent",
+        help="solve the union and the intersection concurrently, each in its own solver, once the optimum is known (binary backend)",
+        required=False,
+        action="store_true",
+    )
+
+    parent_parser_per_target = argparse.ArgumentParser(add_help=False)
+    parent_parser_per_target.add_argument(
+        "--per-target",
+        dest="per_target",
+        help="compute an optimal community for each target on its own, grounding once with the targets as external atoms (requires the clingo Python module)",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_per_target.add_argument(
+        "--per-target-table",
+        dest="per_target_table",
+        help="tsv file with the optimum, bacteria and exchanges of each target of --per-target",
+        required=False,
+        default=None,
+    )
+
+    parent_parser_prune = argparse.ArgumentParser(add_help=False)
+    parent_parser_prune.add_argument(
+        "--prune",
+        dest="prune",
+        help="remove before solving the symbionts with no reaction firing in the community scope or not contributing to a target",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--reduce",
+        dest="reduce_symbionts",
+        help="solve with one representative of the symbionts with identical networks, solutions are expanded back to all of them",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--remove-dominated",
+        dest="remove_dominated",
+        help="also remove the symbionts whose reactions are all in another one, with the same or fewer reactants and the same or more products: the optimum is kept but union, intersection and enumeration only cover the solutions without them",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--greedy",
+        dest="greedy",
+        help="start the optimization from a greedy community producing all the targets, whose size also bounds the number of symbionts with soup",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--greedy-compare",
+        dest="greedy_compare",
+        help="with --greedy and --optsol, also solve the optimization without the greedy start and log the time and the number of solutions it saves",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--exchange-pruning",
+        dest="exchange_pruning",
+        help="with minexch, only ground the exchanges of metabolites their producer can make and their receiver can use",
+        required=False,
+        action="store_true",
+    )
+    parent_parser_prune.add_argument(
+        "--decompose",
+        dest="decompose",
+        help="solve separately, in --jobs processes, the groups of targets whose productions involve disjoint sets of symbionts, and combine their solutions",
+        required=False,
+        action="store_true",
+    )
+
+    parent_parser_time_limit = argparse.ArgumentParser(add_help=False)
+    parent_parser_time_limit.add_argument(
+        "--time-limit",
+        dest="time_limit",
+        help="time limit in seconds of the optimal solution, union and intersection solves, the best solution found so far is returned when it is reached (default: 0, no limit)",
+        required=False,
+        type=int,
+        default=0,
+    )
+    parent_parser_time_limit.add_argument(
+        "--progress-file",
+        dest="progress_file",
+        help="JSON lines file receiving each improving solution of the optimization as soon as it is found, requires --optsol",
+        required=False,
+        default=None,
+    )
+
+    parent_parser_intern = argparse.ArgumentParser(add_help=False)
+    parent_parser_intern.add_argument(
+        "--intern",
+        dest="intern",
+        help="replace names by integer identifiers in the instance, names are stored in OUTPUT" + ".symbols.json",
+        required=False,
+        action="store_true"
+    )
+    parent_parser_intern.add_argument(
+        "--sharded",
+        dest="sharded",
+        help="write the instance as a directory OUTPUT with one fragment per organism and a manifest",
+        required=False,
+        action="store_true"
+    )
+    parent_parser_intern.add_argument(
+        "--update",
+        dest="update",
+        help="update the existing instance OUTPUT: only added and modified symbiont networks are read, removed ones are dropped",
+        required=False,
+        action="store_true"
+    )
+    parent_parser_intern.add_argument(
+        "--track-sources",
+        dest="track_sources",
+        help="record the size and modification time of the networks next to the instance, in OUTPUT" + ".sources.json, so that a later --update only reads the changed ones",
+        required=False,
+        action="store_true"
+    )
+
     # Miscoto mincom and scopes specific arguments.
     # Need to recreate some arguments as they are optional in mincom and scopes.
     parent_parser_opt_b = argparse.ArgumentParser(add_help=False)
@@ -130,7 +353,7 @@ def main():
         "-a",
         "--asp",
         dest="asp",
-        help="instance if already created with miscoto_instance",
+        help="instance if already created with miscoto_instance: ASP file, or directory or manifest of a sharded instance",
         required=False,
     )
 
@@ -151,6 +374,38 @@ def main():
         required=False,
         action="store_true"
     )
+    parent_parser_e.add_argument(
+        "--enum-output",
+        dest="enum_output",
+        help="JSON lines file receiving each solution of the enumeration as soon as it is found, instead of keeping them in the results",
+        required=False,
+        default=None,
+    )
+    parent_parser_e.add_argument(
+        "--enum-max",
+        dest="enum_max",
+        help="maximal number of solutions of the enumeration (default: 0, all)",
+        required=False,
+        type=int,
+        default=0,
+    )
+    parent_parser_e.add_argument(
+        "--enum-time-limit",
+        dest="enum_time_limit",
+        help="time limit of the enumeration in seconds (default: 0, no limit)",
+        required=False,
+        type=int,
+        default=0,
+    )
+    parent_parser_e.add_argument(
+        "--enum-convergence",
+        dest="enum_convergence",
+        help="stop the enumeration after K consecutive solutions adding no new symbiont to the union of the previous ones (default: 0, never)",
+        metavar="K",
+        required=False,
+        type=int,
+        default=0,
+    )
     parent_parser_i = argparse.ArgumentParser(add_help=False)
     parent_parser_i.add_argument(
         "--intersection",
@@ -207,7 +462,7 @@ def main():
         help="Prepares instance for miscoto.",
         parents=[
             parent_parser_b, parent_parser_s, parent_parser_m, parent_parser_t,
-            parent_parser_o
+            parent_parser_o, parent_parser_j, parent_parser_c, parent_parser_intern
         ],
         description=
         """
@@ -223,7 +478,8 @@ def main():
         help="Focus on one, several or all species and determine what they can produce alone or in its community.",
         parents=[
             parent_parser_opt_b, parent_parser_opt_s, parent_parser_f,
-            parent_parser_o, parent_parser_all, parent_parser_a
+            parent_parser_o, parent_parser_all, parent_parser_a, parent_parser_j, parent_parser_c,
+            parent_parser_backend, parent_parser_engine, parent_parser_chunk_size
         ],
         description=
         """
@@ -256,7 +512,9 @@ def main():
             parent_parser_opt_b, parent_parser_opt_s, parent_parser_t,
             parent_parser_m, parent_parser_o,
             parent_parser_op, parent_parser_a, parent_parser_e, parent_parser_i,
-            parent_parser_u, parent_parser_opt
+            parent_parser_u, parent_parser_opt, parent_parser_j, parent_parser_c,
+            parent_parser_backend, parent_parser_threads, parent_parser_time_limit, parent_parser_prune,
+            parent_parser_per_target
         ],
         description=
         """
@@ -285,7 +543,8 @@ def main():
         help="Compute the scope and target produciblity of a host.",
         parents=[
             parent_parser_opt_b, parent_parser_opt_s, parent_parser_t,
-            parent_parser_m, parent_parser_o, parent_parser_a
+            parent_parser_m, parent_parser_o, parent_parser_a, parent_parser_j, parent_parser_c,
+            parent_parser_backend, parent_parser_engine, parent_parser_seeds_batch
         ],
         description=
         """
@@ -308,6 +567,41 @@ def main():
         """
     )
 
+    cache_parser = subparsers.add_parser(
+        "cache",
+        help="Inspect and prune the cache of symbiont facts.",
+        description=
+        """
+        Shows the number and size of the entries of the cache of symbiont facts
+        filled by the --cache-dir option of the other subcommands. Least recently
+        used entries can be evicted to bound its size.
+        """,
+        usage="""
+        miscoto cache [--cache-dir directory] [--max-size size_in_MB] [--clear]
+        """
+    )
+    cache_parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="cache directory (default: " + commons.CACHE_DIR + ")",
+        required=False,
+        default=commons.CACHE_DIR,
+    )
+    cache_parser.add_argument(
+        "--max-size",
+        dest="max_size",
+        help="evict least recently used entries until the cache is smaller than this size, in MB",
+        required=False,
+        type=float,
+    )
+    cache_parser.add_argument(
+        "--clear",
+        dest="clear",
+        help="remove all entries of the cache",
+        required=False,
+        action="store_true"
+    )
+
     args = parser.parse_args()
 
     # If no argument print the help.
@@ -316,7 +610,9 @@ def main():
         sys.exit(1)
 
     if args.cmd == "scopes":
-        run_scopes(args.asp, args.targets, args.seeds, args.bactsymbionts, args.modelhost, args.output)
+        run_scopes(args.asp, args.targets, args.seeds, args.bactsymbionts, args.modelhost, args.output, jobs=args.jobs, cache_dir=args.cache_dir,
+                   backend=args.backend, engine=args.engine, seeds_batch=args.seeds_batch, output_table=args.batch_table,
+                   output_dir=args.batch_output_dir, keep_instance_seeds=args.keep_instance_seeds)
     elif args.cmd == "mincom":
         if args.intersection:
             intersection_arg = True
@@ -335,9 +631,17 @@ def main():
         else:
             optsol = False
         run_mincom(args.option, args.bactsymbionts, args.asp, args.targets, args.seeds, args.modelhost,
-                    intersection_arg, enumeration_arg, union_arg, optsol, args.output)
+                    intersection_arg, enumeration_arg, union_arg, optsol, args.output, jobs=args.jobs, cache_dir=args.cache_dir,
+                    backend=args.backend, threads=args.threads, parallel_mode=args.parallel_mode,
+                    time_limit=args.time_limit, progress_file=args.progress_file, enum_output=args.enum_output,
+                    enum_max=args.enum_max, enum_time_limit=args.enum_time_limit, enum_convergence=args.enum_convergence,
+                    prune=args.prune, reduce_symbionts=args.reduce_symbionts, remove_dominated=args.remove_dominated,
+                    decompose=args.decompose, greedy=args.greedy,
+                    exchange_pruning=args.exchange_pruning, per_target=args.per_target, per_target_table=args.per_target_table,
+                    concurrent=args.concurrent, greedy_compare=args.greedy_compare)
     elif args.cmd == "instance":
-        run_instance(args.bactsymbionts, args.seeds, args.modelhost, args.targets, args.output)
+        run_instance(args.bactsymbionts, args.seeds, args.modelhost, args.targets, args.output, jobs=args.jobs, cache_dir=args.cache_dir,
+                     interned=args.intern, sharded=args.sharded, update=args.update, track_sources=args.track_sources)
     elif args.cmd == "focus":
         if not args.all and not args.focus:
             logger.error("ERROR - Either a list of networks with -f/--focus or the --all flag must be given as arguments.")
@@ -345,7 +649,11 @@ def main():
         if args.all and args.focus:
             logger.warning("WARNING - The --focus/-f argument was given along with the --all flag. All metabolic networks will be considered for analysis.")
 
-        run_focus(args.seeds, args.bactsymbionts, args.focus, args.output, args.all, args.asp)
+        run_focus(args.seeds, args.bactsymbionts, args.focus, args.output, args.all, args.asp, jobs=args.jobs, cache_dir=args.cache_dir,
+                  backend=args.backend, engine=args.engine, chunk_size=args.chunk_size)
+    elif args.cmd == "cache":
+        max_size = int(args.max_size * 1024 ** 2) if args.max_size is not None else None
+        run_cache(args.cache_dir, max_size, args.clear)
     else:
         logger.critical("Invalid commands for miscoto.")
         parser.print_help()
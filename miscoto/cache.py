@@ -0,0 +1,373 @@
+# Copyright (C) 2018-2024 Clémence Frioux & Arnaud Belcour - Inria Dyliss - Pleiade
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+On-disk cache of ASP facts and grounded programs, addressed by the content of the files they come from.
+Entries are plain text files. Their modification time is updated at each hit
+so that the least recently used ones are evicted first when the cache is pruned.
+Only the entries of the cache sections are ever listed or evicted, other files of
+the cache directory are left untouched. The size of each section is recorded in a
+usage file, so that it is only walked when it may exceed its budget. The usage file
+is only updated under the lock of its section, concurrent writers never lose an update.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from miscoto import sbml
+
+logger = logging.getLogger(__name__)
+
+FACTS_DIR = 'facts'
+GROUNDINGS_DIR = 'groundings'
+# extension of the entries of each section
+SECTIONS = {FACTS_DIR: '.lp', GROUNDINGS_DIR: '.aspif'}
+# entries are named after their sha256 key
+ENTRY_KEY = re.compile(r'^[0-9a-f]{64}$')
+USAGE_FILE = '.usage'
+LOCK_FILE = '.lock'
+
+
+def file_digest(filepath, digest=None):
+    """Hash the content of a file
+
+    Args:
+        filepath (str): path of the file
+        digest (hashlib object, optional): Defaults to None. digest to update, a new sha256 otherwise
+
+    Returns:
+        hashlib object: updated digest
+    """
+    if digest is None:
+        digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest
+
+
+def symbiont_key(bacteria_path, name):
+    """Get the cache key of the facts of a symbiont network
+
+    Args:
+        bacteria_path (str): SBML file of the symbiont
+        name (str): name of the symbiont
+
+    Returns:
+        str: key of the facts
+    """
+    digest = hashlib.sha256(('reader-' + str(sbml.READER_VERSION) + '\n' + name + '\n').encode())
+    return file_digest(bacteria_path, digest).hexdigest()
+
+
+def entry_path(cache_dir, section, key, suffix='.lp'):
+    """Get the path of a cache entry
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+        key (str): key of the entry
+        suffix (str, optional): Defaults to '.lp'. extension of the entry
+
+    Returns:
+        str: path of the entry
+    """
+    return os.path.join(cache_dir, section, key[:2], key + suffix)
+
+
+def get_entry(cache_dir, section, key, suffix='.lp'):
+    """Read a cache entry and mark it as recently used
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+        key (str): key of the entry
+        suffix (str, optional): Defaults to '.lp'. extension of the entry
+
+    Returns:
+        str: content of the entry, None if not in cache
+    """
+    path = entry_path(cache_dir, section, key, suffix)
+    try:
+        with open(path, 'r') as f:
+            content = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return content
+
+
+def put_entry(cache_dir, section, key, content, suffix='.lp'):
+    """Write a cache entry. The entry is written in a temporary file then
+    renamed, so that concurrent writers never expose a partial entry.
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+        key (str): key of the entry
+        content (str): content of the entry
+        suffix (str, optional): Defaults to '.lp'. extension of the entry
+    """
+    path = entry_path(cache_dir, section, key, suffix)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.miscoto_')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    with section_lock(cache_dir, section):
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        os.replace(tmp_path, path)
+        usage = read_usage(cache_dir, section)
+        if usage is not None:
+            write_usage(cache_dir, section, usage + os.path.getsize(path) - previous_size)
+
+
+def is_cache_dir(cache_dir):
+    """Check whether a directory holds cache sections
+
+    Args:
+        cache_dir (str): cache directory
+
+    Returns:
+        bool: True if one of the sections exists
+    """
+    return any(os.path.isdir(os.path.join(cache_dir, section)) for section in SECTIONS)
+
+
+@contextlib.contextmanager
+def section_lock(cache_dir, section):
+    """Hold the lock of a section, shared by all the processes using the cache
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+    """
+    section_dir = os.path.join(cache_dir, section)
+    os.makedirs(section_dir, exist_ok=True)
+    with open(os.path.join(section_dir, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_usage(cache_dir, section):
+    """Read the size of a section recorded in its usage file
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+
+    Returns:
+        int: size of the section in bytes, None if unknown
+    """
+    try:
+        with open(os.path.join(cache_dir, section, USAGE_FILE), 'r') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_usage(cache_dir, section, usage):
+    """Record the size of a section in its usage file, under the lock of the section
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+        usage (int): size of the section in bytes
+    """
+    section_dir = os.path.join(cache_dir, section)
+    os.makedirs(section_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=section_dir, prefix='.miscoto_')
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(usage))
+    os.replace(tmp_path, os.path.join(section_dir, USAGE_FILE))
+
+
+def list_entries(cache_dir, sections=None):
+    """List the entries of the cache. Only the files named as entries in the
+    sections are listed
+
+    Args:
+        cache_dir (str): cache directory
+        sections (list, optional): Defaults to None. sections to list, all if None
+
+    Returns:
+        list: (path, size, last use) of each entry, least recently used first
+    """
+    entries = []
+    for section in sections or SECTIONS:
+        suffix = SECTIONS[section]
+        section_dir = os.path.join(cache_dir, section)
+        if not os.path.isdir(section_dir):
+            continue
+        for prefix in os.listdir(section_dir):
+            prefix_dir = os.path.join(section_dir, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for filename in os.listdir(prefix_dir):
+                key = filename[:-len(suffix)]
+                if not filename.endswith(suffix) or not ENTRY_KEY.match(key) or not key.startswith(prefix):
+                    continue
+                path = os.path.join(prefix_dir, filename)
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+    return sorted(entries, key=lambda entry: entry[2])
+
+
+def prune(cache_dir, max_size, sections=None):
+    """Evict the least recently used entries until the cache fits in max_size.
+    A directory with no cache section is not pruned.
+
+    Args:
+        cache_dir (str): cache directory
+        max_size (int): maximal size of the sections in bytes
+        sections (list, optional): Defaults to None. sections to prune together, all if None
+
+    Returns:
+        (int, int): number and total size of the evicted entries
+    """
+    if not is_cache_dir(cache_dir):
+        logger.warning(cache_dir + ' holds no cache section, it is not pruned')
+        return 0, 0
+    sections = [section for section in SECTIONS if section in (sections or SECTIONS) and os.path.isdir(os.path.join(cache_dir, section))]
+    with contextlib.ExitStack() as locks:
+        # sections are always locked in the same order
+        for section in sections:
+            locks.enter_context(section_lock(cache_dir, section))
+        return evict(cache_dir, max_size, sections)
+
+
+def evict(cache_dir, max_size, sections):
+    """Evict the least recently used entries of sections until they fit in max_size
+    and record their new size. The sections must be locked
+
+    Args:
+        cache_dir (str): cache directory
+        max_size (int): maximal size of the sections in bytes
+        sections (list): existing sections to prune together
+
+    Returns:
+        (int, int): number and total size of the evicted entries
+    """
+    entries = list_entries(cache_dir, sections)
+    total_size = sum(size for _, size, _ in entries)
+    nb_evicted = 0
+    evicted_size = 0
+    for path, size, _ in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        nb_evicted += 1
+        evicted_size += size
+    for section in sections:
+        write_usage(cache_dir, section, sum(size for _, size, _ in list_entries(cache_dir, [section])))
+    return nb_evicted, evicted_size
+
+
+def prune_section(cache_dir, section, max_size):
+    """Evict the least recently used entries of a section if its recorded size exceeds max_size.
+    The section is only walked when its size is unknown or over the budget. Writers update
+    the recorded size under the lock of the section, so that it is the size of the entries.
+
+    Args:
+        cache_dir (str): cache directory
+        section (str): subdirectory of the cache
+        max_size (int): maximal size of the section in bytes
+
+    Returns:
+        (int, int): number and total size of the evicted entries
+    """
+    usage = read_usage(cache_dir, section)
+    if usage is not None and usage <= max_size:
+        return 0, 0
+    return prune(cache_dir, max_size, [section])
+
+
+def get_symbiont_facts(cache_dir, key):
+    """Get the facts of a symbiont network from the cache
+
+    Args:
+        cache_dir (str): cache directory
+        key (str): key of the facts, see symbiont_key
+
+    Returns:
+        str: facts, None if not in cache
+    """
+    return get_entry(cache_dir, FACTS_DIR, key)
+
+
+def put_symbiont_facts(cache_dir, key, facts):
+    """Store the facts of a symbiont network in the cache
+
+    Args:
+        cache_dir (str): cache directory
+        key (str): key of the facts, see symbiont_key
+        facts (str): facts of the symbiont
+    """
+    put_entry(cache_dir, FACTS_DIR, key, facts)
+
+
+def grounding_key(files, options, solver_version):
+    """Get the cache key of the grounding of ASP files
+
+    Args:
+        files (list): instance and encoding files, in the order given to the grounder
+        options (str): grounder options
+        solver_version (str): version of the grounder
+
+    Returns:
+        str: key of the grounding
+    """
+    digest = hashlib.sha256(('grounding\n' + solver_version + '\n' + options + '\n').encode())
+    for filepath in files:
+        digest.update(b'\0')
+        file_digest(filepath, digest)
+    return digest.hexdigest()
+
+
+def get_grounding(cache_dir, key):
+    """Get a grounded program from the cache
+
+    Args:
+        cache_dir (str): cache directory
+        key (str): key of the grounding, see grounding_key
+
+    Returns:
+        str: grounded program, None if not in cache
+    """
+    return get_entry(cache_dir, GROUNDINGS_DIR, key, '.aspif')
+
+
+def put_grounding(cache_dir, key, grounding):
+    """Store a grounded program in the cache
+
+    Args:
+        cache_dir (str): cache directory
+        key (str): key of the grounding, see grounding_key
+        grounding (str): grounded program
+    """
+    put_entry(cache_dir, GROUNDINGS_DIR, key, grounding, '.aspif')
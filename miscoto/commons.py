@@ -30,8 +30,33 @@ ASP_FILE_EXTENSION = '.lp'
 # Directories (starting from here)
 DIR_SOURCES     = ''  # sources are inside the package
 DIR_ASP_SOURCES = 'encodings'
+DIR_PORTFOLIOS  = 'portfolios'
 DIR_DATA     = os.path.join(*[ROOT , '..', 'data'])  # sources are inside the package
 
+# Buffer of the files in which instances are written
+WRITE_BUFFER_SIZE = 1024 ** 2  # bytes
+
+# Cache of facts
+CACHE_DIR = os.environ.get('MISCOTO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'miscoto'))
+# budgets of the facts and groundings sections of the cache, pruned separately
+CACHE_MAX_SIZE = 2 * 1024 ** 3  # bytes
+CACHE_GROUNDINGS_MAX_SIZE = 8 * 1024 ** 3  # bytes
+
+# Sharded instances: a directory with one fragment per organism and a manifest
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_FORMAT = 'miscoto-sharded-instance'
+MANIFEST_VERSION = 1
+SHARD_ORGANISMS_DIR = 'organisms'
+# Single file instances: networks they were read from, to update them
+SOURCES_EXTENSION = '.sources.json'
+SHARD_SYMBOLS_FILE = 'symbols.json'
+
+# Solver backends: clingo binary in a subprocess, or clingo Python API in-process
+SOLVER_BACKENDS = ('binary', 'module')
+
+# Engines computing the scopes: ASP encoding, or native forward chaining without grounding
+SCOPE_ENGINES = ('asp', 'native')
+
 # ASP SOURCES
 def __asp_file(name):
     "path to given asp source file name"
@@ -44,9 +69,24 @@ ASP_SRC_FOCUS = __asp_file('iscope_in_community')
 ASP_SRC_TOPO_SOUP   = __asp_file('community_soup')
 ASP_SRC_TOPO_RXN_MIN_EXCH = __asp_file('community_minexch')
 ASP_SRC_TOPO_RXN_MIN_EXCH_NOHOST = __asp_file('community_minexch_nohost')
+ASP_SRC_GREEDY_HEURISTIC = __asp_file('greedy_heuristic')
+ASP_SRC_PER_TARGET = __asp_file('per_target')
 # Topological exchanges
 # ASP_SRC_TRANSP   = __asp_file('transported_metabolites')
 
+# Multi-threaded solving: parallel mode of each phase of community selection,
+# and portfolio of solver configurations of the phases solved in compete mode
+PARALLEL_MODES = ('compete', 'split')
+PHASE_PARALLEL_MODES = {
+    'optimization': 'compete',
+    'consequences': 'compete',
+    'enumeration': 'split',
+}
+PORTFOLIOS = {
+    'optimization': os.path.join(ROOT, DIR_PORTFOLIOS, 'optimization.txt'),
+    'consequences': os.path.join(ROOT, DIR_PORTFOLIOS, 'consequences.txt'),
+}
+
 
 def basename(filepath):
     """Return the basename of given filepath.
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018-2024 Clémence Frioux & Arnaud Belcour - Inria Dyliss - Pleiade
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import logging
+import os
+import sys
+from miscoto import cache, commons
+
+logger = logging.getLogger(__name__)
+
+
+def run_cache(cache_dir=None, max_size=None, clear=False):
+    """Inspects and prunes the cache of symbiont facts and groundings
+        cache_dir ([str], optional): Defaults to None. [cache directory, commons.CACHE_DIR if None]
+        max_size ([int], optional): Defaults to None. [evict least recently used entries until the cache fits in max_size bytes]
+        clear ([bool], optional): Defaults to False. [remove all entries]
+
+    Returns:
+        [dic]: [number and size of entries left in the cache, number and size of the evicted ones]
+    """
+    if not cache_dir:
+        cache_dir = commons.CACHE_DIR
+    results = {'cache_dir': cache_dir, 'evicted_entries': 0, 'evicted_size': 0}
+
+    if clear:
+        max_size = 0
+    if max_size is not None:
+        if os.path.isdir(cache_dir) and os.listdir(cache_dir) and not cache.is_cache_dir(cache_dir):
+            logger.critical(cache_dir + ' is not a miscoto cache, it is not pruned')
+            sys.exit(1)
+        nb_evicted, evicted_size = cache.prune(cache_dir, max_size)
+        logger.info('%d entries (%d bytes) evicted from %s' % (nb_evicted, evicted_size, cache_dir))
+        results['evicted_entries'] = nb_evicted
+        results['evicted_size'] = evicted_size
+
+    entries = cache.list_entries(cache_dir)
+    results['entries'] = len(entries)
+    results['size'] = sum(size for _, size, _ in entries)
+    logger.info('Cache ' + cache_dir)
+    logger.info('%d entries, %d bytes' % (results['entries'], results['size']))
+    if entries:
+        logger.info('Least recently used entry: ' + entries[0][0])
+
+    return results
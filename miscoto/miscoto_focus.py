@@ -20,16 +20,48 @@ import sys
 import os
 import time
 import logging
-from miscoto import query, sbml, commons, utils
-from os import listdir
-from os.path import isfile, join
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from miscoto import query, sbml, commons, utils, native, pruning
+from miscoto.miscoto_instance import add_symbionts_to_instance, read_instance
 from xml.etree.ElementTree import ParseError
 from clyngor.as_pyasp import TermSet, Atom, Term
 
 logger = logging.getLogger(__name__)
 
 
-def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str=None, all_networks:bool=False, lp_instance_file:str=None):
+def solve_focus_chunk(instances, chunk, removed, allscope, engine='asp', backend='binary'):
+    """Compute the individual and community scopes of a chunk of the focused organisms.
+    The instance is restricted to the networks of the chunk, the community scope being given as facts.
+
+    Args:
+        instances (list): ASP instance files, without target_species facts
+        chunk (list): focused organisms, as written in the instance
+        removed (set): organisms whose networks are removed from the instance, as written in the instance
+        allscope (set): scope of the community, as written in the instance
+        engine (str, optional): Defaults to 'asp'. scope engine, see run_focus
+        backend (str, optional): Defaults to 'binary'. solver backend of the asp engine
+
+    Returns:
+        dict: model grouped by arity, see query.get_scopes
+    """
+    chunk_instance = pruning.write_filtered_instance(instances, removed)
+    with open(chunk_instance, 'a') as f:
+        for organism in chunk:
+            f.write('target_species(' + organism + ').\n')
+        for metabolite in allscope:
+            f.write('allscope(' + metabolite + ').\n')
+    try:
+        if engine == 'native':
+            model = native.focus_scopes([chunk_instance])
+        else:
+            model = query.get_scopes([chunk_instance], commons.ASP_SRC_FOCUS, backend=backend, options='-c shared_allscope=1')
+    finally:
+        os.unlink(chunk_instance)
+    return model or {}
+
+
+def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str=None, all_networks:bool=False, lp_instance_file:str=None, jobs:int=1, cache_dir:str=None, backend:str='binary', engine:str='asp', chunk_size:int=0):
     """Computes individual and community scopes for chosen symbionts
         seeds_file [str]: seeds file
         bacteria_dir [str]: directory of bacterial metabolic networks
@@ -37,6 +69,11 @@ def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str
         output_json ([str], optional): Defaults to None. [json file for output]
         all_networks (bool, optional): Defaults to False. [all metabolic networks should be considered for focus analysis]
         lp_instance_file ([str], optional): Defaults to None. [name of the lp instance file]
+        jobs ([int], optional): Defaults to 1. [number of processes reading symbiont networks and solving the chunks]
+        cache_dir ([str], optional): Defaults to None. [cache of symbiont facts, not used if None]
+        backend ([str], optional): Defaults to 'binary'. [solver backend: 'binary' runs clingo in a subprocess, 'module' uses the clingo Python API in-process]
+        engine ([str], optional): Defaults to 'asp'. [scope engine: 'asp' solves the focus encoding, 'native' computes the same scopes on bitsets, without grounding]
+        chunk_size ([int], optional): Defaults to 0. [number of focused organisms per program, 0 for a single program. Chunks are solved in jobs processes, the community scope being computed once]
     
     Returns:
         [dic]: [all information related to focus computation]
@@ -44,8 +81,6 @@ def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str
     start_time = time.time()
     results = {}
 
-    delete_lp_instance = False
-
     # delete putative repetitions in the focus_bact list
     focus_bact = list(set(focus_bact))
 
@@ -53,36 +88,67 @@ def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str
     input_instance = False
     seed_instance = False
     bact_focus_instance = False
-
-    if lp_instance_file:
-        focus_bact_termset = TermSet()
-        # find all bacteria names by grep-ing atoms "bacteria" in the instance file
-        all_bacteria_names = []
-        with open(lp_instance_file, "r") as f:
-            for line in f:
-                if line.startswith('bacteria("'):
-                    all_bacteria_names.append(line.split('"')[1])
-
-        if all_networks: 
-            focus_bact = focus_bact2 = all_bacteria_names
-            for ts in focus_bact:
-                focus_bact_termset.add(Term('target_species', ["\"" + ts + "\""]))
-        else:
-            focus_bact2 = []
-            for ts in focus_bact:
-                if not ts in all_bacteria_names:
-                    logger.warning(f"\nWARNING - {ts} is not the basename of a symbiont from the instance {lp_instance_file}. {ts} will be ignored.")
-                else:
-                    focus_bact2.append(ts)
+    # names of the identifiers of an interned instance
+    names = None
+
+    # temporary instance files, removed even if the program exits on an error
+    temp_files = []
+    try:
+        if lp_instance_file:
+            focus_bact_termset = TermSet()
+            instance = read_instance(lp_instance_file)
+            instance_files = instance['files']
+            symbols = instance['symbols']
+            if symbols:
+                logger.info("Interned instance, identifiers will be translated with " + instance['symbols_file'])
+            all_bacteria_names = instance['bacteria']
+
+            if all_networks: 
+                focus_bact = focus_bact2 = all_bacteria_names
+                for ts in focus_bact:
                     focus_bact_termset.add(Term('target_species', ["\"" + ts + "\""]))
-            if len(focus_bact2) == 0:
-                logger.critical(f"\nERROR - No element from {focus_bact} could be found in {lp_instance_file}. Please check the input file.")
-                sys.exit(1)
-        # add the name of microbe of interest in the instance file
-        instance_bact = utils.to_file(focus_bact_termset)
-        bact_focus_instance = True
-        
-        if seeds_file:
+            else:
+                focus_bact2 = []
+                for ts in focus_bact:
+                    if not ts in all_bacteria_names:
+                        logger.warning(f"\nWARNING - {ts} is not the basename of a symbiont from the instance {lp_instance_file}. {ts} will be ignored.")
+                    else:
+                        focus_bact2.append(ts)
+                        focus_bact_termset.add(Term('target_species', ["\"" + ts + "\""]))
+                if len(focus_bact2) == 0:
+                    logger.critical(f"\nERROR - No element from {focus_bact} could be found in {lp_instance_file}. Please check the input file.")
+                    sys.exit(1)
+            # add the name of microbe of interest in the instance file
+            instance_bact = utils.to_file(focus_bact_termset)
+            temp_files.append(instance_bact)
+            if symbols:
+                utils.intern_file(instance_bact, symbols)
+            bact_focus_instance = True
+
+            if seeds_file:
+                logger.info('Reading seeds from ' + seeds_file)
+                try:
+                    seedsfacts = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
+                except FileNotFoundError:
+                    logger.critical('Seeds file not found')
+                    sys.exit(1)
+                except ParseError:
+                    logger.critical("Invalid syntax in SBML file: " + seeds_file)
+                    sys.exit(1)
+                lp_instance_seeds = utils.to_file(seedsfacts)
+                temp_files.append(lp_instance_seeds)
+                if symbols:
+                    utils.intern_file(lp_instance_seeds, symbols)
+                seed_instance = True
+
+            if symbols:
+                # focused organisms and seeds may add names to the symbol table
+                names = list(symbols)
+
+        elif bacteria_dir and seeds_file:
+            # case 2: instance is not provided, create one with seeds and bacterial networks
+            # will be deleted at the end of the programme
+            # read seeds
             logger.info('Reading seeds from ' + seeds_file)
             try:
                 seedsfacts = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
@@ -92,129 +158,121 @@ def run_focus(seeds_file:str, bacteria_dir:str, focus_bact:list, output_json:str
             except ParseError:
                 logger.critical("Invalid syntax in SBML file: " + seeds_file)
                 sys.exit(1)
-            lp_instance_seeds = utils.to_file(seedsfacts)
-            seed_instance = True
-
-
-    elif bacteria_dir and seeds_file:
-        # case 2: instance is not provided, create one with seeds and bacterial networks
-        # will be deleted at the end of the programme
-        delete_lp_instance = True
-        # read seeds
-        logger.info('Reading seeds from ' + seeds_file)
-        try:
-            seedsfacts = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
-        except FileNotFoundError:
-            logger.critical('Seeds file not found')
-            sys.exit(1)
-        except ParseError:
-            logger.critical("Invalid syntax in SBML file: " + seeds_file)
-            sys.exit(1)
-            
-        lp_instance_file = utils.to_file(seedsfacts)
-
-        # read bacterial metabolic networks from SBML files
-        if not os.path.isdir(bacteria_dir):
-            logger.info("Symbiont directory not found")
-            sys.exit(1)
 
-        logger.info('Reading bacterial networks from ' + bacteria_dir + '...')
-        onlyfiles = [f for f in listdir(bacteria_dir) if isfile(join(bacteria_dir, f))]
+            lp_instance_file = utils.to_file(seedsfacts)
+            temp_files.append(lp_instance_file)
 
-        if len(onlyfiles) == 0:
-            logger.critical('No bacterial networks in ' + bacteria_dir)
-            sys.exit(1)
+            # read bacterial metabolic networks from SBML files
+            # and keep the names of all bacteria that are in the symbiont directory
+            all_bacteria_names = add_symbionts_to_instance(bacteria_dir, lp_instance_file, jobs, cache_dir)
+            instance_files = [lp_instance_file]
 
-        # keep the names of all bacteria that are in the symbiont directory
-        all_bacteria_names = []
+            if all_networks:
+                focus_bact = all_bacteria_names
 
-        for bacteria_file in onlyfiles:
-            name = os.path.splitext(bacteria_file)[0]
-            all_bacteria_names.append(name)
-            bacteria_path = os.path.join(bacteria_dir, bacteria_file)
-            try:
-                one_bact_model = sbml.readSBMLnetwork_symbionts_clyngor(bacteria_path, name)
-                one_bact_model.add(Atom('bacteria', ["\"" + name + "\""]))
-                utils.to_file(one_bact_model, lp_instance_file)
-                logger.info('Done for ' + name)
-            except:
-                logger.info('Could not read file ' + name + ', will ignore it')
-
-        if all_networks:
-            focus_bact = all_bacteria_names
-
-        focus_bact2 = []
-        for ts in focus_bact:
-            if not ts in all_bacteria_names:
-                logger.warning(f"\nWARNING - {ts} is not the basename of a symbiont from {bacteria_dir}. If the file of your network of interest is named `ecoli.xml`, its basename would be `ecoli`. {ts} will be ignored.")
-            else:
-                focus_bact2.append(ts)
-        if len(focus_bact2) == 0:
-            logger.critical(f"\nERROR - No element from {focus_bact} could be found in {bacteria_dir}. Please check the input having in mind that if the file of your network of interest is named `ecoli.xml`, its basename would be `ecoli`.")
-            sys.exit(1)
+            focus_bact2 = []
+            for ts in focus_bact:
+                if not ts in all_bacteria_names:
+                    logger.warning(f"\nWARNING - {ts} is not the basename of a symbiont from {bacteria_dir}. If the file of your network of interest is named `ecoli.xml`, its basename would be `ecoli`. {ts} will be ignored.")
+                else:
+                    focus_bact2.append(ts)
+            if len(focus_bact2) == 0:
+                logger.critical(f"\nERROR - No element from {focus_bact} could be found in {bacteria_dir}. Please check the input having in mind that if the file of your network of interest is named `ecoli.xml`, its basename would be `ecoli`.")
+                sys.exit(1)
 
-        # add the name of microbe of interest in the instance file
-        with open(lp_instance_file, "a") as f:
+            # add the name of microbe of interest in the instance
+            focus_bact_termset = TermSet()
             for ts in focus_bact2:
-                f.write(f'target_species("{ts}").\n')
-
-    # logger.info(os.path.abspath(lp_instance_file))
-
-
-    logger.info(f"\nComputing producible metabolites for {focus_bact2}...")
-    instances = [lp_instance_file]
-    if seed_instance:
-        instances.append(lp_instance_seeds)
-    if bact_focus_instance:
-        instances.append(instance_bact)
-    model = query.get_scopes(instances, commons.ASP_SRC_FOCUS)
-
-    indiv_produced = {}
-    produced_in_com = {}
-    newly_prod = {}
-    for pred in model:
-        if pred == 'iproduced':
-            for a in model[pred, 2]:
-                if not a[1] in indiv_produced:
-                    indiv_produced[a[1]] = [a[0]]
-                else:
-                    indiv_produced[a[1]].append(a[0])
-        elif pred == 'cproduced':
-            for a in model[pred, 2]:
-                if not a[1] in produced_in_com:
-                    produced_in_com[a[1]] = [a[0]]
-                else:
-                    produced_in_com[a[1]].append(a[0])
-
-    for ts in focus_bact2:
-        logger.info(f"\n############ {ts}")
-        results[ts] = {}
-        
-        if ts in indiv_produced:
-            logger.info(f"* {len(indiv_produced[ts])} metabolites producible by {ts} when alone:")
-            logger.info("\n".join(indiv_produced[ts]))
-        else:
-            logger.info(f"\n* No metabolite producible by {ts} when alone:")
-            indiv_produced[ts] = []
+                focus_bact_termset.add(Term('target_species', ["\"" + ts + "\""]))
+            instance_bact = utils.to_file(focus_bact_termset)
+            temp_files.append(instance_bact)
+            bact_focus_instance = True
 
-        if ts in produced_in_com:
-            newly_prod[ts] = list(set(produced_in_com[ts]) - set(indiv_produced[ts]))
-            logger.info(f"\n* {len(produced_in_com[ts])} metabolites producible by {ts} in the community: the {len(indiv_produced[ts])} metabolites above + the following {len(newly_prod[ts])} metabolites:")
-            logger.info("\n".join(newly_prod[ts]))
-        else:
-            logger.info(f"\n* No metabolite producible by {ts} in the community")
-            produced_in_com[ts] = []
-            newly_prod[ts] = []
+        # logger.info(os.path.abspath(lp_instance_file))
 
-        results[ts]["produced_alone"] = indiv_produced[ts]
-        results[ts]["produced_in_community"] = produced_in_com[ts]
-        results[ts]["community_metabolic_gain"] = newly_prod[ts]
 
-    if delete_lp_instance == True:
-        os.unlink(lp_instance_file)
+        logger.info(f"\nComputing producible metabolites for {focus_bact2}...")
+        instances = list(instance_files)
+        if seed_instance:
+            instances.append(lp_instance_seeds)
+        if engine not in commons.SCOPE_ENGINES:
+            logger.critical('Invalid scope engine ' + str(engine) + ', choose among ' + ', '.join(commons.SCOPE_ENGINES))
+            sys.exit(1)
+        if chunk_size and len(focus_bact2) > chunk_size:
+            # organisms as written in the instance, quoted or interned
+            focus_terms = [str(symbols[ts]) if names else '"' + ts + '"' for ts in focus_bact2]
+            facts = pruning.read_facts(instances)
+            all_bacteria = {bacterium for bacterium, in facts['bacteria']}
+            allscope = native.bacteria_allscope(facts)
+            del facts
+            chunks = [focus_terms[i:i + chunk_size] for i in range(0, len(focus_terms), chunk_size)]
+            removed = [all_bacteria - set(chunk) for chunk in chunks]
+            logger.info(f"{len(chunks)} chunks of at most {chunk_size} organisms solved in {jobs} processes")
+            if jobs > 1:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    chunk_models = list(executor.map(solve_focus_chunk, repeat(instances), chunks, removed, repeat(allscope), repeat(engine), repeat(backend)))
+            else:
+                chunk_models = list(map(solve_focus_chunk, repeat(instances), chunks, removed, repeat(allscope), repeat(engine), repeat(backend)))
+            model = {}
+            for chunk_model in chunk_models:
+                for pred, atoms in chunk_model.items():
+                    model[pred] = model.get(pred, frozenset()) | atoms
+        else:
+            if bact_focus_instance:
+                instances.append(instance_bact)
+            if engine == 'native':
+                model = native.focus_scopes(instances)
+            else:
+                model = query.get_scopes(instances, commons.ASP_SRC_FOCUS, backend=backend)
+        if names:
+            model = utils.unintern_model(model, names)
+
+        indiv_produced = {}
+        produced_in_com = {}
+        newly_prod = {}
+        for pred in model:
+            if pred == 'iproduced':
+                for a in model[pred, 2]:
+                    if not a[1] in indiv_produced:
+                        indiv_produced[a[1]] = [a[0]]
+                    else:
+                        indiv_produced[a[1]].append(a[0])
+            elif pred == 'cproduced':
+                for a in model[pred, 2]:
+                    if not a[1] in produced_in_com:
+                        produced_in_com[a[1]] = [a[0]]
+                    else:
+                        produced_in_com[a[1]].append(a[0])
+
+        for ts in focus_bact2:
+            logger.info(f"\n############ {ts}")
+            results[ts] = {}
+
+            if ts in indiv_produced:
+                logger.info(f"* {len(indiv_produced[ts])} metabolites producible by {ts} when alone:")
+                logger.info("\n".join(indiv_produced[ts]))
+            else:
+                logger.info(f"\n* No metabolite producible by {ts} when alone:")
+                indiv_produced[ts] = []
 
-    if output_json:
-        utils.to_json(results, output_json)
+            if ts in produced_in_com:
+                newly_prod[ts] = list(set(produced_in_com[ts]) - set(indiv_produced[ts]))
+                logger.info(f"\n* {len(produced_in_com[ts])} metabolites producible by {ts} in the community: the {len(indiv_produced[ts])} metabolites above + the following {len(newly_prod[ts])} metabolites:")
+                logger.info("\n".join(newly_prod[ts]))
+            else:
+                logger.info(f"\n* No metabolite producible by {ts} in the community")
+                produced_in_com[ts] = []
+                newly_prod[ts] = []
+
+            results[ts]["produced_alone"] = indiv_produced[ts]
+            results[ts]["produced_in_community"] = produced_in_com[ts]
+            results[ts]["community_metabolic_gain"] = newly_prod[ts]
+
+        if output_json:
+            utils.to_json(results, output_json)
+    finally:
+        for temp_file in temp_files:
+            os.unlink(temp_file)
 
     logger.info("--- %s seconds ---" % (time.time() - start_time))
     utils.clean_up()
@@ -16,48 +16,597 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
 import argparse
+import io
+import json
 import sys
 import os
 import time
 import logging
-from miscoto import utils, sbml
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from miscoto import cache, commons, utils, sbml
 from os import listdir
 from os.path import isfile, join
 from xml.etree.ElementTree import ParseError
-from clyngor.as_pyasp import TermSet, Atom
+from clyngor.as_pyasp import TermSet
 
 logger = logging.getLogger(__name__)
 
+# predicates of the facts of metabolic networks, whose last argument is the organism
+NETWORK_PREDICATES = ('reaction(', 'reversible(', 'reactant(', 'product(', 'species(', 'bacteria(')
 
-def run_instance(bacteria_dir=None, seeds_file=None, host_file=None, targets_file=None, output=None):
+
+def read_symbiont_facts(bacteria_path, name, cache_dir=None):
+    """Read the metabolic network of a symbiont as ASP facts.
+    Facts are in the order of the SBML file, whatever the process reading it.
+
+    Args:
+        bacteria_path (str): SBML file of the symbiont
+        name (str): name of the symbiont
+        cache_dir (str, optional): Defaults to None. cache of facts, not used if None
+
+    Returns:
+        str: facts of the symbiont, None if the file could not be read
+    """
+    try:
+        if cache_dir:
+            key = cache.symbiont_key(bacteria_path, name)
+            facts = cache.get_symbiont_facts(cache_dir, key)
+            if facts is not None:
+                return facts
+        one_bact_model = io.StringIO()
+        sbml.writeSBMLnetwork_symbionts(bacteria_path, name, one_bact_model)
+        one_bact_model.write('bacteria("' + name + '").\n')
+    except:
+        return None
+    facts = one_bact_model.getvalue()
+    if cache_dir:
+        try:
+            cache.put_symbiont_facts(cache_dir, key, facts)
+        except OSError:
+            pass
+    return facts
+
+
+def list_symbionts(bacteria_dir):
+    """List the metabolic networks of a symbiont directory, sorted by file name
+
+    Args:
+        bacteria_dir (str): directory of bacterial metabolic networks
+
+    Returns:
+        (list, list): names of the symbionts and paths of their networks
+    """
+    if not os.path.isdir(bacteria_dir):
+        logger.critical("Symbiont directory not found")
+        sys.exit(1)
+
+    logger.info('Reading bacterial networks from ' + bacteria_dir + '...')
+    onlyfiles = sorted(f for f in listdir(bacteria_dir) if isfile(join(bacteria_dir, f)))
+
+    if len(onlyfiles) == 0:
+        logger.critical('No bacterial networks in ' + bacteria_dir)
+        sys.exit(1)
+
+    names = [os.path.splitext(bacteria_file)[0] for bacteria_file in onlyfiles]
+    bacteria_paths = [os.path.join(bacteria_dir, bacteria_file) for bacteria_file in onlyfiles]
+    return names, bacteria_paths
+
+
+def read_symbionts(names, bacteria_paths, jobs=1, cache_dir=None):
+    """Read the metabolic networks of symbionts as ASP facts.
+    Networks are read in parallel by a pool of processes when jobs > 1, and
+    yielded in the order of the given names whatever the number of jobs.
+    With a cache, networks whose file did not change are not read again.
+
+    Args:
+        names (list): names of the symbionts
+        bacteria_paths (list): SBML file of each symbiont
+        jobs (int, optional): Defaults to 1. number of processes reading networks
+        cache_dir (str, optional): Defaults to None. cache of facts, not used if None
+
+    Yields:
+        (str, str): name and facts of each symbiont that could be read
+    """
+    if jobs > 1:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        all_facts = pool.map(read_symbiont_facts, bacteria_paths, names, repeat(cache_dir))
+    else:
+        pool = None
+        all_facts = map(read_symbiont_facts, bacteria_paths, names, repeat(cache_dir))
+    for name, facts in zip(names, all_facts):
+        if facts is None:
+            logger.info('Could not read file ' + name + ', will ignore it')
+        else:
+            yield name, facts
+            logger.info('Done for ' + name)
+    if pool:
+        pool.shutdown()
+
+    if cache_dir:
+        nb_evicted, evicted_size = cache.prune_section(cache_dir, cache.FACTS_DIR, commons.CACHE_MAX_SIZE)
+        if nb_evicted:
+            logger.info('%d entries (%d bytes) evicted from cache %s' % (nb_evicted, evicted_size, cache_dir))
+
+
+def add_symbionts_to_instance(bacteria_dir, instance_file, jobs=1, cache_dir=None):
+    """Append the metabolic networks of all symbionts of a directory to an instance.
+
+    Args:
+        bacteria_dir (str): directory of bacterial metabolic networks
+        instance_file (str): ASP instance file
+        jobs (int, optional): Defaults to 1. number of processes reading networks
+        cache_dir (str, optional): Defaults to None. cache of facts, not used if None
+
+    Returns:
+        list: names of the symbionts added to the instance
+    """
+    names, bacteria_paths = list_symbionts(bacteria_dir)
+
+    added_names = []
+    with open(instance_file, 'a', buffering=commons.WRITE_BUFFER_SIZE) as f:
+        for name, facts in read_symbionts(names, bacteria_paths, jobs, cache_dir):
+            f.write(facts)
+            added_names.append(name)
+
+    return added_names
+
+
+def fragment_entry(instance_dir, fragment):
+    """Describe a fragment of a sharded instance for its manifest
+
+    Args:
+        instance_dir (str): directory of the sharded instance
+        fragment (str): path of the fragment, relative to instance_dir
+
+    Returns:
+        dict: path, number of facts and sha256 of the fragment
+    """
+    fragment_path = os.path.join(instance_dir, fragment)
+    with open(fragment_path, 'rb') as f:
+        nb_facts = sum(1 for _ in f)
+    return {'file': fragment, 'facts': nb_facts, 'sha256': cache.file_digest(fragment_path).hexdigest()}
+
+
+def read_manifest(manifest_file):
+    """Read the manifest of a sharded instance
+
+    Args:
+        manifest_file (str): manifest of the sharded instance
+
+    Returns:
+        dict: manifest
+    """
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != commons.MANIFEST_FORMAT or manifest.get('version') != commons.MANIFEST_VERSION:
+        logger.critical('Unsupported instance manifest: ' + manifest_file)
+        sys.exit(1)
+    return manifest
+
+
+def source_entry(source_path, digest=True):
+    """Describe the SBML file a fragment was read from, to detect its changes
+
+    Args:
+        source_path (str): SBML file
+        digest (bool, optional): Defaults to True. also hash the content of the file
+
+    Returns:
+        dict: size, modification time and, with digest, sha256 of the file
+    """
+    stat = os.stat(source_path)
+    entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if digest:
+        entry['sha256'] = cache.file_digest(source_path).hexdigest()
+    return entry
+
+
+def source_changed(source_path, source):
+    """Check whether a SBML file changed since a fragment was read from it.
+    The file is hashed only if its size or modification time changed, and
+    considered changed if its hash was not recorded.
+
+    Args:
+        source_path (str): SBML file
+        source (dict): description of the file when the fragment was read, see source_entry
+
+    Returns:
+        bool: True if the file changed or is not described
+    """
+    if not source:
+        return True
+    stat = os.stat(source_path)
+    if stat.st_size == source['size'] and stat.st_mtime == source['mtime']:
+        return False
+    if 'sha256' not in source:
+        return True
+    return cache.file_digest(source_path).hexdigest() != source['sha256']
+
+
+def sources_file(instance_file):
+    """Get the path of the description of the networks a single file instance was read from
+
+    Args:
+        instance_file (str): ASP instance file
+
+    Returns:
+        str: path of the description
+    """
+    return instance_file + commons.SOURCES_EXTENSION
+
+
+def read_sources(instance_file):
+    """Read the description of the networks a single file instance was read from
+
+    Args:
+        instance_file (str): ASP instance file
+
+    Returns:
+        dict: 'host' description of the host network, None if there is none, and 'organisms'
+            description of each symbiont network, see source_entry. None if the instance has no description
+    """
+    if not os.path.isfile(sources_file(instance_file)):
+        return None
+    with open(sources_file(instance_file), 'r') as f:
+        return json.load(f)
+
+
+def describe_sources(host_file, bacteria_names, bacteria_paths, digest=False):
+    """Describe the networks of an instance, before they are read
+
+    Args:
+        host_file (str): host metabolic network, None if there is none
+        bacteria_names (list): names of the symbionts
+        bacteria_paths (list): paths of their networks
+        digest (bool, optional): Defaults to False. also hash the content of the networks, see source_entry
+
+    Returns:
+        dict: see read_sources
+    """
+    return {'host': source_entry(host_file, digest) if host_file and os.path.isfile(host_file) else None,
+            'organisms': {name: source_entry(bacteria_path, digest) for name, bacteria_path in zip(bacteria_names, bacteria_paths)}}
+
+
+def write_sources(instance_file, sources):
+    """Write the description of the networks a single file instance was read from,
+    to detect their changes when it is updated
+
+    Args:
+        instance_file (str): ASP instance file
+        sources (dict): description of the networks, see describe_sources
+    """
+    with open(sources_file(instance_file), 'w') as f:
+        json.dump(sources, f, indent=1)
+
+
+def write_sharded_instance(instance_dir, seeds, targets, host_file, bacteria_dir, jobs=1, cache_dir=None, interned=False, update=False):
+    """Write an instance as a directory of fragments: seeds, targets, host,
+    one fragment per symbiont, and a manifest listing them with their number
+    of facts and hash. When updating an existing instance, only the fragments
+    of added and modified networks are written, those of removed networks are deleted.
+
+    Args:
+        instance_dir (str): directory of the sharded instance
+        seeds (TermSet): seeds
+        targets (TermSet): targets, None if not given
+        host_file (str): host metabolic network, None if not given
+        bacteria_dir (str): directory of bacterial metabolic networks
+        jobs (int, optional): Defaults to 1. number of processes reading networks
+        cache_dir (str, optional): Defaults to None. cache of facts, not used if None
+        interned (bool, optional): Defaults to False. replace names by integer identifiers
+        update (bool, optional): Defaults to False. keep the fragments of unchanged networks
+
+    Returns:
+        dict: manifest of the instance
+    """
+    if os.path.exists(instance_dir) and not os.path.isdir(instance_dir):
+        logger.critical('Sharded instance output must be a directory: ' + instance_dir)
+        sys.exit(1)
+    os.makedirs(os.path.join(instance_dir, commons.SHARD_ORGANISMS_DIR), exist_ok=True)
+    manifest_file = os.path.join(instance_dir, commons.MANIFEST_FILE)
+    symbols_path = os.path.join(instance_dir, commons.SHARD_SYMBOLS_FILE)
+
+    previous = None
+    if update:
+        if not os.path.isfile(manifest_file):
+            logger.warning('No sharded instance to update in ' + instance_dir + ', a new one is created')
+        else:
+            previous = read_manifest(manifest_file)
+            if bool(previous['symbols']) != interned:
+                logger.warning('Interning of the instance changed, all its fragments are written again')
+                previous = None
+    symbols = utils.read_symbol_table(symbols_path) if previous and interned else {}
+
+    # fragments written by this run, other ones are kept from the previous instance
+    written = {}
+    with open(os.path.join(instance_dir, 'seeds.lp'), 'w') as f:
+        for t in seeds:
+            f.write(str(t) + '.\n')
+    written['seeds'] = 'seeds.lp'
+
+    if targets is not None:
+        with open(os.path.join(instance_dir, 'targets.lp'), 'w') as f:
+            for t in targets:
+                f.write(str(t) + '.\n')
+        written['targets'] = 'targets.lp'
+    elif os.path.isfile(os.path.join(instance_dir, 'targets.lp')):
+        os.remove(os.path.join(instance_dir, 'targets.lp'))
+
+    host_entry = None
+    if host_file:
+        if previous and previous['host'] and not source_changed(host_file, previous['host'].get('source')):
+            logger.info('Host network unchanged')
+            host_entry = dict(previous['host'])
+            host_entry['source'] = dict(host_entry['source'], mtime=os.path.getmtime(host_file))
+        else:
+            logger.info('Reading host network from ' + host_file)
+            with open(os.path.join(instance_dir, 'host.lp'), 'w', buffering=commons.WRITE_BUFFER_SIZE) as f:
+                try:
+                    sbml.writeSBMLnetwork_symbionts(host_file, 'host_metab_mod', f)
+                except FileNotFoundError:
+                    logger.critical('Host file not found')
+                    sys.exit(1)
+                except ParseError:
+                    logger.critical("Invalid syntax in SBML file: "+host_file)
+                    sys.exit(1)
+                f.write('draft("host_metab_mod").\n')
+            written['host'] = 'host.lp'
+    else:
+        logger.warning('No host provided')
+        if os.path.isfile(os.path.join(instance_dir, 'host.lp')):
+            os.remove(os.path.join(instance_dir, 'host.lp'))
+
+    names, bacteria_paths = list_symbionts(bacteria_dir)
+    sources = dict(zip(names, bacteria_paths))
+    previous_organisms = previous['organisms'] if previous else {}
+    organisms = {}
+    changed_names = []
+    for name, bacteria_path in zip(names, bacteria_paths):
+        if name in previous_organisms and not source_changed(bacteria_path, previous_organisms[name].get('source')):
+            # same content, the modification time is recorded to avoid hashing the file again
+            organisms[name] = dict(previous_organisms[name])
+            organisms[name]['source'] = dict(organisms[name]['source'], mtime=os.path.getmtime(bacteria_path))
+        else:
+            changed_names.append(name)
+    for name, facts in read_symbionts(changed_names, [sources[name] for name in changed_names], jobs, cache_dir):
+        written[name] = os.path.join(commons.SHARD_ORGANISMS_DIR, name + commons.ASP_FILE_EXTENSION)
+        with open(os.path.join(instance_dir, written[name]), 'w') as f:
+            f.write(facts)
+    # fragments of symbionts that are not in the directory anymore, or could not be read
+    kept_fragments = set(written.values()).union(entry['file'] for entry in organisms.values())
+    for fragment in listdir(os.path.join(instance_dir, commons.SHARD_ORGANISMS_DIR)):
+        if os.path.join(commons.SHARD_ORGANISMS_DIR, fragment) not in kept_fragments:
+            os.remove(os.path.join(instance_dir, commons.SHARD_ORGANISMS_DIR, fragment))
+
+    if interned:
+        for fragment in written.values():
+            utils.intern_file(os.path.join(instance_dir, fragment), symbols)
+        utils.write_symbol_table(symbols, symbols_path)
+        logger.info(str(len(symbols)) + " names interned in " + symbols_path)
+    elif os.path.isfile(symbols_path):
+        os.remove(symbols_path)
+
+    manifest = {'format': commons.MANIFEST_FORMAT, 'version': commons.MANIFEST_VERSION}
+    for fragment_name in ['seeds', 'targets']:
+        manifest[fragment_name] = fragment_entry(instance_dir, written[fragment_name]) if fragment_name in written else None
+    if 'host' in written:
+        host_entry = fragment_entry(instance_dir, written['host'])
+        host_entry['source'] = source_entry(host_file)
+    manifest['host'] = host_entry
+    for name in changed_names:
+        if name in written:
+            organisms[name] = fragment_entry(instance_dir, written[name])
+            organisms[name]['source'] = source_entry(sources[name])
+    manifest['organisms'] = {name: organisms[name] for name in sorted(organisms)}
+    manifest['symbols'] = commons.SHARD_SYMBOLS_FILE if interned else None
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    if previous:
+        nb_added = sum(1 for name in changed_names if name in organisms and name not in previous_organisms)
+        nb_updated = sum(1 for name in changed_names if name in organisms and name in previous_organisms)
+        nb_removed = sum(1 for name in previous_organisms if name not in organisms)
+        logger.info('%d symbionts added, %d updated, %d removed, %d unchanged'
+                    % (nb_added, nb_updated, nb_removed, len(organisms) - nb_added - nb_updated))
+
+    return manifest
+
+
+def read_instance(instance_path, organisms=None):
+    """Get the files of an instance to give to the solver, with the names of its
+    symbionts and whether it has a host. The instance is either a single ASP file
+    or a sharded instance given by its directory or manifest. Only the fragments
+    of the given organisms are loaded from a sharded instance.
+
+    Args:
+        instance_path (str): ASP instance file, directory or manifest of a sharded instance
+        organisms (list, optional): Defaults to None. symbionts to load, all if None
+
+    Returns:
+        dict: files of the instance, names of the symbionts, presence of a host,
+            symbol table and its path (None if the instance is not interned)
+    """
+    if os.path.isdir(instance_path):
+        manifest_file = os.path.join(instance_path, commons.MANIFEST_FILE)
+    elif instance_path.endswith('.json'):
+        manifest_file = instance_path
+    else:
+        manifest_file = None
+
+    if manifest_file:
+        if not os.path.isfile(manifest_file):
+            logger.critical('Instance manifest not found')
+            sys.exit(1)
+        manifest = read_manifest(manifest_file)
+        instance_dir = os.path.dirname(manifest_file)
+        if organisms is None:
+            bacteria = sorted(manifest['organisms'])
+        else:
+            bacteria = []
+            for name in organisms:
+                if name in manifest['organisms']:
+                    bacteria.append(name)
+                else:
+                    logger.warning(name + ' is not a symbiont of the instance ' + instance_path + ', will ignore it')
+        files = [os.path.join(instance_dir, manifest[fragment_name]['file'])
+                 for fragment_name in ['host', 'seeds', 'targets'] if manifest[fragment_name]]
+        files.extend(os.path.join(instance_dir, manifest['organisms'][name]['file']) for name in bacteria)
+        if manifest['symbols']:
+            symbols_path = os.path.join(instance_dir, manifest['symbols'])
+            symbols = utils.read_symbol_table(symbols_path)
+        else:
+            symbols_path = symbols = None
+        return {'files': files, 'bacteria': bacteria, 'host': manifest['host'] is not None,
+                'symbols': symbols, 'symbols_file': symbols_path}
+
+    if not os.path.isfile(instance_path):
+        logger.critical('Instance file not found')
+        sys.exit(1)
+    if organisms is not None:
+        logger.warning('Single file instance, all its symbionts are loaded')
+    symbols = utils.read_symbols(instance_path)
+    names = list(symbols) if symbols else None
+    # find the bacteria and the host by grep-ing their atoms in the instance file
+    bacteria = []
+    host = False
+    with open(instance_path, 'r') as f:
+        for line in f:
+            if line.startswith('bacteria("'):
+                bacteria.append(line.split('"')[1])
+            elif names and line.startswith('bacteria('):
+                bacteria.append(names[int(line[len('bacteria('):line.index(')')])])
+            elif line.startswith('draft('):
+                host = True
+    return {'files': [instance_path], 'bacteria': bacteria, 'host': host,
+            'symbols': symbols, 'symbols_file': utils.symbols_file(instance_path) if symbols else None}
+
+
+def fact_organism(line, names=None):
+    """Get the organism of a fact of a metabolic network, its last argument
+
+    Args:
+        line (str): ASP fact
+        names (list, optional): Defaults to None. name of each identifier if the fact is interned
+
+    Returns:
+        str: name of the organism, None if the fact is not part of a metabolic network
+    """
+    if not line.startswith(NETWORK_PREDICATES):
+        return None
+    if names:
+        return names[int(line.rstrip()[:-2].rsplit(',', 1)[-1].rsplit('(', 1)[-1])]
+    return utils.QUOTED_STRING.findall(line)[-1]
+
+
+def update_instance_file(instance_file, seeds, targets, host_file, bacteria_dir, jobs=1, cache_dir=None):
+    """Update a single file instance with the symbionts of a directory. Networks
+    whose size or modification time changed since they were read are read again,
+    with the added ones, and the facts of the removed ones are dropped. Facts
+    of the other networks are copied as they are. Seeds and targets are replaced by the given ones.
+
+    Args:
+        instance_file (str): ASP instance file
+        seeds (TermSet): seeds
+        targets (TermSet): targets, None if not given
+        host_file (str): host metabolic network, None if not given
+        bacteria_dir (str): directory of bacterial metabolic networks
+        jobs (int, optional): Defaults to 1. number of processes reading networks
+        cache_dir (str, optional): Defaults to None. cache of facts, not used if None
+    """
+    instance = read_instance(instance_file)
+    symbols = instance['symbols']
+    names = list(symbols) if symbols else None
+    sources = read_sources(instance_file)
+    if sources is None:
+        logger.warning('No description of the networks of ' + instance_file + ', all of them are read again')
+        sources = {'host': None, 'organisms': {}}
+
+    bacteria_names, bacteria_paths = list_symbionts(bacteria_dir)
+    present = set(instance['bacteria'])
+    removed = present - set(bacteria_names)
+    changed = [(name, bacteria_path) for name, bacteria_path in zip(bacteria_names, bacteria_paths)
+               if name not in present or source_changed(bacteria_path, sources['organisms'].get(name))]
+    dropped = removed.union(name for name, _ in changed if name in present)
+    read_host = bool(host_file) and (not instance['host'] or source_changed(host_file, sources['host']))
+    if instance['host'] and (read_host or not host_file):
+        dropped.add('host_metab_mod')
+
+    # networks are described before they are read, by their size and modification time only
+    new_sources = describe_sources(host_file, bacteria_names, bacteria_paths)
+
+    # new facts are written apart to be interned with the symbol table of the instance
+    fd, new_facts_file = tempfile.mkstemp(suffix='.lp', prefix='miscoto_')
+    with os.fdopen(fd, 'w', buffering=commons.WRITE_BUFFER_SIZE) as f:
+        if read_host:
+            logger.info('Reading host network from ' + host_file)
+            try:
+                sbml.writeSBMLnetwork_symbionts(host_file, 'host_metab_mod', f)
+            except FileNotFoundError:
+                logger.critical('Host file not found')
+                sys.exit(1)
+            except ParseError:
+                logger.critical("Invalid syntax in SBML file: "+host_file)
+                sys.exit(1)
+            f.write('draft("host_metab_mod").\n')
+        for t in seeds:
+            f.write(str(t) + '.\n')
+        if targets is not None:
+            for t in targets:
+                f.write(str(t) + '.\n')
+        read_names = []
+        for name, facts in read_symbionts([name for name, _ in changed], [bacteria_path for _, bacteria_path in changed], jobs, cache_dir):
+            f.write(facts)
+            read_names.append(name)
+    if symbols:
+        utils.intern_file(new_facts_file, symbols)
+        utils.write_symbols(symbols, instance_file)
+
+    fd, updated_file = tempfile.mkstemp(suffix='.lp', prefix='miscoto_', dir=os.path.dirname(os.path.abspath(instance_file)))
+    with open(instance_file, 'r') as infile, os.fdopen(fd, 'w', buffering=commons.WRITE_BUFFER_SIZE) as outfile:
+        for line in infile:
+            if line.startswith(('seed(', 'target(')):
+                continue
+            if line.startswith('draft(') and 'host_metab_mod' in dropped:
+                continue
+            if fact_organism(line, names) in dropped:
+                continue
+            outfile.write(line)
+        with open(new_facts_file, 'r') as new_facts:
+            for line in new_facts:
+                outfile.write(line)
+    os.remove(new_facts_file)
+    os.replace(updated_file, instance_file)
+    write_sources(instance_file, new_sources)
+
+    nb_updated = sum(1 for name in read_names if name in present)
+    logger.info('%d symbionts added, %d updated, %d removed, %d unchanged'
+                % (len(read_names) - nb_updated, nb_updated, len(removed), len(present) - len(dropped.difference(['host_metab_mod']))))
+
+
+def run_instance(bacteria_dir=None, seeds_file=None, host_file=None, targets_file=None, output=None, jobs=1, cache_dir=None, interned=False, sharded=False, update=False,
+                 track_sources=False):
     """Creates ASP facts instance to give as input to mincom or scopes
         bacteria_dir ([str], optional): Defaults to None. [directory of bacterial metabolic networks]
         seeds_file ([str], optional): Defaults to None. [seeds file]
         host_file ([str], optional): Defaults to None. [host metabolic network]
         targets_file ([str], optional): Defaults to None. [targets file]
         output ([str], optional): Defaults to None. [output file]
+        jobs ([int], optional): Defaults to 1. [number of processes reading symbiont networks]
+        cache_dir ([str], optional): Defaults to None. [cache of symbiont facts, not used if None]
+        interned ([bool], optional): Defaults to False. [replace names by integer identifiers, stored in a symbol table next to the instance]
+        sharded ([bool], optional): Defaults to False. [write a directory with one fragment per organism and a manifest instead of a single file]
+        update ([bool], optional): Defaults to False. [update the instance output, reading only the added and modified networks]
+        track_sources ([bool], optional): Defaults to False. [record the size and modification time of the networks of a single file instance next to it, for a later update]
 
     Returns:
-        [str]: [output file]
+        [str]: [output file, or directory of the sharded instance]
     """
     start_time = time.time()
     if not bacteria_dir or not seeds_file:
         logger.critical("Symbionts and seeds are required minimal inputs")
         sys.exit(1)
-    if host_file:
-        logger.info('Reading host network from ' + host_file)
-        try:
-            draftnet = sbml.readSBMLnetwork_symbionts_clyngor(host_file, 'host_metab_mod')
-        except FileNotFoundError:
-            logger.critical('Host file not found')
-            sys.exit(1)
-        except ParseError:
-            logger.critical("Invalid syntax in SBML file: "+host_file)
-            sys.exit(1)
-        draftnet.add(Atom('draft', ["\"" + 'host_metab_mod' + "\""]))
-    else:
-        logger.warning('No host provided')
-        draftnet = TermSet()
     logger.info('Reading seeds from ' + seeds_file)
     try:
         seeds = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
@@ -67,7 +616,8 @@ def run_instance(bacteria_dir=None, seeds_file=None, host_file=None, targets_fil
     except ParseError:
         logger.critical("Invalid syntax in SBML file: "+seeds_file)
         sys.exit(1)
-    lp_instance = TermSet(draftnet.union(seeds))
+    lp_instance = seeds
+    targets = None
 
     if targets_file:
         logger.info('Reading targets from ' + targets_file)
@@ -85,32 +635,76 @@ def run_instance(bacteria_dir=None, seeds_file=None, host_file=None, targets_fil
         logger.critical("Symbiont directory not found")
         sys.exit(1)
 
+    if update and not output:
+        logger.critical("The instance to update must be given as output")
+        sys.exit(1)
+    if update and os.path.isdir(output):
+        sharded = True
+
+    if sharded:
+        instance_dir = output if output else tempfile.mkdtemp(prefix='miscoto_')
+        manifest = write_sharded_instance(instance_dir, seeds, targets, host_file, bacteria_dir, jobs, cache_dir, interned, update)
+        logger.info("Sharded instance written with %d symbionts: %s" % (len(manifest['organisms']), os.path.abspath(instance_dir)))
+        logger.info("--- %s seconds ---" % (time.time() - start_time))
+        utils.clean_up()
+        return instance_dir
+
+    if update and os.path.isfile(output):
+        if interned == os.path.isfile(utils.symbols_file(output)):
+            update_instance_file(output, seeds, targets, host_file, bacteria_dir, jobs, cache_dir)
+            logger.info("Instance updated: " + os.path.abspath(output))
+            logger.info("--- %s seconds ---" % (time.time() - start_time))
+            utils.clean_up()
+            return output
+        logger.warning('Interning of the instance changed, it is written again')
+    elif update:
+        logger.warning('No instance to update in ' + output + ', a new one is created')
+
     if output:
-        #clear the file
-        open(output, 'w').close()
-        #add the content of seeds and/or targets
-        all_networks_file = utils.to_file(lp_instance,output)
+        all_networks_file = output
     else:
-        all_networks_file = utils.to_file(lp_instance)
+        fd, all_networks_file = tempfile.mkstemp(suffix='.lp', prefix='miscoto_')
+        os.close(fd)
 
-    logger.info('Reading bacterial networks from ' + bacteria_dir + '...')
-    bactfacts = TermSet()
-    onlyfiles = [f for f in listdir(bacteria_dir) if isfile(join(bacteria_dir, f))]
+    bacteria_names, bacteria_paths = list_symbionts(bacteria_dir)
+    # networks are described before they are read, so that a later change is detected by --update
+    track_sources = bool(output) and (track_sources or update)
+    if track_sources:
+        sources = describe_sources(host_file, bacteria_names, bacteria_paths)
 
-    if len(onlyfiles) == 0:
-        logger.critical('No bacterial networks in ' + bacteria_dir)
-        sys.exit(1)
+    # host facts are written as they are read, followed by seeds and targets
+    with open(all_networks_file, 'w', buffering=commons.WRITE_BUFFER_SIZE) as f:
+        if host_file:
+            logger.info('Reading host network from ' + host_file)
+            try:
+                sbml.writeSBMLnetwork_symbionts(host_file, 'host_metab_mod', f)
+            except FileNotFoundError:
+                logger.critical('Host file not found')
+                sys.exit(1)
+            except ParseError:
+                logger.critical("Invalid syntax in SBML file: "+host_file)
+                sys.exit(1)
+            f.write('draft("host_metab_mod").\n')
+        else:
+            logger.warning('No host provided')
+        for t in lp_instance:
+            f.write(str(t) + '.\n')
+        for _, facts in read_symbionts(bacteria_names, bacteria_paths, jobs, cache_dir):
+            f.write(facts)
+    if track_sources:
+        write_sources(all_networks_file, sources)
+    elif output and os.path.isfile(sources_file(all_networks_file)):
+        # the description of a previous instance does not apply anymore
+        os.remove(sources_file(all_networks_file))
 
-    for bacteria_file in onlyfiles:
-        name = os.path.splitext(bacteria_file)[0]
-        bacteria_path = os.path.join(bacteria_dir, bacteria_file)
-        try:
-            one_bact_model = sbml.readSBMLnetwork_symbionts_clyngor(bacteria_path, name)
-            one_bact_model.add(Atom('bacteria', ["\"" + name + "\""]))
-            utils.to_file(one_bact_model, all_networks_file)
-            logger.info('Done for ' + name)
-        except:
-            logger.info('Could not read file ' + name + ' will ignore it')
+    if interned:
+        symbols = {}
+        utils.intern_file(all_networks_file, symbols)
+        utils.write_symbols(symbols, all_networks_file)
+        logger.info(str(len(symbols)) + " names interned in " + utils.symbols_file(all_networks_file))
+    elif os.path.isfile(utils.symbols_file(all_networks_file)):
+        # the symbol table of a previous interned instance does not apply anymore
+        os.remove(utils.symbols_file(all_networks_file))
 
     logger.info("Instance created: " + os.path.abspath(all_networks_file))
 
@@ -16,13 +16,19 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
 import argparse
+import contextlib
+import csv
+import itertools
+import json
 import sys
 import os
+import pickle
+import tempfile
 import time
 import logging
-from miscoto import query, sbml, commons, utils
-from os import listdir
-from os.path import isfile, join
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from miscoto import query, sbml, commons, utils, pruning
+from miscoto.miscoto_instance import add_symbionts_to_instance, read_instance
 from clyngor.as_pyasp import TermSet, Atom
 from xml.etree.ElementTree import ParseError
 
@@ -41,9 +47,337 @@ Option -o is either 'soup' or 'minexch' depending on the wanted modeling method
 """
 ###############################################################################
 
+# predicates read from the solutions, see community_solution
+COMMUNITY_PREDICATES = ('chosen_bacteria', 'exchanged', 'target_producer_coop_selectedcom')
+
+
+def community_solution(model, names=None):
+    """Read the bacteria, exchanges and target producers of a community solution
+
+    Args:
+        model (dict): solution grouped by arity
+        names (list, optional): Defaults to None. names of the identifiers of an interned instance
+
+    Returns:
+        dict: 'bacteria' list, 'exchanged' dict (from, to) -> metabolites and 'targetsproducers' dict target -> producers
+    """
+    if names:
+        model = utils.unintern_model(model, names)
+    bacteria = []
+    exchanged = {}
+    target_producers = {}
+    for pred in model:
+        if pred == 'chosen_bacteria':
+            for a in model[pred, 1]:
+                bacteria.append(a[0])
+        elif pred == 'exchanged':
+            for a in model[pred, 4]:
+                if (a[2], a[3]) in exchanged:  #exchanged[(from,to)]=[(what,compartto);(what,compartto)]
+                    exchanged[(a[2], a[3])].append(a[0])
+                else:
+                    exchanged[(a[2], a[3])] = []
+                    exchanged[(a[2], a[3])].append(a[0])
+        elif pred == 'target_producer_coop_selectedcom':
+            for a in model[pred, 2]:
+                if not a[1] in target_producers:
+                    target_producers[a[1]] = [a[0]]
+                else:
+                    target_producers[a[1]].append(a[0])
+    return {'bacteria': bacteria, 'exchanged': exchanged, 'targetsproducers': target_producers}
+
+
+def expand_exchanges(exchanged, equivalents):
+    """Replace the representatives of identical symbionts by each of them in exchanges
+
+    Args:
+        exchanged (dict): (from, to) -> metabolites
+        equivalents (dict): representative -> other symbionts with the same network
+
+    Returns:
+        dict: (from, to) -> metabolites, for all the symbionts
+    """
+    expanded = {}
+    for (from_org, to_org), what in exchanged.items():
+        for fromto in itertools.product([from_org] + equivalents.get(from_org, []), [to_org] + equivalents.get(to_org, [])):
+            expanded.setdefault(fromto, []).extend(what)
+    return expanded
+
+
+def expand_solution(solution, equivalents):
+    """Generator of the solutions obtained by replacing each representative of identical
+    symbionts of a solution by each of them
+
+    Args:
+        solution (dict): solution, see community_solution
+        equivalents (dict): representative -> other symbionts with the same network
+
+    Yields:
+        dict: solution, see community_solution
+    """
+    choices = [[bacterium] + equivalents.get(bacterium, []) for bacterium in solution['bacteria']]
+    for chosen in itertools.product(*choices):
+        renaming = dict(zip(solution['bacteria'], chosen))
+        yield {'bacteria': list(chosen),
+               'exchanged': {(renaming.get(from_org, from_org), renaming.get(to_org, to_org)): what
+                             for (from_org, to_org), what in solution['exchanged'].items()},
+               'targetsproducers': {target: [renaming.get(producer, producer) for producer in producers]
+                                    for target, producers in solution['targetsproducers'].items()}}
+
+
+def iter_communities(grounding, optimum=None, names=None, nmodels=0, backend='binary', threads=1, parallel_mode=None, session=None, time_limit=0,
+                     equivalents=None):
+    """Generator of the optimal communities, yielded as soon as the solver proves them optimal.
+    Solutions are not kept, memory does not grow with their number.
+
+    Args:
+        grounding (str): grounded instance and encoding, see query.get_grounded_communities_from_file
+        optimum (str, optional): Defaults to None. optimal score, if already known
+        names (list, optional): Defaults to None. names of the identifiers of an interned instance
+        nmodels (int, optional): Defaults to 0. number of solutions to compute, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see query.check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', split if None
+        session (query.CommunitySession, optional): Defaults to None. solver session to enumerate with, instead of a new solve
+        time_limit (int, optional): Defaults to 0. time limit of the enumeration in seconds, 0 = no limit
+        equivalents (dict, optional): Defaults to None. representative -> other symbionts with the same network, to expand the solutions of a reduced instance
+
+    Yields:
+        dict: solution, see community_solution
+    """
+    if session:
+        all_models = session.get_all_communities(nmodels, time_limit)
+    elif optimum:
+        all_models = query.get_all_communities_from_g(grounding, optimum, nmodels, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    else:
+        all_models = query.get_all_communities_from_g_noopti(grounding, nmodels, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    for model in all_models:
+        if equivalents:
+            yield from expand_solution(community_solution(model, names), equivalents)
+        else:
+            yield community_solution(model, names)
+
+
+def merge_atoms(models):
+    """Merge the atoms of solutions of independent groups of targets
+
+    Args:
+        models (list): solutions grouped by arity
+
+    Returns:
+        dict: solution grouped by arity, with the atoms of all the solutions
+    """
+    merged = {}
+    for model in models:
+        for pred, atoms in model.items():
+            merged[pred] = merged.get(pred, frozenset()) | atoms
+    return merged
+
+
+def merge_component_models(models):
+    """Merge the solutions of independent groups of targets into a solution of the whole instance
+
+    Args:
+        models (list): (model, cost, optimality proven) of each group
+
+    Returns:
+        (dict, list, bool): solution with the atoms of all the groups, sum of the costs of the groups,
+            whether all of them are proven optimal. None if a group has no solution
+    """
+    if any(model is None for model in models):
+        return None
+    # every level of the encodings has a zero weight element, so that clingo reports all of them
+    if len({len(model[1]) for model in models}) > 1:
+        raise ValueError('Costs of the groups have different numbers of priority levels: ' + ', '.join(str(model[1]) for model in models))
+    cost = [sum(level) for level in zip(*(model[1] for model in models))]
+    return merge_atoms([model[0] for model in models]), cost, all(model[2] for model in models)
+
+
+def write_models(models):
+    """Write solutions one after the other in a temporary file, restricted to the
+    predicates read by community_solution, so that they are not kept in memory
+
+    Args:
+        models (iterable): solutions grouped by arity
+
+    Returns:
+        str: path of the file, see read_models
+    """
+    fd, models_file = tempfile.mkstemp(suffix='.pickle', prefix='miscoto_')
+    with os.fdopen(fd, 'wb') as f:
+        for model in models:
+            pickle.dump({pred: atoms for pred, atoms in model.items()
+                         if (pred[0] if isinstance(pred, tuple) else pred.split('/')[0]) in COMMUNITY_PREDICATES}, f)
+    return models_file
+
+
+def read_models(models_file):
+    """Generator of the solutions written by write_models
+
+    Args:
+        models_file (str): path of the file
+
+    Yields:
+        dict: solution grouped by arity
+    """
+    with open(models_file, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def iter_component_models(models_files):
+    """Generator of the combinations of one solution of each group, in the order of itertools.product.
+    Solutions are read from the files of the groups, only the combined ones being in memory
+
+    Args:
+        models_files (list): files of the solutions of each group, see write_models
+
+    Yields:
+        tuple: one solution of each group
+    """
+    if not models_files:
+        yield ()
+        return
+    for model in read_models(models_files[0]):
+        for models in iter_component_models(models_files[1:]):
+            yield (model,) + models
+
+
+def solve_component(instances, encoding, removed, targets, union=False, intersection=False, enumeration=False, cache_dir=None,
+                    backend='binary', threads=1, parallel_mode=None, time_limit=0, enum_max=0, enum_time_limit=0, grounding_options=''):
+    """Solve the sub-problem of a group of targets, on the instance restricted to these targets
+    and to the symbionts contributing to them. An optimal solution is always computed, to bound
+    the union, intersection and enumeration.
+
+    Args:
+        instances (list): ASP instance files
+        encoding (str): ASP model encoding
+        removed (set): symbionts not contributing to the targets, as written in the instance
+        targets (set): targets of the group, as written in the instance
+        union (bool, optional): Defaults to False. compute the union of the solutions
+        intersection (bool, optional): Defaults to False. compute the intersection of the solutions
+        enumeration (bool, optional): Defaults to False. enumerate the solutions
+        cache_dir (str, optional): Defaults to None. cache of groundings, not used if None
+        backend (str, optional): Defaults to 'binary'. solver backend, see query.check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of each phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds of the optimization, union and intersection solves, 0 = no limit
+        enum_max (int, optional): Defaults to 0. maximal number of solutions of the enumeration, 0 = all
+        enum_time_limit (int, optional): Defaults to 0. time limit of the enumeration in seconds, 0 = no limit
+        grounding_options (str, optional): Defaults to ''. grounder options, e.g. constants of the encoding
+
+    Returns:
+        dict: 'one_model', 'union' and 'intersection' (model, cost, optimality proven), None if not computed
+            or no solution is found, and 'enumeration' file of the enumerated solutions, see write_models,
+            None if not computed
+    """
+    solved = {'one_model': None, 'union': None, 'intersection': None, 'enumeration': None}
+    component_instance = pruning.write_filtered_instance(instances, removed, targets)
+    try:
+        grounding = query.get_grounded_communities_from_file([component_instance], encoding, cache_dir, grounding_options)
+        session = query.CommunitySession(grounding, threads, parallel_mode) if backend == 'module' else None
+        if session:
+            solved['one_model'] = session.get_communities(time_limit)
+        else:
+            solved['one_model'] = query.get_communities_from_g_with_optimality(grounding, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+        if solved['one_model'] is None:
+            return solved
+        optimum = ','.join(map(str, solved['one_model'][1]))
+        if union:
+            if session:
+                solved['union'] = session.get_union_communities(time_limit)
+            else:
+                solved['union'] = query.get_union_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+        if intersection:
+            if session:
+                solved['intersection'] = session.get_intersection_communities(time_limit)
+            else:
+                solved['intersection'] = query.get_intersection_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+        if enumeration:
+            # the solutions are streamed to a file, the product of the groups reads them back lazily
+            if session:
+                solved['enumeration'] = write_models(session.get_all_communities(enum_max, enum_time_limit))
+            else:
+                solved['enumeration'] = write_models(query.get_all_communities_from_g(grounding, optimum, enum_max, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=enum_time_limit))
+    finally:
+        os.unlink(component_instance)
+    return solved
+
+
+def solve_consequences(grounding, mode, optimum, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get the union or the intersection of the optimal communities, in its own solve
+
+    Args:
+        grounding (str): grounded instance and encoding, see query.get_grounded_communities_from_file
+        mode (str): 'union' or 'intersection'
+        optimum (str): optimal score
+        backend (str, optional): Defaults to 'binary'. solver backend, see query.check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+
+    Returns:
+        (dict, tuple, bool): union or intersection, the optimal score and whether the search completed
+    """
+    if mode == 'union':
+        return query.get_union_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    return query.get_intersection_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+
+
+def iter_component_communities(models_files, names=None, nmodels=0, equivalents=None):
+    """Generator of the optimal communities of an instance decomposed into independent groups
+    of targets: each combination of one optimal solution per group is an optimal solution
+
+    Args:
+        models_files (list): files of the enumerated solutions of each group, None for a group with no solution, see solve_component
+        names (list, optional): Defaults to None. names of the identifiers of an interned instance
+        nmodels (int, optional): Defaults to 0. number of solutions to compute, 0 = all
+        equivalents (dict, optional): Defaults to None. representative -> other symbionts with the same network, to expand the solutions of a reduced instance
+
+    Yields:
+        dict: solution, see community_solution
+    """
+    if None in models_files:
+        return
+    for count, models in enumerate(iter_component_models(models_files)):
+        if nmodels and count >= nmodels:
+            return
+        if equivalents:
+            yield from expand_solution(community_solution(merge_atoms(models), names), equivalents)
+        else:
+            yield community_solution(merge_atoms(models), names)
+
+
+def solve_per_target(grounding, targets, threads=1, parallel_mode=None, time_limit=0):
+    """Get an optimal community for each target on its own. The grounding is loaded
+    once in a solver session, and the targets are switched on one by one.
+
+    Args:
+        grounding (str): grounded model whose targets are external atoms, see commons.ASP_SRC_PER_TARGET
+        targets (list): targets, as written in the instance
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the optimization if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds of each solve, 0 = no limit
+
+    Returns:
+        list: (model, cost, optimality proven) for each target, None if no solution is found
+    """
+    session = query.CommunitySession(grounding, threads, parallel_mode)
+    solutions = []
+    for target in targets:
+        session.set_targets([target])
+        solutions.append(session.get_communities(time_limit))
+    return solutions
+
 
 def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_file=None, seeds_file=None, host_file=None,
-                intersection=False, enumeration=False, union=False, optsol=False, output_json=None):
+                intersection=False, enumeration=False, union=False, optsol=False, output_json=None, jobs=1, cache_dir=None, backend='binary',
+                threads=1, parallel_mode=None, time_limit=0, progress_file=None, enum_output=None,
+                enum_max=0, enum_time_limit=0, enum_convergence=0, prune=False,
+                reduce_symbionts=False, remove_dominated=False, decompose=False, greedy=False,
+                exchange_pruning=False, per_target=False, per_target_table=None, concurrent=False, greedy_compare=False):
     """Computes community selections in microbiota
         option (str, optional): Defaults to None. Modeling type: 'soup' for uncompartmentalized, 'minexch' for compartmentalized
         bacteria_dir (str, optional): Defaults to None. directory with symbionts metabolic networks
@@ -55,29 +389,45 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
         enumeration (bool, optional): Defaults to False. compute enumeration of solutions
         union (bool, optional): Defaults to False. compute union of solutions
         optsol (bool, optional): Defaults to False. compute one optimal solution
+        output_json (str, optional): Defaults to None. json file for output
+        jobs (int, optional): Defaults to 1. number of processes reading symbiont networks, solving the groups of decompose and the targets of per_target
+        cache_dir (str, optional): Defaults to None. cache of symbiont facts and groundings, not used if None
+        backend (str, optional): Defaults to 'binary'. solver backend: 'binary' runs clingo in a subprocess, 'module' uses the clingo Python API in-process, in a single session for all solution modes
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', None for the default mode of each phase: compete with a portfolio of configurations for the optimization, union and intersection, split for the enumeration
+        time_limit (int, optional): Defaults to 0. time limit in seconds of the optimization, union and intersection solves, 0 = no limit. When reached, the best solution found so far is returned and flagged as not proven optimal
+        progress_file (str, optional): Defaults to None. JSON lines file where each improving solution of the optimization is written as soon as it is found, requires optsol
+        enum_output (str, optional): Defaults to None. JSON lines file where each solution of the enumeration is written as soon as it is found. Solutions are then not kept in the results, only their number
+        enum_max (int, optional): Defaults to 0. maximal number of solutions of the enumeration, 0 = all
+        enum_time_limit (int, optional): Defaults to 0. time limit of the enumeration in seconds, 0 = no limit
+        enum_convergence (int, optional): Defaults to 0. stop the enumeration after this number of consecutive solutions adding no new symbiont to the union of the previous ones, 0 = never
+        prune (bool, optional): Defaults to False. remove before grounding the symbionts with no reaction firing in the community scope or not contributing to a target
+        reduce_symbionts (bool, optional): Defaults to False. solve with one representative of the symbionts with identical networks, solutions being expanded back to all of them
+        remove_dominated (bool, optional): Defaults to False. also remove the symbionts whose reactions are all in another one, with the same or fewer reactants and the same or more products. The optimum is kept, but union, intersection and enumeration only cover the solutions without dominated symbionts
+        decompose (bool, optional): Defaults to False. split the targets into groups whose productions involve disjoint sets of symbionts, solve the groups separately in jobs processes and combine their solutions
+        greedy (bool, optional): Defaults to False. start the optimization from a greedy community producing all the targets, which also bounds the number of symbionts with soup
+        exchange_pruning (bool, optional): Defaults to False. with minexch, only ground the exchanges of metabolites their producer can make and their receiver can use
+        per_target (bool, optional): Defaults to False. compute an optimal community for each target on its own, on a single grounding with the clingo Python module, the targets being solved in jobs processes
+        per_target_table (str, optional): Defaults to None. with per_target, tsv file with the optimum, bacteria and exchanges of each target
+        concurrent (bool, optional): Defaults to False. solve the union and the intersection concurrently, each in its own solver, once the optimum is known. Not used with the module backend, whose session solves them one after the other
+        greedy_compare (bool, optional): Defaults to False. with greedy, also solve the optimization without the greedy start, to report the time and the number of solutions it saves. Requires optsol
     """
     start_time = time.time()
     results = {}
 
     seed_instance = False
     target_instance = False
+    # names of the identifiers of an interned instance
+    names = None
+    instance = read_instance(lp_instance_file) if lp_instance_file else None
 
     # checking option
     if option == "soup":
         encoding = commons.ASP_SRC_TOPO_SOUP
     elif option == "minexch" and host_file == None:
-        # Check if there is an ASP instance file.
-        if lp_instance_file:
-            if not os.path.isfile(lp_instance_file) :
-                logger.critical('Instance file not found')
-                sys.exit(1)
-            with open(lp_instance_file, "r") as f:
-                draft_in_file = [line for line in f if line if 'draft' in line]
-            # Check if there is an host in the ASP instance file.
-            if len(draft_in_file) == 0:
-                encoding = commons.ASP_SRC_TOPO_RXN_MIN_EXCH_NOHOST
-            else:
-                encoding = commons.ASP_SRC_TOPO_RXN_MIN_EXCH
+        # Check if there is an host in the ASP instance.
+        if instance and instance['host']:
+            encoding = commons.ASP_SRC_TOPO_RXN_MIN_EXCH
         else:
             encoding = commons.ASP_SRC_TOPO_RXN_MIN_EXCH_NOHOST
     elif option == "minexch" and host_file != None:
@@ -86,14 +436,18 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
         logger.critical("invalid option choice")
         logger.info(pusage)
         quit()
+    if progress_file and not optsol:
+        logger.critical('--progress-file requires --optsol, the progress of the optimization is written there')
+        sys.exit(1)
+    if greedy_compare and not (greedy and optsol):
+        logger.critical('--greedy-compare requires --greedy and --optsol, the optimization is solved with and without the greedy start')
+        sys.exit(1)
 
     # case 1: instance is provided, just read targets and seeds if given
     if lp_instance_file:
-        if not os.path.isfile(lp_instance_file) :
-            logger.critical('Instance file not found')
-            sys.exit(1)
-
         delete_lp_instance = False
+        instance_files = instance['files']
+        symbols = instance['symbols']
 
         logger.info(
             "Instance provided, only seeds and targets will be added if given")
@@ -108,6 +462,8 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
                 logger.critical("Invalid syntax in SBML file: "+targets_file)
                 sys.exit(1)
             lp_instance_targets = utils.to_file(targetsfacts)
+            if symbols:
+                utils.intern_file(lp_instance_targets, symbols)
             target_instance = True
 
         if seeds_file:
@@ -121,8 +477,14 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
                 logger.critical("Invalid syntax in SBML file: "+seeds_file)
                 sys.exit(1)
             lp_instance_seeds = utils.to_file(seedsfacts)
+            if symbols:
+                utils.intern_file(lp_instance_seeds, symbols)
             seed_instance = True
 
+        if symbols:
+            logger.info("Interned instance, identifiers will be translated with " + instance['symbols_file'])
+            names = list(symbols)
+
     # case 2: read inputs from SBML files
     elif bacteria_dir and seeds_file and targets_file:
         if not os.path.isdir(bacteria_dir):
@@ -171,23 +533,8 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
 
         lp_instance_file = utils.to_file(lp_instance)
 
-        logger.info('Reading bacterial networks from ' + bacteria_dir + '...')
-        onlyfiles = [f for f in listdir(bacteria_dir) if isfile(join(bacteria_dir, f))]
-
-        if len(onlyfiles) == 0:
-            logger.critical('No bacterial networks in ' + bacteria_dir)
-            sys.exit(1)
-
-        for bacteria_file in onlyfiles:
-            name = os.path.splitext(bacteria_file)[0]
-            bacteria_path = os.path.join(bacteria_dir, bacteria_file)
-            try:
-                one_bact_model = sbml.readSBMLnetwork_symbionts_clyngor(bacteria_path, name)
-                one_bact_model.add(Atom('bacteria', ["\"" + name + "\""]))
-                utils.to_file(one_bact_model, lp_instance_file)
-                logger.info('Done for ' + name)
-            except:
-                logger.info('Could not read file ' + name + ' will ignore it')
+        add_symbionts_to_instance(bacteria_dir, lp_instance_file, jobs, cache_dir)
+        instance_files = [lp_instance_file]
 
     else:
         logger.info(
@@ -195,7 +542,7 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
         logger.info(pusage)
         quit()
 
-    if not optsol and not union and not enumeration and not intersection:
+    if not optsol and not union and not enumeration and not intersection and not per_target:
         logger.info(
             "No choice of solution provided. Will compute one optimal solution by default"
         )
@@ -204,22 +551,187 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
     logger.info('\nFinding optimal communities for target production...')
     #ground the instance
     print(encoding)
-    instances = [lp_instance_file]
+    instances = list(instance_files)
     if target_instance:
         instances.append(lp_instance_targets)
     if seed_instance:
         instances.append(lp_instance_seeds)
 
-    grounded_instance = query.get_grounded_communities_from_file(instances, encoding)
+    pruned_instance = None
+    if prune:
+        # compartmentalized encodings exchange metabolites by name
+        inactive, useless, pruned_instance = pruning.prune_instance(instances, by_name=option == 'minexch')
+        results['pruned_bacteria'] = [pruning.term_name(bacterium, names) for bacterium in inactive + useless]
+        if pruned_instance:
+            instances = [pruned_instance]
+
+    # representative -> other symbionts with the same network
+    equivalents = {}
+    reduced_instance = None
+    if reduce_symbionts or remove_dominated:
+        equivalent_terms, dominators, reduced_instance = pruning.reduce_instance(instances, remove_dominated)
+        equivalents = {pruning.term_name(representative, names): [pruning.term_name(bacterium, names) for bacterium in others]
+                       for representative, others in equivalent_terms.items()}
+        results['equivalent_bacteria'] = equivalents
+        results['dominated_bacteria'] = {pruning.term_name(bacterium, names): pruning.term_name(dominator, names)
+                                         for bacterium, dominator in dominators.items()}
+        if reduced_instance:
+            instances = [reduced_instance]
+
+    # grounder options of the encoding
+    grounding_options = ''
+    candidates_instance = None
+    if exchange_pruning:
+        if option == 'minexch':
+            producers, consumers = pruning.exchange_candidates(instances)
+            candidates = TermSet(itertools.chain((Atom('exchange_producer', list(pair)) for pair in producers),
+                                                 (Atom('exchange_consumer', list(pair)) for pair in consumers)))
+            candidates_instance = utils.to_file(candidates)
+            instances = instances + [candidates_instance]
+            grounding_options = '-c exchange_pruning=1'
+        else:
+            logger.warning('Exchange pruning only applies to the minexch option')
+
+    # solutions of the independent groups of targets
+    component_solutions = None
+    if decompose:
+        components = pruning.target_components(instances, by_name=option == 'minexch')
+        results['target_components'] = [sorted(pruning.term_name(target, names) for target in targets) for targets, _ in components]
+        if len(components) > 1:
+            all_bacteria = {bacterium for bacterium, in pruning.read_facts(instances, ('bacteria',))['bacteria']}
+            solve_args = [(instances, encoding, all_bacteria - component_bacteria, set(targets), union, intersection, enumeration, cache_dir,
+                           backend, threads, parallel_mode, time_limit, enum_max + 1 if enum_max else 0, enum_time_limit, grounding_options)
+                          for targets, component_bacteria in components]
+            logger.info(f"{len(components)} independent groups of targets solved in {jobs} processes")
+            if jobs > 1:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    component_solutions = list(executor.map(solve_component, *zip(*solve_args)))
+            else:
+                component_solutions = [solve_component(*args) for args in solve_args]
+
+    greedy_bound = None
+    greedy_instance = None
+    if greedy and not component_solutions:
+        greedy_start_time = time.time()
+        greedy_bacteria = pruning.greedy_community(instances, by_name=option == 'minexch')
+        results['greedy_bacteria'] = [pruning.term_name(bacterium, names) for bacterium in greedy_bacteria]
+        results['greedy_time'] = round(time.time() - greedy_start_time, 3)
+        # the greedy community is a solution of the soup model, not always of the compartmentalized ones
+        if option == 'soup':
+            greedy_bound = str(len(greedy_bacteria))
+            logger.info('Greedy bound: ' + greedy_bound + ' bacteria, computed in ' + str(results['greedy_time']) + ' seconds')
+        greedy_instance = utils.to_file(TermSet(Atom('greedy_bacteria', [bacterium]) for bacterium in greedy_bacteria))
+        instances = instances + [greedy_instance, commons.ASP_SRC_GREEDY_HEURISTIC]
+
+    if per_target:
+        logger.info('\n*** MINIMAL SOLUTION OF EACH TARGET ***')
+        # ground once without target facts, the targets being external atoms
+        target_terms = sorted({target for target, in pruning.read_facts(instances, ('target',))['target']})
+        untargeted_instance = pruning.write_filtered_instance(instances, set(), set())
+        per_target_instance = utils.to_file(TermSet(Atom('per_target', [target]) for target in target_terms))
+        per_target_grounding = query.get_grounded_communities_from_file([untargeted_instance, per_target_instance, commons.ASP_SRC_PER_TARGET],
+                                                                       encoding, cache_dir, grounding_options)
+        os.unlink(untargeted_instance)
+        os.unlink(per_target_instance)
+        if jobs > 1 and len(target_terms) > 1:
+            chunks = [target_terms[index::jobs] for index in range(min(jobs, len(target_terms)))]
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                chunk_solutions = list(executor.map(solve_per_target, itertools.repeat(per_target_grounding), chunks,
+                                                    itertools.repeat(threads), itertools.repeat(parallel_mode), itertools.repeat(time_limit)))
+            target_solutions = dict(zip(itertools.chain(*chunks), itertools.chain(*chunk_solutions)))
+        else:
+            target_solutions = dict(zip(target_terms, solve_per_target(per_target_grounding, target_terms, threads, parallel_mode, time_limit)))
+        del per_target_grounding
+
+        results['per_target'] = {}
+        for target in target_terms:
+            target_name = pruning.term_name(target, names)
+            solution = target_solutions[target]
+            if solution is None:
+                logger.warning('No solution found for ' + target_name + ' within the time limit of ' + str(time_limit) + ' seconds')
+                results['per_target'][target_name] = {'producible': False, 'optimum': None, 'optimality_proven': False, 'bacteria': [], 'exchanged': {}}
+                continue
+            community = community_solution(solution[0], names)
+            results['per_target'][target_name] = {'producible': not solution[0].get(('unproducible_target', 1)),
+                                                  'optimum': ','.join(map(str, solution[1])), 'optimality_proven': solution[2],
+                                                  'bacteria': community['bacteria'], 'exchanged': community['exchanged']}
+            logger.info(target_name + ': ' + str(len(community['bacteria'])) + ' bacteria, optimum = ' + results['per_target'][target_name]['optimum'])
+        if per_target_table:
+            with open(per_target_table, 'w', newline='') as f:
+                writer = csv.writer(f, delimiter='\t')
+                writer.writerow(['target', 'producible', 'optimum', 'optimality_proven', 'bacteria', 'exchanges'])
+                for target_name, solution in results['per_target'].items():
+                    writer.writerow([target_name, solution['producible'], solution['optimum'], solution['optimality_proven'],
+                                     ';'.join(sorted(solution['bacteria'])),
+                                     ';'.join(fromto[0] + '>' + fromto[1] + ':' + ','.join(sorted(what)) for fromto, what in sorted(solution['exchanged'].items()))])
+            logger.info('Solutions of the ' + str(len(results['per_target'])) + ' targets written in ' + per_target_table)
 
+    if component_solutions or not (optsol or union or intersection or enumeration):
+        grounded_instance = None
+        session = None
+    else:
+        grounded_instance = query.get_grounded_communities_from_file(instances, encoding, cache_dir, grounding_options)
+        # with the module backend, one solver session runs all the solution modes
+        session = query.CommunitySession(grounded_instance, threads, parallel_mode) if backend == 'module' else None
 
 # one solution
     if optsol:
         logger.info('\n*** ONE MINIMAL SOLUTION ***')
-        one_model = query.get_communities_from_g(grounded_instance)
+        optimization_start_time = time.time()
+        # scores of the improving solutions of the optimization
+        solution_scores = []
+        with open(progress_file, 'w') if progress_file else contextlib.nullcontext() as progress:
+            def write_progress(model, cost):
+                # the best-so-far solution, readable while the optimization is running
+                bacteria = [a[0] for a in model.get(('chosen_bacteria', 1), ())]
+                if names:
+                    bacteria = [names[a] if isinstance(a, int) else a for a in bacteria]
+                progress.write(json.dumps({'time': round(time.time() - start_time, 3), 'score': list(cost), 'bacteria': sorted(bacteria)}) + '\n')
+                progress.flush()
+
+            def on_model(model, cost):
+                solution_scores.append(cost)
+                if progress:
+                    write_progress(model, cost)
+
+            if component_solutions:
+                one_model = merge_component_models([solved['one_model'] for solved in component_solutions])
+                if progress and one_model is not None:
+                    write_progress(one_model[0], one_model[1])
+            elif session:
+                one_model = session.get_communities(time_limit, on_model, bound=greedy_bound, heuristic=greedy)
+            else:
+                one_model = query.get_communities_from_g_with_optimality(grounded_instance, backend=backend, threads=threads, parallel_mode=parallel_mode,
+                                                         time_limit=time_limit, on_model=on_model, bound=greedy_bound, heuristic=greedy)
+        if one_model is None:
+            logger.critical('No solution found within the time limit of ' + str(time_limit) + ' seconds')
+            sys.exit(1)
         score = one_model[1]
         optimum = ','.join(map(str, score))
+        results['optimality_proven'] = one_model[2]
+        if not one_model[2]:
+            logger.warning('Time limit reached: the solution below is the best found, its optimality is not proven')
+        if greedy_instance:
+            results['optimization_time'] = round(time.time() - optimization_start_time, 3)
+            results['optimization_solutions'] = len(solution_scores)
+            logger.info('Optimum ' + optimum + ' found in ' + str(results['optimization_time']) + ' seconds and ' + str(len(solution_scores))
+                        + ' solutions, starting from the greedy community of ' + str(len(results['greedy_bacteria'])) + ' bacteria')
+            if greedy_compare:
+                # a fresh solver, so that the compared optimization learns nothing from the first one
+                baseline_scores = []
+                baseline_start_time = time.time()
+                baseline_model = query.get_communities_from_g_with_optimality(grounded_instance, backend=backend, threads=threads, parallel_mode=parallel_mode,
+                                                                             time_limit=time_limit, on_model=lambda model, cost: baseline_scores.append(cost))
+                results['baseline_optimization_time'] = round(time.time() - baseline_start_time, 3)
+                results['baseline_optimization_solutions'] = len(baseline_scores)
+                results['greedy_time_saved'] = round(results['baseline_optimization_time'] - results['optimization_time'] - results['greedy_time'], 3)
+                logger.info('Without the greedy start, optimum ' + (','.join(map(str, baseline_model[1])) if baseline_model else 'not found') + ' found in '
+                            + str(results['baseline_optimization_time']) + ' seconds and ' + str(len(baseline_scores)) + ' solutions: the greedy start saved '
+                            + str(results['greedy_time_saved']) + ' seconds, its own computation included, and '
+                            + str(len(baseline_scores) - len(solution_scores)) + ' solutions')
         one_model = one_model[0]
+        if names:
+            one_model = utils.unintern_model(one_model, names)
         still_unprod = []
         bacteria = []
         newly_prod = []
@@ -272,14 +784,40 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
         results['newly_prod'] = newly_prod
         results['producible'] = prod_targets
 
+    # union and intersection only depend on the optimum: they are solved concurrently, each in its own solver,
+    # and read below as in sequential mode. The module backend keeps its single session
+    consequence_models = {}
+    if concurrent and session:
+        logger.warning('--concurrent is ignored with the module backend, the union and the intersection are solved in its session')
+    elif concurrent and union and intersection and not component_solutions:
+        if optsol:
+            consequence_optimum = optimum
+        else:
+            # the optimum is computed once, instead of once in each solve
+            optimal_model = query.get_communities_from_g_with_optimality(grounded_instance, backend=backend, threads=threads, parallel_mode=parallel_mode,
+                                                         time_limit=time_limit)
+            consequence_optimum = ','.join(map(str, optimal_model[1])) if optimal_model and optimal_model[2] else None
+        if consequence_optimum:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                consequence_futures = {mode: executor.submit(solve_consequences, grounded_instance, mode, consequence_optimum,
+                                                             backend, threads, parallel_mode, time_limit)
+                                       for mode in ('union', 'intersection')}
+                consequence_models = {mode: future.result() for mode, future in consequence_futures.items()}
+
 # union of solutions
     if union:
         logger.info('\n*** UNION OF MINIMAL SOLUTION ***')
         try:
-            if optsol:
-                union_m = query.get_union_communities_from_g(grounded_instance, optimum)
+            if component_solutions:
+                union_m = merge_component_models([solved['union'] for solved in component_solutions])
+            elif consequence_models:
+                union_m = consequence_models['union']
+            elif session:
+                union_m = session.get_union_communities(time_limit)
+            elif optsol:
+                union_m = query.get_union_communities_from_g_with_optimality(grounded_instance, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
             else:
-                union_m = query.get_union_communities_from_g_noopti(grounded_instance)
+                union_m = query.get_union_communities_from_g_noopti_with_optimality(grounded_instance, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
         except IndexError:
             logger.error(
                 "No stable model was found. Possible troubleshooting: no harmony between names for identical metabolites among host and microbes"
@@ -287,7 +825,12 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
             quit()
         union_score = union_m[1]
         optimum_union = ','.join(map(str, union_score))
+        results['union_optimality_proven'] = union_m[2]
+        if not union_m[2]:
+            logger.warning('Time limit reached: the union below is partial')
         union_m = union_m[0]
+        if names:
+            union_m = utils.unintern_model(union_m, names)
         union_bacteria = []
         union_exchanged = {}
         union_target_producers = {}
@@ -308,6 +851,12 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
                         union_target_producers[a[1]] = [a[0]]
                     else:
                         union_target_producers[a[1]].append(a[0])
+        if equivalents:
+            # identical symbionts are in the union with their representative
+            union_bacteria.extend(bacterium for representative in list(union_bacteria) for bacterium in equivalents.get(representative, []))
+            union_exchanged = expand_exchanges(union_exchanged, equivalents)
+            union_target_producers = {target: [bacterium for producer in producers for bacterium in [producer] + equivalents.get(producer, [])]
+                                      for target, producers in union_target_producers.items()}
         logger.info('Union of minimal sets of bacteria, with optimum = ' +
                     optimum_union + ' comprises ' + str(len(union_bacteria)) +
                     ' bacteria')
@@ -327,13 +876,24 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
 # intersection of solutions
     if intersection:
         logger.info('\n*** INTERSECTION OF MINIMAL SOLUTION ***')
-        if optsol:
-            intersection_m = query.get_intersection_communities_from_g(grounded_instance, optimum)
+        if component_solutions:
+            intersection_m = merge_component_models([solved['intersection'] for solved in component_solutions])
+        elif consequence_models:
+            intersection_m = consequence_models['intersection']
+        elif session:
+            intersection_m = session.get_intersection_communities(time_limit)
+        elif optsol:
+            intersection_m = query.get_intersection_communities_from_g_with_optimality(grounded_instance, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
         else:
-            intersection_m = query.get_intersection_communities_from_g_noopti(grounded_instance)
+            intersection_m = query.get_intersection_communities_from_g_noopti_with_optimality(grounded_instance, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
         intersection_score = intersection_m[1]
         optimum_inter = ','.join(map(str, intersection_score))
+        results['inter_optimality_proven'] = intersection_m[2]
+        if not intersection_m[2]:
+            logger.warning('Time limit reached: the intersection below is an over-approximation')
         intersection_m = intersection_m[0]
+        if names:
+            intersection_m = utils.unintern_model(intersection_m, names)
         inter_bacteria = []
         inter_exchanged = {}
         inter_target_producers = {}
@@ -354,6 +914,12 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
                         inter_target_producers[a[1]] = [a[0]]
                     else:
                         inter_target_producers[a[1]].append(a[0])
+        if equivalents:
+            # a symbiont identical to another one can be replaced by it, it is not in all the solutions
+            inter_bacteria = [bacterium for bacterium in inter_bacteria if bacterium not in equivalents]
+            inter_exchanged = {fromto: what for fromto, what in inter_exchanged.items() if not set(fromto) & set(equivalents)}
+            inter_target_producers = {target: [producer for producer in producers if producer not in equivalents]
+                                      for target, producers in inter_target_producers.items()}
         logger.info('Intersection of minimal sets of bacteria, with optimum = '
                     + optimum_inter + ' comprises ' +
                     str(len(inter_bacteria)) + ' bacteria')
@@ -373,56 +939,92 @@ def run_mincom(option=None, bacteria_dir=None, lp_instance_file=None, targets_fi
 # enumeration of all solutions
     if enumeration:
         logger.info('\n*** ENUMERATION OF MINIMAL SOLUTION ***')
-        if optsol:
-            all_models = query.get_all_communities_from_g(grounded_instance, optimum)
+        enum_start_time = time.time()
+        # one more solution than enum_max is asked for, telling whether the enumeration was cut
+        nmodels = enum_max + 1 if enum_max else 0
+        if component_solutions:
+            all_solutions = iter_component_communities([solved['enumeration'] for solved in component_solutions], names=names, nmodels=nmodels,
+                                                       equivalents=equivalents)
         else:
-            all_models = query.get_all_communities_from_g_noopti(grounded_instance)
-        count = 1
-
-        results['enum_bacteria']  = {}
-        results['enum_exchanged'] = {}
-        results['enum_targetsproducers'] = {}
-        for model in all_models:
-            enum_bacteria_this_sol = []
-            enum_exchanged_this_sol = {}
-            target_producers_this_sol = {}
-            logger.info('\nSolution ' + str(count))
-            for pred in model:
-                if pred == 'chosen_bacteria':
-                    for a in model[pred, 1]:
-                        enum_bacteria_this_sol.append(a[0])
-                elif pred == 'exchanged':
-                    for a in model[pred, 4]:
-                        if (a[2], a[3]) in enum_exchanged_this_sol:  #enum_exchanged_this_sol[(from,to)]=[(what,compartto);(what,compartto)]
-                            enum_exchanged_this_sol[(a[2], a[3])].append(a[0])
-                        else:
-                            enum_exchanged_this_sol[(a[2], a[3])] = []
-                            enum_exchanged_this_sol[(a[2], a[3])].append(a[0])
-                elif pred == 'target_producer_coop_selectedcom':
-                    for a in model[pred, 2]:
-                        if not a[1] in target_producers_this_sol:
-                            target_producers_this_sol[a[1]] = [a[0]]
-                        else:
-                            target_producers_this_sol[a[1]].append(a[0])
-            logger.info("\t" + str(len(enum_bacteria_this_sol)) +
-                        " bacterium(ia) in solution " + str(count))
-            for elem in enum_bacteria_this_sol:
-                logger.info("\t" + elem)
-            if len(enum_exchanged_this_sol) >= 1:
-                logger.info("\t" +
-                            str(sum(len(v) for v in enum_exchanged_this_sol.values())) +
-                            " exchange(s) in solution " + str(count))
-                for fromto in enum_exchanged_this_sol:
-                    logger.info('\texchange(s) from ' + fromto[0] + ' to ' +
-                                fromto[1] + " = " +
-                                ','.join(enum_exchanged_this_sol[fromto]))
-            results['enum_exchanged'][count] = enum_exchanged_this_sol
-            results['enum_bacteria'][count] = enum_bacteria_this_sol
-            results['enum_targetsproducers'][count] = target_producers_this_sol
-            count+=1
+            all_solutions = iter_communities(grounded_instance, optimum if optsol else None, names=names, nmodels=nmodels, backend=backend,
+                                             threads=threads, parallel_mode=parallel_mode, session=session, time_limit=enum_time_limit,
+                                             equivalents=equivalents)
+        if not enum_output:
+            results['enum_bacteria']  = {}
+            results['enum_exchanged'] = {}
+            results['enum_targetsproducers'] = {}
+        count = 0
+        stop_reason = 'complete'
+        # symbionts of the solutions enumerated so far, and number of consecutive solutions without a new one
+        enum_union = set()
+        without_new_symbiont = 0
+        # with enum_output, solutions are written as soon as they are found and not kept in memory
+        with open(enum_output, 'w') if enum_output else contextlib.nullcontext() as enum_file:
+            try:
+                for solution in all_solutions:
+                    if enum_max and count >= enum_max:
+                        stop_reason = 'max_solutions'
+                        break
+                    count += 1
+                    logger.info('\nSolution ' + str(count))
+                    logger.info("\t" + str(len(solution['bacteria'])) +
+                                " bacterium(ia) in solution " + str(count))
+                    for elem in solution['bacteria']:
+                        logger.info("\t" + elem)
+                    if len(solution['exchanged']) >= 1:
+                        logger.info("\t" +
+                                    str(sum(len(v) for v in solution['exchanged'].values())) +
+                                    " exchange(s) in solution " + str(count))
+                        for fromto in solution['exchanged']:
+                            logger.info('\texchange(s) from ' + fromto[0] + ' to ' +
+                                        fromto[1] + " = " +
+                                        ','.join(solution['exchanged'][fromto]))
+                    if enum_output:
+                        enum_file.write(json.dumps({'solution': count, 'bacteria': solution['bacteria'],
+                                                    'exchanged': [{'what': what, 'from_to': fromto} for fromto, what in solution['exchanged'].items()],
+                                                    'targetsproducers': solution['targetsproducers']}) + '\n')
+                        enum_file.flush()
+                    else:
+                        results['enum_exchanged'][count] = solution['exchanged']
+                        results['enum_bacteria'][count] = solution['bacteria']
+                        results['enum_targetsproducers'][count] = solution['targetsproducers']
+                    if set(solution['bacteria']) <= enum_union:
+                        without_new_symbiont += 1
+                    else:
+                        enum_union.update(solution['bacteria'])
+                        without_new_symbiont = 0
+                    if enum_convergence and without_new_symbiont >= enum_convergence:
+                        stop_reason = 'convergence'
+                        break
+                    if enum_time_limit and time.time() - enum_start_time >= enum_time_limit:
+                        stop_reason = 'time_limit'
+                        break
+            finally:
+                all_solutions.close()
+                if component_solutions:
+                    for solved in component_solutions:
+                        if solved['enumeration']:
+                            os.unlink(solved['enumeration'])
+        # the solver stops by itself at the time limit
+        if stop_reason == 'complete' and enum_time_limit and time.time() - enum_start_time >= enum_time_limit:
+            stop_reason = 'time_limit'
+        logger.info('Enumeration stopped after ' + str(count) + ' solutions: ' + stop_reason)
+        if enum_output:
+            logger.info(str(count) + ' solutions written in ' + enum_output)
+            results['enum_output'] = enum_output
+        results['enum_count'] = count
+        results['enum_stop_reason'] = stop_reason
 
     if delete_lp_instance == True:
         os.unlink(lp_instance_file)
+    if pruned_instance:
+        os.unlink(pruned_instance)
+    if reduced_instance:
+        os.unlink(reduced_instance)
+    if greedy_instance:
+        os.unlink(greedy_instance)
+    if candidates_instance:
+        os.unlink(candidates_instance)
 
     if output_json:
         utils.to_json(results, output_json)
@@ -16,20 +16,190 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
 import argparse
+import csv
 import sys
 import os
 import time
 import logging
-from miscoto import query, sbml, commons, utils
-from os import listdir
-from os.path import isfile, join
+from miscoto import query, sbml, commons, utils, native
+from miscoto.miscoto_instance import add_symbionts_to_instance, read_instance
+from miscoto.pruning import read_facts, write_filtered_instance
 from xml.etree.ElementTree import ParseError
 from clyngor.as_pyasp import TermSet, Atom
 
 logger = logging.getLogger(__name__)
 
 
-def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacteria_dir=None, host_file=None, output_json=None):
+def scopes_results(model, with_host=True, with_microbiome_scope=True):
+    """Read the scopes of a model of the scopes encoding, and log them
+
+    Args:
+        model (dict): model grouped by arity, see query.get_scopes
+        with_host (bool, optional): Defaults to True. report the scope and producible targets of the host
+        with_microbiome_scope (bool, optional): Defaults to True. report the metabolites producible through cooperation in the microbiome
+
+    Returns:
+        dict: all information related to scope computation
+    """
+    results = {}
+    host_scope = []
+    host_prodtargets = []
+    host_unprodtargets = []
+    com_scope = []
+    comhost_scope = []
+    com_prodtargets = []
+    com_unprodtargets = []
+    target_producers = {}
+    for pred in model:
+        if pred == 'dscope':
+            for a in model[pred, 1]:
+                host_scope.append(a[0])
+        elif pred == 'dproducible':
+            for a in model[pred, 1]:
+                host_prodtargets.append(a[0])
+        elif pred == 'dunproducible':
+            for a in model[pred, 1]:
+                host_unprodtargets.append(a[0])
+        elif pred == 'newscope_microbiome':
+            for a in model[pred, 1]:
+                com_scope.append(a[0])
+        elif pred == 'newscope_with_host':
+            for a in model[pred, 1]:
+                comhost_scope.append(a[0])
+        elif pred == 'newlyproducible':
+            for a in model[pred, 1]:
+                com_prodtargets.append(a[0])
+        elif pred == 'aunproducible':
+            for a in model[pred, 1]:
+                com_unprodtargets.append(a[0])
+        elif pred == 'target_producer_coop_initcom':
+            for a in model[pred, 2]:
+                if not a[1] in target_producers:
+                    target_producers[a[1]] = [a[0]]
+                else:
+                    target_producers[a[1]].append(a[0])
+
+    if with_host:
+        logger.info('*** HOST model producibility check ***')
+
+        logger.info('Host producible targets => ' + str(len(host_prodtargets)))
+        logger.info("\n".join(host_prodtargets))
+        results['host_prodtargets'] = host_prodtargets
+
+        logger.info('Host unproducible targets => ' +
+                    str(len(host_unprodtargets)))
+        logger.info("\n".join(host_unprodtargets))
+        results['host_unprodtargets'] = host_unprodtargets
+
+        logger.info('Host scope => ' + str(len(host_scope)))
+        logger.info("\n".join(host_scope))
+        results['host_scope'] = host_scope
+
+    logger.info('*** MICROBIOME added-value ***')
+    logger.info('Microbiome only producible targets => ' +
+                str(len(com_prodtargets)))
+    logger.info("\n".join(com_prodtargets))
+    results['com_prodtargets'] = com_prodtargets
+
+    logger.info('Microbiome unproducible targets => ' +
+                str(len(com_unprodtargets)))
+    logger.info("\n".join(com_unprodtargets))
+    results['com_unprodtargets'] = com_unprodtargets
+
+    if with_host:
+        logger.info(
+            '\nHost metabolites becoming producible through cooperation with symbionts (excluding metabolites that were producible by the host alone) => '
+            + str(len(comhost_scope)) + "\n")
+        logger.info("\n".join(comhost_scope))
+        results['comhost_scope'] = comhost_scope
+    if with_microbiome_scope:
+        logger.info(
+            '\nMicrobiome (host and symbionts) metabolites that become producible through cooperation (excluding metabolites that were producible by the host alone) => '
+            + str(len(com_scope)) + "\n")
+        logger.info("\n".join(com_scope))
+        results['com_scope'] = com_scope
+    
+    results["targets_producers"] = target_producers
+
+    return results
+
+
+def batch_scopes(instances, seeds_batch, symbols=None, engine='asp', backend='binary', with_host=True, with_microbiome_scope=True,
+                 output_dir=None, output_table=None, keep_instance_seeds=False):
+    """Compute the scopes of an instance for each seed set of a directory.
+    The instance is read once; with the native engine, its network is also
+    indexed once for all the seed sets.
+
+    Args:
+        instances (list): ASP instance files
+        seeds_batch (str): directory of seeds SBML files, each one replacing the seeds of the instance
+        symbols (dict, optional): Defaults to None. symbol table of an interned instance
+        engine (str, optional): Defaults to 'asp'. scope engine, see run_scopes
+        backend (str, optional): Defaults to 'binary'. solver backend of the asp engine
+        with_host (bool, optional): Defaults to True. see scopes_results
+        with_microbiome_scope (bool, optional): Defaults to True. see scopes_results
+        output_dir (str, optional): Defaults to None. directory where one json per seed set is written
+        output_table (str, optional): Defaults to None. tsv file summarizing all the seed sets
+        keep_instance_seeds (bool, optional): Defaults to False. add each seed set to the seeds of the instance instead of replacing them
+
+    Returns:
+        dict: results of each seed set, see scopes_results
+    """
+    if not os.path.isdir(seeds_batch):
+        logger.critical('Seeds directory not found')
+        sys.exit(1)
+    seeds_files = sorted(filename for filename in os.listdir(seeds_batch)
+                         if not filename.startswith('.') and os.path.isfile(os.path.join(seeds_batch, filename)))
+    unseeded_instance = None
+    if not keep_instance_seeds:
+        unseeded_instance = write_filtered_instance(instances, set(), seeds=set())
+        instances = [unseeded_instance]
+    network = native.scope_network(instances) if engine == 'native' else None
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    all_results = {}
+    for filename in seeds_files:
+        seeds_name = os.path.splitext(filename)[0]
+        seeds_path = os.path.join(seeds_batch, filename)
+        logger.info('\n*** SEEDS ' + seeds_name + ' ***')
+        try:
+            seedsfacts = sbml.readSBMLspecies_clyngor(seeds_path, 'seed')
+        except ParseError:
+            logger.critical("Invalid syntax in SBML file: " + seeds_path)
+            sys.exit(1)
+        lp_instance_seeds = utils.to_file(seedsfacts)
+        if symbols:
+            utils.intern_file(lp_instance_seeds, symbols)
+        if network:
+            model = native.network_scopes(network, (seed for seed, in read_facts([lp_instance_seeds])['seed']))
+        else:
+            model = query.get_scopes(instances + [lp_instance_seeds], commons.ASP_SRC_SCOPES, backend=backend)
+        os.unlink(lp_instance_seeds)
+        if symbols:
+            # seeds may add names to the symbol table
+            model = utils.unintern_model(model, list(symbols))
+        all_results[seeds_name] = scopes_results(model, with_host, with_microbiome_scope)
+        if output_dir:
+            utils.to_json(all_results[seeds_name], os.path.join(output_dir, seeds_name + '.json'))
+
+    if output_table:
+        with open(output_table, 'w', newline='') as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(['seeds', 'host_scope_size', 'com_scope_size', 'comhost_scope_size',
+                             'host_prodtargets', 'com_prodtargets', 'com_unprodtargets'])
+            for seeds_name, results in all_results.items():
+                writer.writerow([seeds_name, len(results.get('host_scope', [])), len(results.get('com_scope', [])), len(results.get('comhost_scope', [])),
+                                 ';'.join(sorted(results.get('host_prodtargets', []))), ';'.join(sorted(results['com_prodtargets'])),
+                                 ';'.join(sorted(results['com_unprodtargets']))])
+        logger.info('Summary of the ' + str(len(all_results)) + ' seed sets written in ' + output_table)
+    if unseeded_instance:
+        os.unlink(unseeded_instance)
+    return all_results
+
+
+def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacteria_dir=None, host_file=None, output_json=None, jobs=1, cache_dir=None, backend='binary', engine='asp',
+               seeds_batch=None, output_table=None, output_dir=None, keep_instance_seeds=False):
     """Computes community scopes
         lp_instance_file ([str], optional): Defaults to None. [ASP facts instance of the problem]
         targets_file ([str], optional): Defaults to None. [targets file]
@@ -37,9 +207,17 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
         bacteria_dir ([str], optional): Defaults to None. [directory of bacterial metabolic networks]
         host_file ([str], optional): Defaults to None. [host metabolic network]
         output_json ([str], optional): Defaults to None. [json file for output]
+        jobs ([int], optional): Defaults to 1. [number of processes reading symbiont networks]
+        cache_dir ([str], optional): Defaults to None. [cache of symbiont facts, not used if None]
+        backend ([str], optional): Defaults to 'binary'. [solver backend: 'binary' runs clingo in a subprocess, 'module' uses the clingo Python API in-process]
+        engine ([str], optional): Defaults to 'asp'. [scope engine: 'asp' solves the scopes encoding, 'native' computes the same scopes by forward chaining, without grounding]
+        seeds_batch ([str], optional): Defaults to None. [directory of seeds SBML files: the instance is read once and the scopes are computed for each seed set, replacing the seeds of the instance and of seeds_file. output_json then receives the results of all the seed sets]
+        output_table ([str], optional): Defaults to None. [with seeds_batch, tsv file summarizing the scopes of all the seed sets]
+        output_dir ([str], optional): Defaults to None. [with seeds_batch, directory receiving one json per seed set]
+        keep_instance_seeds ([bool], optional): Defaults to False. [with seeds_batch, add each seed set to the seeds of the instance and of seeds_file instead of replacing them]
 
     Returns:
-        [dic]: [all information related to scope computation]
+        [dic]: [all information related to scope computation, by seed set with seeds_batch]
     """
 
     start_time = time.time()
@@ -48,14 +226,16 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
     input_instance = False
     seed_instance = False
     target_instance = False
+    # names of the identifiers of an interned instance
+    names = None
+    symbols = None
 
     if lp_instance_file:
-        if not os.path.isfile(lp_instance_file) :
-            logger.info('Instance file not found')
-            sys.exit(1)
-
+        instance = read_instance(lp_instance_file)
         input_instance = True
         delete_lp_instance = False
+        instance_files = instance['files']
+        symbols = instance['symbols']
         logger.info(
             "Instance provided, only seeds and targets will be added if given")
 
@@ -70,6 +250,8 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
                 logger.critical("Invalid syntax in SBML file: "+targets_file)
                 sys.exit(1)
             lp_instance_targets = utils.to_file(targetsfacts)
+            if symbols:
+                utils.intern_file(lp_instance_targets, symbols)
             target_instance = True
 
         if seeds_file:
@@ -83,11 +265,17 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
                 logger.critical("Invalid syntax in SBML file: " + seeds_file)
                 sys.exit(1)
             lp_instance_seeds = utils.to_file(seedsfacts)
+            if symbols:
+                utils.intern_file(lp_instance_seeds, symbols)
             seed_instance = True
 
+        if symbols:
+            logger.info("Interned instance, identifiers will be translated with " + instance['symbols_file'])
+            names = list(symbols)
+
 
     # case 2: read inputs from SBML files
-    elif bacteria_dir and seeds_file:
+    elif bacteria_dir and (seeds_file or seeds_batch):
         if not os.path.isdir(bacteria_dir):
             logger.info("Symbiont directory not found")
             sys.exit(1)
@@ -109,16 +297,19 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
             logger.warning('No host provided.')
             draftnet = TermSet()
 
-        logger.info('Reading seeds from ' + seeds_file)
-        try:
-            seeds = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
-        except FileNotFoundError:
-            logger.critical('Seeds file not found')
-            sys.exit(1)
-        except ParseError:
-            logger.critical("Invalid syntax in SBML file: "+seeds_file)
-            sys.exit(1)
-        lp_instance = TermSet(draftnet.union(seeds))
+        if seeds_file:
+            logger.info('Reading seeds from ' + seeds_file)
+            try:
+                seeds = sbml.readSBMLspecies_clyngor(seeds_file, 'seed')
+            except FileNotFoundError:
+                logger.critical('Seeds file not found')
+                sys.exit(1)
+            except ParseError:
+                logger.critical("Invalid syntax in SBML file: "+seeds_file)
+                sys.exit(1)
+            lp_instance = TermSet(draftnet.union(seeds))
+        else:
+            lp_instance = TermSet(draftnet)
 
         if targets_file:
             logger.info('Reading targets from ' + targets_file)
@@ -134,30 +325,10 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
         else:
             logger.info("No targets provided.")
 
-        if not os.path.isdir(bacteria_dir):
-            logger.critical("Symbiont directory not found")
-            sys.exit(1)
-
         lp_instance_file = utils.to_file(lp_instance)
 
-        logger.info('Reading bacterial networks from ' + bacteria_dir + '...')
-        bactfacts = TermSet()
-        onlyfiles = [f for f in listdir(bacteria_dir) if isfile(join(bacteria_dir, f))]
-
-        if len(onlyfiles) == 0:
-            logger.critical('No bacterial networks in ' + bacteria_dir)
-            sys.exit(1)
-
-        for bacteria_file in onlyfiles:
-            name = os.path.splitext(bacteria_file)[0]
-            bacteria_path = os.path.join(bacteria_dir, bacteria_file)
-            try:
-                one_bact_model = sbml.readSBMLnetwork_symbionts_clyngor(bacteria_path, name)
-                one_bact_model.add(Atom('bacteria', ["\"" + name + "\""]))
-                utils.to_file(one_bact_model, lp_instance_file)
-                logger.info('Done for ' + name)
-            except:
-                logger.info('Could not read file ' + name + ', will ignore it')
+        add_symbionts_to_instance(bacteria_dir, lp_instance_file, jobs, cache_dir)
+        instance_files = [lp_instance_file]
 
     else:
         logger.critical("ERROR missing input")
@@ -166,92 +337,29 @@ def run_scopes(lp_instance_file=None, targets_file=None, seeds_file=None, bacter
 
     logger.info("Computing scopes...")
 
-    instances = [lp_instance_file]
+    instances = list(instance_files)
     if target_instance:
         instances.append(lp_instance_targets)
     if seed_instance:
         instances.append(lp_instance_seeds)
     
-    model = query.get_scopes(instances, commons.ASP_SRC_SCOPES)
-
-    host_scope = []
-    host_prodtargets = []
-    host_unprodtargets = []
-    com_scope = []
-    comhost_scope = []
-    com_prodtargets = []
-    com_unprodtargets = []
-    target_producers = {}
-    for pred in model:
-        if pred == 'dscope':
-            for a in model[pred, 1]:
-                host_scope.append(a[0])
-        elif pred == 'dproducible':
-            for a in model[pred, 1]:
-                host_prodtargets.append(a[0])
-        elif pred == 'dunproducible':
-            for a in model[pred, 1]:
-                host_unprodtargets.append(a[0])
-        elif pred == 'newscope_microbiome':
-            for a in model[pred, 1]:
-                com_scope.append(a[0])
-        elif pred == 'newscope_with_host':
-            for a in model[pred, 1]:
-                comhost_scope.append(a[0])
-        elif pred == 'newlyproducible':
-            for a in model[pred, 1]:
-                com_prodtargets.append(a[0])
-        elif pred == 'aunproducible':
-            for a in model[pred, 1]:
-                com_unprodtargets.append(a[0])
-        elif pred == 'target_producer_coop_initcom':
-            for a in model[pred, 2]:
-                if not a[1] in target_producers:
-                    target_producers[a[1]] = [a[0]]
-                else:
-                    target_producers[a[1]].append(a[0])
-
-    if host_file or input_instance:
-        logger.info('*** HOST model producibility check ***')
-
-        logger.info('Host producible targets => ' + str(len(host_prodtargets)))
-        logger.info("\n".join(host_prodtargets))
-        results['host_prodtargets'] = host_prodtargets
-
-        logger.info('Host unproducible targets => ' +
-                    str(len(host_unprodtargets)))
-        logger.info("\n".join(host_unprodtargets))
-        results['host_unprodtargets'] = host_unprodtargets
-
-        logger.info('Host scope => ' + str(len(host_scope)))
-        logger.info("\n".join(host_scope))
-        results['host_scope'] = host_scope
-
-    logger.info('*** MICROBIOME added-value ***')
-    logger.info('Microbiome only producible targets => ' +
-                str(len(com_prodtargets)))
-    logger.info("\n".join(com_prodtargets))
-    results['com_prodtargets'] = com_prodtargets
-
-    logger.info('Microbiome unproducible targets => ' +
-                str(len(com_unprodtargets)))
-    logger.info("\n".join(com_unprodtargets))
-    results['com_unprodtargets'] = com_unprodtargets
-
-    if host_file or input_instance:
-        logger.info(
-            '\nHost metabolites becoming producible through cooperation with symbionts (excluding metabolites that were producible by the host alone) => '
-            + str(len(comhost_scope)) + "\n")
-        logger.info("\n".join(comhost_scope))
-        results['comhost_scope'] = comhost_scope
-    if input_instance or not host_file:
-        logger.info(
-            '\nMicrobiome (host and symbionts) metabolites that become producible through cooperation (excluding metabolites that were producible by the host alone) => '
-            + str(len(com_scope)) + "\n")
-        logger.info("\n".join(com_scope))
-        results['com_scope'] = com_scope
-    
-    results["targets_producers"] = target_producers
+    if engine not in commons.SCOPE_ENGINES:
+        logger.critical('Invalid scope engine ' + str(engine) + ', choose among ' + ', '.join(commons.SCOPE_ENGINES))
+        sys.exit(1)
+
+    with_host = bool(host_file or input_instance)
+    with_microbiome_scope = bool(input_instance or not host_file)
+    if seeds_batch:
+        results = batch_scopes(instances, seeds_batch, symbols, engine, backend, with_host, with_microbiome_scope,
+                               output_dir=output_dir, output_table=output_table, keep_instance_seeds=keep_instance_seeds)
+    else:
+        if engine == 'native':
+            model = native.get_scopes(instances)
+        else:
+            model = query.get_scopes(instances, commons.ASP_SRC_SCOPES, backend=backend)
+        if names:
+            model = utils.unintern_model(model, names)
+        results = scopes_results(model, with_host, with_microbiome_scope)
 
     if delete_lp_instance == True:
         os.unlink(lp_instance_file)
@@ -0,0 +1,283 @@
+# Copyright (C) 2018-2024 Clémence Frioux & Arnaud Belcour - Inria Dyliss - Pleiade
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Native engines computing the scopes of an instance without grounding.
+The scopes of scopes.lp are monotone fixpoints: they are computed by forward
+chaining, each reaction firing once, when its last missing input is produced.
+The individual scopes of focus are computed on bitsets, one bit per metabolite.
+Models are returned in the format of query.get_scopes.
+"""
+
+import logging
+from collections import defaultdict
+
+from miscoto.pruning import PRUNING_PREDICATES, read_facts, community_scope
+
+logger = logging.getLogger(__name__)
+
+
+def term_value(term):
+    """Convert an argument of a fact as clyngor does with discard_quotes
+
+    Args:
+        term (str): argument, as written in the instance
+
+    Returns:
+        int or str: number, or string without quotes
+    """
+    if term.startswith('"'):
+        return term[1:-1]
+    try:
+        return int(term)
+    except ValueError:
+        return term
+
+
+def network_reactions(facts):
+    """Get the reactions of an instance with their reactants and products
+
+    Args:
+        facts (dict): facts of the instance, see pruning.read_facts
+
+    Returns:
+        list: (reaction, organism, reactants, products, reversible) of each reaction
+    """
+    reactants = defaultdict(set)
+    products = defaultdict(set)
+    for metabolite, reaction, organism in facts['reactant']:
+        reactants[reaction, organism].add(metabolite)
+    for metabolite, reaction, organism in facts['product']:
+        products[reaction, organism].add(metabolite)
+    reversible = set(facts['reversible'])
+    return [(reaction, organism, frozenset(reactants[reaction, organism]), frozenset(products[reaction, organism]), (reaction, organism) in reversible)
+            for reaction, organism in set(facts['reaction'])]
+
+
+def scope_directions(reactions, organisms):
+    """Get the reactions of some organisms, in both directions for the reversible ones
+
+    Args:
+        reactions (list): reactions of the instance, see network_reactions
+        organisms (set): organisms
+
+    Returns:
+        (list, list): (organism, inputs, outputs) of each direction, (reaction, organism) of each direction
+    """
+    directions = []
+    keys = []
+    for reaction, organism, reactants, products, reversible in reactions:
+        if organism not in organisms:
+            continue
+        directions.append((organism, reactants, products))
+        keys.append((reaction, organism))
+        if reversible:
+            directions.append((organism, products, reactants))
+            keys.append((reaction, organism))
+    return directions, keys
+
+
+def scope_network(instance_files):
+    """Read the network of an instance once, to compute its scopes for several seed sets
+
+    Args:
+        instance_files (list): ASP instance files
+
+    Returns:
+        dict: directions of the reactions of the host and of the whole community, seeds, targets and species of the host
+    """
+    facts = read_facts(instance_files)
+    drafts = {draft for draft, in facts['draft']}
+    organisms = drafts | {bacterium for bacterium, in facts['bacteria']}
+    targets = {target for target, in facts['target']}
+    reactions = network_reactions(facts)
+    host_directions, _ = scope_directions(reactions, drafts)
+    directions, keys = scope_directions(reactions, organisms)
+    reversible = set(facts['reversible'])
+    # reactions producing each target, through their products or their reactants if reversible
+    target_reactions = defaultdict(set)
+    for metabolite, reaction, organism in facts['product']:
+        if metabolite in targets:
+            target_reactions[reaction, organism].add(metabolite)
+    for metabolite, reaction, organism in facts['reactant']:
+        if metabolite in targets and (reaction, organism) in reversible:
+            target_reactions[reaction, organism].add(metabolite)
+    return {'host_directions': host_directions, 'directions': directions, 'keys': keys,
+            'seeds': {seed for seed, in facts['seed']}, 'targets': targets, 'target_reactions': target_reactions,
+            'host_species': {metabolite for metabolite, _, _, organism in facts['species'] if organism in drafts}}
+
+
+def network_scopes(network, seeds=()):
+    """Compute the scopes of scopes.lp: host scope, community scope, newly producible
+    metabolites and targets and the producers of the targets
+
+    Args:
+        network (dict): network of the instance, see scope_network
+        seeds (iterable, optional): Defaults to (). seeds added to the ones of the instance
+
+    Returns:
+        dict: model grouped by arity, as query.get_scopes
+    """
+    seeds = network['seeds'] | set(seeds)
+    targets = network['targets']
+    dscope, _ = community_scope({'reactions': network['host_directions'], 'seeds': seeds})
+    allscope, fired = community_scope({'reactions': network['directions'], 'seeds': seeds})
+    keys = network['keys']
+    target_producers = set()
+    for index in range(len(keys)):
+        if fired[index]:
+            for target in network['target_reactions'].get(keys[index], ()):
+                target_producers.add((keys[index][1], target))
+
+    atoms = {
+        ('dscope', 1): {(metabolite,) for metabolite in dscope},
+        ('dproducible', 1): {(target,) for target in targets if target in dscope},
+        ('dunproducible', 1): {(target,) for target in targets if target not in dscope},
+        ('aunproducible', 1): {(target,) for target in targets if target not in allscope},
+        ('newscope_with_host', 1): {(metabolite,) for metabolite in allscope - dscope if metabolite in network['host_species']},
+        ('newscope_microbiome', 1): {(metabolite,) for metabolite in allscope - dscope},
+        ('newlyproducible', 1): {(target,) for target in targets if target in allscope and target not in dscope},
+        ('target_producer_coop_initcom', 2): target_producers,
+    }
+    model = {}
+    for (name, arity), all_args in atoms.items():
+        if all_args:
+            all_args = frozenset(tuple(term_value(term) for term in args) for args in all_args)
+            model[name] = model[name, arity] = model[name + '/' + str(arity)] = all_args
+    return model
+
+
+def get_scopes(instance_files):
+    """Compute the scopes of scopes.lp, see network_scopes
+
+    Args:
+        instance_files (list): ASP instance files
+
+    Returns:
+        dict: model grouped by arity, as query.get_scopes
+    """
+    return network_scopes(scope_network(instance_files))
+
+
+def bacteria_allscope(facts, reactions=None):
+    """Compute the scope of the symbionts of an instance, without the host, as allscope in the focus encoding
+
+    Args:
+        facts (dict): facts of the instance, see pruning.read_facts
+        reactions (list, optional): Defaults to None. reactions of the instance, see network_reactions
+
+    Returns:
+        set: metabolites of the scope, as written in the instance
+    """
+    if reactions is None:
+        reactions = network_reactions(facts)
+    bacteria = {bacterium for bacterium, in facts['bacteria']}
+    allscope, _ = community_scope({'reactions': scope_directions(reactions, bacteria)[0], 'seeds': {seed for seed, in facts['seed']}})
+    return allscope
+
+
+def metabolites_of_mask(mask, metabolites):
+    """Get the metabolites of a bitset
+
+    Args:
+        mask (int): bitset
+        metabolites (list): metabolite of each bit
+
+    Returns:
+        list: metabolites
+    """
+    found = []
+    while mask:
+        low_bit = mask & -mask
+        found.append(metabolites[low_bit.bit_length() - 1])
+        mask ^= low_bit
+    return found
+
+
+def focus_scopes(instance_files):
+    """Compute the metabolites produced by each focused organism of iscope_in_community.lp,
+    alone (iproduced) and in the community (cproduced). The reactants and products of the
+    reactions are bitsets, so that a reaction is activated by a scope when its inputs
+    are included in the scope bitset.
+
+    Args:
+        instance_files (list): ASP instance files, with target_species facts for the focused organisms,
+            and possibly allscope facts giving the community scope
+
+    Returns:
+        dict: model grouped by arity, as query.get_scopes
+    """
+    facts = read_facts(instance_files, PRUNING_PREDICATES + ('target_species', 'allscope'))
+    focused = {organism for organism, in facts['target_species']}
+    seeds = {seed for seed, in facts['seed']}
+    reactions = network_reactions(facts)
+    if facts['allscope']:
+        allscope = {metabolite for metabolite, in facts['allscope']}
+    else:
+        allscope = bacteria_allscope(facts, reactions)
+
+    bits = {}
+    metabolites = []
+
+    def to_mask(metabolite_set):
+        mask = 0
+        for metabolite in metabolite_set:
+            if metabolite not in bits:
+                bits[metabolite] = len(metabolites)
+                metabolites.append(metabolite)
+            mask |= 1 << bits[metabolite]
+        return mask
+
+    seeds_mask = to_mask(seeds)
+    allscope_mask = to_mask(allscope)
+    organism_reactions = defaultdict(list)
+    for _, organism, reactants, products, reversible in reactions:
+        if organism in focused:
+            organism_reactions[organism].append((to_mask(reactants), to_mask(products), reversible))
+
+    atoms = {('iproduced', 2): set(), ('cproduced', 2): set()}
+    for organism, masks in organism_reactions.items():
+        # individual scope: passes over the directions not fired yet, until none fires
+        pending = [(reactants, products) for reactants, products, _ in masks]
+        pending += [(products, reactants) for reactants, products, reversible in masks if reversible]
+        scope = seeds_mask
+        fired = True
+        while fired:
+            fired = False
+            waiting = []
+            for inputs, outputs in pending:
+                if inputs & scope == inputs:
+                    scope |= outputs
+                    fired = True
+                else:
+                    waiting.append((inputs, outputs))
+            pending = waiting
+
+        produced_alone = 0
+        produced_in_community = 0
+        for reactants, products, reversible in masks:
+            produced = products | reactants if reversible else products
+            if reactants & scope == reactants or (reversible and products & scope == products):
+                produced_alone |= produced
+            if reactants & allscope_mask == reactants or (reversible and products & allscope_mask == products):
+                produced_in_community |= produced
+        atoms['iproduced', 2].update((metabolite, organism) for metabolite in metabolites_of_mask(produced_alone, metabolites))
+        atoms['cproduced', 2].update((metabolite, organism) for metabolite in metabolites_of_mask(produced_in_community, metabolites))
+
+    model = {}
+    for (name, arity), all_args in atoms.items():
+        if all_args:
+            all_args = frozenset(tuple(term_value(term) for term in args) for args in all_args)
+            model[name] = model[name, arity] = model[name + '/' + str(arity)] = all_args
+    return model
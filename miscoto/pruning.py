@@ -0,0 +1,544 @@
+# Copyright (C) 2018-2024 Clémence Frioux & Arnaud Belcour - Inria Dyliss - Pleiade
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Topological pruning of the symbionts of an instance, before grounding.
+The scope of the whole community (allscope in scopes.lp) is computed by forward
+chaining. Symbionts none of whose reactions can fire in this scope, or whose
+reactions can never contribute to the production of a target, are never part of
+a minimal community and are removed from the instance.
+Symbionts with identical networks can also be collapsed into one representative
+before solving, the solutions being expanded back afterwards.
+Targets whose productions can not involve the same symbionts are independent
+sub-problems, that can be solved separately.
+A greedy community producing all the targets gives a first solution to the solver.
+Exchanges of the compartmentalized encodings can be restricted to the metabolites
+their producer can make and their receiver can use.
+"""
+
+import logging
+import os
+import re
+import tempfile
+from collections import defaultdict
+
+from miscoto.miscoto_instance import NETWORK_PREDICATES
+
+logger = logging.getLogger(__name__)
+
+# one fact per line: predicate and arguments
+FACT = re.compile(r'^(\w+)\((.*)\)\.\s*$')
+# arguments of a fact, quoted strings or plain terms
+ARGUMENT = re.compile(r'"(?:[^"\\]|\\.)*"|[^,]+')
+PRUNING_PREDICATES = ('draft', 'bacteria', 'seed', 'target', 'reaction', 'reversible', 'reactant', 'product', 'species')
+
+
+def read_facts(instance_files, predicates=PRUNING_PREDICATES):
+    """Read the facts of an instance needed to compute its scope.
+    Arguments are kept as written, quoted or interned.
+
+    Args:
+        instance_files (list): ASP instance files
+        predicates (tuple, optional): Defaults to PRUNING_PREDICATES. predicates to read
+
+    Returns:
+        dict: predicate -> list of argument tuples
+    """
+    facts = defaultdict(list)
+    for instance_file in instance_files:
+        with open(instance_file, 'r') as f:
+            for line in f:
+                match = FACT.match(line)
+                if match and match.group(1) in predicates:
+                    facts[match.group(1)].append(tuple(ARGUMENT.findall(match.group(2))))
+    return facts
+
+
+def community_network(facts, by_name=False):
+    """Get the reactions of an instance, in both directions for the reversible ones.
+    With by_name, metabolites are identified by their species name, as in the exchanges
+    of the minexch encodings, instead of their identifier.
+
+    Args:
+        facts (dict): facts of the instance, see read_facts
+        by_name (bool, optional): Defaults to False. identify metabolites by name
+
+    Returns:
+        dict: 'reactions' list of (organism, inputs, outputs), 'drafts', 'bacteria', 'seeds' and 'targets'
+    """
+    # names of a metabolite in an organism, and in any organism
+    names = defaultdict(set)
+    all_names = defaultdict(set)
+    if by_name:
+        for metabolite, name, _, organism in facts['species']:
+            names[metabolite, organism].add(name)
+            all_names[metabolite].add(name)
+
+    def metabolite_keys(metabolite, organism):
+        return names.get((metabolite, organism)) or {metabolite}
+
+    reactants = defaultdict(set)
+    products = defaultdict(set)
+    for metabolite, reaction, organism in facts['reactant']:
+        reactants[reaction, organism].update(metabolite_keys(metabolite, organism))
+    for metabolite, reaction, organism in facts['product']:
+        products[reaction, organism].update(metabolite_keys(metabolite, organism))
+    reversible = set(facts['reversible'])
+
+    reactions = []
+    for reaction, organism in set(facts['reaction']):
+        inputs = frozenset(reactants[reaction, organism])
+        outputs = frozenset(products[reaction, organism])
+        reactions.append((organism, inputs, outputs))
+        if (reaction, organism) in reversible:
+            reactions.append((organism, outputs, inputs))
+
+    seeds = set()
+    for seed, in facts['seed']:
+        seeds.add(seed)
+        seeds.update(all_names[seed])
+    targets = set()
+    for target, in facts['target']:
+        targets.add(target)
+        targets.update(all_names[target])
+
+    return {'reactions': reactions, 'drafts': {draft for draft, in facts['draft']},
+            'bacteria': [bacterium for bacterium, in facts['bacteria']], 'seeds': seeds, 'targets': targets}
+
+
+def community_scope(network):
+    """Compute the scope of the whole community by forward chaining, each reaction
+    firing once all its inputs are in the scope
+
+    Args:
+        network (dict): reactions, seeds and targets, see community_network
+
+    Returns:
+        (set, list): metabolites of the scope and, for each reaction, whether it fires
+    """
+    reactions = network['reactions']
+    scope = set(network['seeds'])
+    # number of inputs of each reaction not in the scope yet, and reactions waiting for each metabolite
+    missing = []
+    waiting = defaultdict(list)
+    to_fire = []
+    for index, (_, inputs, _) in enumerate(reactions):
+        missing_inputs = inputs - scope
+        missing.append(len(missing_inputs))
+        for metabolite in missing_inputs:
+            waiting[metabolite].append(index)
+        if not missing_inputs:
+            to_fire.append(index)
+    fired = [False] * len(reactions)
+    while to_fire:
+        index = to_fire.pop()
+        fired[index] = True
+        for metabolite in reactions[index][2]:
+            if metabolite not in scope:
+                scope.add(metabolite)
+                for waiting_index in waiting[metabolite]:
+                    missing[waiting_index] -= 1
+                    if missing[waiting_index] == 0:
+                        to_fire.append(waiting_index)
+    return scope, fired
+
+
+def useful_organisms(network):
+    """Get the organisms with a reaction firing in the community scope, and those
+    with a firing reaction that contributes to the production of a target
+
+    Args:
+        network (dict): reactions, seeds and targets, see community_network
+
+    Returns:
+        (set, set): active organisms, useful organisms
+    """
+    reactions = network['reactions']
+    _, fired = community_scope(network)
+    producers = defaultdict(list)
+    for index, (_, _, outputs) in enumerate(reactions):
+        if fired[index]:
+            for metabolite in outputs:
+                producers[metabolite].append(index)
+    # walk back from the targets through the firing reactions
+    relevant = set(network['targets'])
+    to_visit = list(relevant)
+    used = [False] * len(reactions)
+    while to_visit:
+        metabolite = to_visit.pop()
+        for index in producers[metabolite]:
+            if used[index]:
+                continue
+            used[index] = True
+            for input_metabolite in reactions[index][1]:
+                if input_metabolite not in relevant:
+                    relevant.add(input_metabolite)
+                    to_visit.append(input_metabolite)
+    active = {reactions[index][0] for index in range(len(reactions)) if fired[index]}
+    useful = {reactions[index][0] for index in range(len(reactions)) if used[index]}
+    return active, useful
+
+
+def term_name(term, names=None):
+    """Get the name of an argument of a fact
+
+    Args:
+        term (str): argument, as written in the instance
+        names (list, optional): Defaults to None. name of each identifier if the instance is interned
+
+    Returns:
+        str: name
+    """
+    if term.startswith('"'):
+        return term[1:-1]
+    if names:
+        return names[int(term)]
+    return term
+
+
+def prune_instance(instance_files, by_name=False):
+    """Remove from an instance the symbionts that can not be part of a minimal community:
+    those with no reaction firing in the community scope, and those with no firing reaction
+    contributing to the production of a target. The host is kept.
+
+    Args:
+        instance_files (list): ASP instance files
+        by_name (bool, optional): Defaults to False. identify metabolites by name, as in the minexch encodings
+
+    Returns:
+        (list, list, str): inactive symbionts, symbionts not contributing to a target,
+            pruned instance file (None if no symbiont is pruned). Symbionts are given as written in the instance
+    """
+    network = community_network(read_facts(instance_files), by_name)
+    active, useful = useful_organisms(network)
+    inactive = sorted(bacterium for bacterium in network['bacteria'] if bacterium not in active)
+    useless = sorted(bacterium for bacterium in network['bacteria'] if bacterium in active and bacterium not in useful)
+    logger.info('%d symbionts with no reaction firing in the community scope, %d not contributing to a target, %d kept'
+                % (len(inactive), len(useless), len(network['bacteria']) - len(inactive) - len(useless)))
+    if not inactive and not useless:
+        return inactive, useless, None
+
+    return inactive, useless, write_filtered_instance(instance_files, set(inactive) | set(useless))
+
+
+def write_filtered_instance(instance_files, removed, targets=None, seeds=None):
+    """Write an instance without the networks of some symbionts
+
+    Args:
+        instance_files (list): ASP instance files
+        removed (set): symbionts to remove, as written in the instance
+        targets (set, optional): Defaults to None. targets to keep, as written in the instance, all if None
+        seeds (set, optional): Defaults to None. seeds to keep, as written in the instance, all if None
+
+    Returns:
+        str: new instance file
+    """
+    fd, filtered_file = tempfile.mkstemp(suffix='.lp', prefix='miscoto_')
+    with os.fdopen(fd, 'w') as out:
+        for instance_file in instance_files:
+            with open(instance_file, 'r') as f:
+                for line in f:
+                    if line.startswith(NETWORK_PREDICATES):
+                        match = FACT.match(line)
+                        if match and ARGUMENT.findall(match.group(2))[-1] in removed:
+                            continue
+                    elif targets is not None and line.startswith('target('):
+                        match = FACT.match(line)
+                        if match and match.group(2) not in targets:
+                            continue
+                    elif seeds is not None and line.startswith('seed('):
+                        match = FACT.match(line)
+                        if match and match.group(2) not in seeds:
+                            continue
+                    out.write(line if line.endswith('\n') else line + '\n')
+    return filtered_file
+
+
+def network_signatures(instance_files):
+    """Get the network of each symbiont as a set of facts without the name of the symbiont,
+    so that identical networks have equal signatures
+
+    Args:
+        instance_files (list): ASP instance files
+
+    Returns:
+        dict: symbiont -> frozenset of facts
+    """
+    signatures = defaultdict(set)
+    bacteria = []
+    for instance_file in instance_files:
+        with open(instance_file, 'r') as f:
+            for line in f:
+                match = FACT.match(line)
+                if not match or not line.startswith(NETWORK_PREDICATES):
+                    continue
+                arguments = ARGUMENT.findall(match.group(2))
+                if match.group(1) == 'bacteria':
+                    bacteria.append(arguments[0])
+                else:
+                    signatures[arguments[-1]].add((match.group(1),) + tuple(arguments[:-1]))
+    return {bacterium: frozenset(signatures[bacterium]) for bacterium in bacteria}
+
+
+def signature_reactions(signature):
+    """Split the signature of a network into its reactions and its species
+
+    Args:
+        signature (frozenset): facts of the network, see network_signatures
+
+    Returns:
+        (dict, dict): reaction -> (reactants, products, reversible), metabolite -> set of species facts
+    """
+    reactants = defaultdict(set)
+    products = defaultdict(set)
+    reversible = set()
+    species = defaultdict(set)
+    reactions = []
+    for fact in signature:
+        if fact[0] == 'reaction':
+            reactions.append(fact[1])
+        elif fact[0] == 'reversible':
+            reversible.add(fact[1])
+        elif fact[0] == 'reactant':
+            reactants[fact[2]].add(fact[1])
+        elif fact[0] == 'product':
+            products[fact[2]].add(fact[1])
+        elif fact[0] == 'species':
+            species[fact[1]].add(fact)
+    return ({reaction: (frozenset(reactants[reaction]), frozenset(products[reaction]), reaction in reversible) for reaction in reactions},
+            species)
+
+
+def covers(network, other_network):
+    """Check that a network can replace another one in any community: each reaction of the other
+    network is in the network with the same or fewer inputs and the same or more outputs,
+    in both directions if it is reversible, and the metabolites they share have the same species
+
+    Args:
+        network (tuple): reactions and species of the network, see signature_reactions
+        other_network (tuple): reactions and species of the covered network
+
+    Returns:
+        bool: True if network covers other_network
+    """
+    reactions, species = network
+    other_reactions, other_species = other_network
+    for reaction, (reactants, products, reversible) in other_reactions.items():
+        if reaction not in reactions:
+            return False
+        cover_reactants, cover_products, cover_reversible = reactions[reaction]
+        if not (cover_reactants <= reactants and cover_products >= products):
+            return False
+        if reversible and not (cover_reversible and cover_products <= products and cover_reactants >= reactants):
+            return False
+    return all(other_species[metabolite] <= species[metabolite] for metabolite in other_species if metabolite in species)
+
+
+def reduce_instance(instance_files, dominated=False):
+    """Collapse the symbionts with identical networks into one representative and,
+    with dominated, remove the symbionts whose reactions are all covered by another one,
+    with the same or fewer inputs and the same or more outputs. A minimal community never
+    holds two identical symbionts, and a dominated symbiont can always be replaced by the
+    one dominating it.
+
+    Args:
+        instance_files (list): ASP instance files
+        dominated (bool, optional): Defaults to False. remove dominated symbionts
+
+    Returns:
+        (dict, dict, str): representative -> other symbionts with the same network,
+            dominated symbiont -> symbiont dominating it, reduced instance file (None if nothing is removed).
+            Symbionts are given as written in the instance
+    """
+    signatures = network_signatures(instance_files)
+    representatives = {}
+    equivalents = {}
+    for bacterium in sorted(signatures):
+        representative = representatives.setdefault(signatures[bacterium], bacterium)
+        if representative != bacterium:
+            equivalents.setdefault(representative, []).append(bacterium)
+
+    dominators = {}
+    if dominated:
+        networks = {bacterium: signature_reactions(signature) for signature, bacterium in representatives.items()}
+        covering = {bacterium: [other for other in sorted(networks) if other != bacterium and covers(networks[other], networks[bacterium])
+                                and not covers(networks[bacterium], networks[other])]
+                    for bacterium in sorted(networks)}
+        # a dominated symbiont is only removed if one of the symbionts covering it is kept
+        for bacterium, others in covering.items():
+            kept = [other for other in others if not covering[other]]
+            if kept:
+                dominators[bacterium] = kept[0]
+
+    removed = {bacterium for others in equivalents.values() for bacterium in others} | set(dominators)
+    logger.info('%d symbionts identical to another one, %d dominated, %d kept'
+                % (len(removed) - len(dominators), len(dominators), len(signatures) - len(removed)))
+    if not removed:
+        return equivalents, dominators, None
+    return equivalents, dominators, write_filtered_instance(instance_files, removed)
+
+
+def target_components(instance_files, by_name=False):
+    """Group the targets of an instance into independent sub-problems. The symbionts
+    that can contribute to a target are found by walking back from the target through
+    the reactions firing in the community scope. Targets sharing such a symbiont are
+    in the same group, so that the groups share no symbiont, and no metabolite
+    produced by a symbiont. The optimal communities of the instance are then
+    the products of the optimal communities of the groups.
+
+    Args:
+        instance_files (list): ASP instance files
+        by_name (bool, optional): Defaults to False. identify metabolites by name, as in the minexch encodings
+
+    Returns:
+        list: (targets, symbionts) of each group, as written in the instance. Targets no symbiont
+            contributes to are in the first group, symbionts contributing to no target are in none
+    """
+    facts = read_facts(instance_files)
+    network = community_network(facts, by_name)
+    reactions = network['reactions']
+    bacteria = set(network['bacteria'])
+    _, fired = community_scope(network)
+    producers = defaultdict(list)
+    for index, (_, _, outputs) in enumerate(reactions):
+        if fired[index]:
+            for metabolite in outputs:
+                producers[metabolite].append(index)
+    target_names = defaultdict(set)
+    if by_name:
+        for metabolite, name, _, _ in facts['species']:
+            target_names[metabolite].add(name)
+
+    # union-find of the targets, through the symbionts contributing to them
+    targets = sorted({target for target, in facts['target']})
+    parent = {target: target for target in targets}
+
+    def find(target):
+        while parent[target] != target:
+            parent[target] = parent[parent[target]]
+            target = parent[target]
+        return target
+
+    contributors = {}
+    owner = {}
+    for target in targets:
+        relevant = {target} | target_names[target]
+        to_visit = list(relevant)
+        used = set()
+        while to_visit:
+            metabolite = to_visit.pop()
+            for index in producers[metabolite]:
+                if index in used:
+                    continue
+                used.add(index)
+                for input_metabolite in reactions[index][1]:
+                    if input_metabolite not in relevant:
+                        relevant.add(input_metabolite)
+                        to_visit.append(input_metabolite)
+        contributors[target] = {reactions[index][0] for index in used} & bacteria
+        for bacterium in contributors[target]:
+            if bacterium in owner:
+                parent[find(target)] = find(owner[bacterium])
+            else:
+                owner[bacterium] = target
+
+    groups = {}
+    orphans = []
+    for target in targets:
+        if contributors[target]:
+            group = groups.setdefault(find(target), ([], set()))
+            group[0].append(target)
+            group[1].update(contributors[target])
+        else:
+            orphans.append(target)
+    components = list(groups.values()) or [([], set())]
+    components[0][0].extend(orphans)
+    logger.info('%d independent groups of targets' % len(components))
+    return components
+
+
+def greedy_community(instance_files, by_name=False):
+    """Select a community producing all the targets the whole community can produce,
+    adding at each step the symbiont that makes the most targets producible, or that
+    extends the scope the most. The scope of each candidate community is computed by
+    forward chaining from the scope of the previous step.
+    The number of selected symbionts bounds the optimal number of symbionts of the soup model.
+
+    Args:
+        instance_files (list): ASP instance files
+        by_name (bool, optional): Defaults to False. identify metabolites by name, as in the minexch encodings
+
+    Returns:
+        list: selected symbionts, as written in the instance
+    """
+    network = community_network(read_facts(instance_files), by_name)
+    allscope, _ = community_scope(network)
+    goal = network['targets'] & allscope
+    _, useful = useful_organisms(network)
+    organism_reactions = defaultdict(list)
+    for reaction in network['reactions']:
+        organism_reactions[reaction[0]].append(reaction)
+
+    selected = []
+    selected_reactions = [reaction for draft in network['drafts'] for reaction in organism_reactions[draft]]
+    scope, _ = community_scope({'reactions': selected_reactions, 'seeds': network['seeds']})
+    candidates = [bacterium for bacterium in network['bacteria'] if bacterium in useful]
+    while not goal <= scope:
+        best = None
+        for bacterium in candidates:
+            # symbionts with no reaction newly activated by the scope do not extend it
+            if not any(inputs <= scope and not outputs <= scope for _, inputs, outputs in organism_reactions[bacterium]):
+                continue
+            new_scope, _ = community_scope({'reactions': selected_reactions + organism_reactions[bacterium], 'seeds': scope})
+            gain = (len(goal & new_scope), len(new_scope))
+            if best is None or gain > best[0]:
+                best = (gain, bacterium, new_scope)
+        if best is None:
+            break
+        _, bacterium, scope = best
+        selected.append(bacterium)
+        candidates.remove(bacterium)
+        selected_reactions += organism_reactions[bacterium]
+    logger.info('Greedy community of %d symbionts producing %d targets' % (len(selected), len(goal & scope)))
+    return selected
+
+
+def exchange_candidates(instance_files):
+    """Get the metabolite names each organism can give or receive in the exchanges
+    of the minexch encodings. An organism gives the names it produces with a reaction
+    firing in the community scope, or that are seeds. An organism receives the names
+    consumed by one of its reactions, and the host also receives its targets.
+    Other exchanges never belong to an optimal solution: a name received by an organism
+    and given to another one can be given directly by its producer.
+
+    Args:
+        instance_files (list): ASP instance files
+
+    Returns:
+        (set, set): (name, organism) of the producers, (name, organism) of the consumers, as written in the instance
+    """
+    facts = read_facts(instance_files)
+    network = community_network(facts, by_name=True)
+    _, fired = community_scope(network)
+    species_names = {(name, organism) for _, name, _, organism in facts['species']}
+    seeds = {seed for seed, in facts['seed']}
+    targets = {target for target, in facts['target']}
+
+    producers = {(name, organism) for index, (organism, _, outputs) in enumerate(network['reactions']) if fired[index] for name in outputs}
+    producers = (producers & species_names) | {(name, organism) for metabolite, name, _, organism in facts['species'] if metabolite in seeds}
+    consumers = {(name, organism) for organism, inputs, _ in network['reactions'] for name in inputs} & species_names
+    consumers |= {(name, organism) for metabolite, name, _, organism in facts['species'] if organism in network['drafts'] and metabolite in targets}
+    logger.info('%d names can be given and %d received in exchanges, out of %d'
+                % (len(producers), len(consumers), len(species_names)))
+    return producers, consumers
@@ -12,17 +12,302 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
+import functools
+import logging
 import os
+import subprocess
 import tempfile
+import shlex
+import sys
+import time
 import clyngor
-from miscoto import utils
+from miscoto import cache, commons, utils
 
-def get_scopes(instances, encoding):
+try:
+    import clingo
+except ImportError:
+    clingo = None
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def solver_version():
+    """Get the version of the clingo binary used by clyngor
+
+    Returns:
+        str: first line of clingo --version
+    """
+    try:
+        return subprocess.run([clyngor.default_solver().binary_path, '--version'], stdout=subprocess.PIPE, universal_newlines=True).stdout.split('\n')[0]
+    except OSError:
+        return ''
+
+def check_backend(backend):
+    """Check that a solver backend can be used
+
+    Args:
+        backend (str): 'binary' to run clingo in a subprocess, 'module' to use the clingo Python API in-process
+    """
+    if backend not in commons.SOLVER_BACKENDS:
+        logger.critical('Unknown solver backend ' + str(backend) + ', choose among ' + ', '.join(commons.SOLVER_BACKENDS))
+        sys.exit(1)
+    if backend == 'module' and clingo is None:
+        logger.critical('The clingo Python module is required by the module backend, use the binary backend or install it with: pip install clingo')
+        sys.exit(1)
+
+
+def solver_options(options, phase, threads=1, parallel_mode=None):
+    """Add multi-threading to the solver options of a phase of community selection.
+    In compete mode, the threads run the portfolio of the phase, which replaces
+    the configuration and optimization strategy of the options.
+
+    Args:
+        options (str): solver options
+        phase (str): 'optimization', 'consequences' (union and intersection) or 'enumeration'
+        threads (int, optional): Defaults to 1. number of threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+
+    Returns:
+        str: solver options
+    """
+    if threads <= 1:
+        return options
+    if parallel_mode is None:
+        parallel_mode = commons.PHASE_PARALLEL_MODES[phase]
+    if parallel_mode == 'compete' and phase in commons.PORTFOLIOS:
+        kept_options = []
+        tokens = shlex.split(options)
+        while tokens:
+            token = tokens.pop(0)
+            if token in ('--configuration', '--opt-strategy'):
+                tokens.pop(0)
+            elif not token.startswith(('--configuration=', '--opt-strategy=')):
+                kept_options.append(token)
+        options = ' '.join(kept_options + ['--configuration=' + commons.PORTFOLIOS[phase]])
+    return options + ' --parallel-mode=' + str(threads) + ',' + parallel_mode
+
+
+def symbol_value(symbol):
+    """Convert an argument of an atom as clyngor does with discard_quotes
+
+    Args:
+        symbol (clingo.Symbol): argument
+
+    Returns:
+        int or str: number, string without quotes, or text of other terms
+    """
+    if symbol.type == clingo.SymbolType.Number:
+        return symbol.number
+    if symbol.type == clingo.SymbolType.String:
+        return symbol.string
+    return str(symbol)
+
+
+def model_by_arity(symbols):
+    """Group the atoms of a model as clyngor does with by_arity
+
+    Args:
+        symbols (list): atoms of the model
+
+    Returns:
+        dict: arguments of the atoms by predicate, (predicate, arity) and 'predicate/arity'
+    """
+    atoms = {}
+    for symbol in symbols:
+        args = tuple(symbol_value(arg) for arg in symbol.arguments)
+        atoms.setdefault((symbol.name, len(args)), set()).add(args)
+    model = {}
+    for (name, arity), all_args in atoms.items():
+        model[name] = model[name, arity] = model[name + '/' + str(arity)] = frozenset(all_args)
+    return model
+
+
+def handle_models(ctl, time_limit=0, on_model=None):
+    """Solve with a clingo Control, within a time limit.
+    Each model is yielded when the next one is found, so that the last model
+    of a search that was not interrupted is flagged as optimal.
+
+    Args:
+        ctl (clingo.Control): grounded Control
+        time_limit (int, optional): Defaults to 0. time limit of the solve in seconds, 0 = no limit
+        on_model (function, optional): Defaults to None. called with each model and its cost as soon as it is found
+
+    Yields:
+        (dict, tuple, bool): model grouped by arity, its cost and whether its optimality is proven
+    """
+    deadline = time.time() + time_limit
+    interrupted = False
+    previous = None
+    with ctl.solve(yield_=True, async_=True) as handle:
+        while True:
+            handle.resume()
+            if time_limit and not handle.wait(max(deadline - time.time(), 0)):
+                handle.cancel()
+                interrupted = True
+                break
+            model = handle.model()
+            if model is None:
+                break
+            current = (model_by_arity(model.symbols(shown=True)), tuple(model.cost), model.optimality_proven)
+            if on_model:
+                on_model(current[0], current[1])
+            if previous:
+                yield previous
+            previous = current
+        exhausted = handle.get().exhausted
+    if previous:
+        model, cost, optimality_proven = previous
+        yield model, cost, optimality_proven or (exhausted and not interrupted and len(cost) > 0)
+
+
+def clingo_models(files, options='', nb_model=0, time_limit=0, on_model=None):
+    """Solve ASP files with the clingo Python API, in-process.
+    Files can be ASP programs or groundings in aspif format.
+
+    Args:
+        files (list): ASP files
+        options (str, optional): Defaults to ''. solver options
+        nb_model (int, optional): Defaults to 0. number of models to compute, 0 = all
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+        on_model (function, optional): Defaults to None. called with each model and its cost as soon as it is found
+
+    Yields:
+        (dict, tuple, bool): model grouped by arity, its cost and whether its optimality is proven
+    """
+    ctl = clingo.Control(shlex.split(options) + ['--models=' + str(nb_model)], logger=lambda code, message: None)
+    for filepath in files:
+        ctl.load(filepath)
+    ctl.ground([('base', [])])
+    yield from handle_models(ctl, time_limit, on_model)
+
+
+def grounding_file(grounding):
+    """Write a grounding in a temporary file, to be loaded by the clingo Python API
+
+    Args:
+        grounding (str): grounded model
+
+    Returns:
+        str: aspif file, to be deleted by the caller
+    """
+    fd, aspif_file = tempfile.mkstemp(suffix='.aspif', prefix='miscoto_')
+    with os.fdopen(fd, 'w') as f:
+        f.write(grounding)
+    return aspif_file
+
+
+def models_with_optimality(files=None, grounding=None, options='', nb_model=0, backend='binary', time_limit=0, on_model=None):
+    """Solve ASP files or a grounding with a backend, within a time limit
+
+    Args:
+        files (list, optional): Defaults to None. ASP files
+        grounding (str, optional): Defaults to None. grounded model, used if files is None
+        options (str, optional): Defaults to ''. solver options
+        nb_model (int, optional): Defaults to 0. number of models to compute, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+        on_model (function, optional): Defaults to None. called with each model and its cost when it is found
+
+    Yields:
+        (dict, tuple, bool): model grouped by arity, its cost and whether its optimality is proven
+    """
+    check_backend(backend)
+    if backend == 'module':
+        aspif_file = grounding_file(grounding) if files is None else None
+        try:
+            yield from clingo_models(files if files is not None else [aspif_file], options, nb_model, time_limit, on_model)
+        finally:
+            if aspif_file:
+                os.remove(aspif_file)
+    else:
+        if files is None:
+            models = clyngor.solve_from_grounded(grounding, options=options, nb_model=nb_model, time_limit=time_limit, use_clingo_module=False)
+        else:
+            models = clyngor.solve(files, options=options, nb_model=nb_model, time_limit=time_limit, use_clingo_module=False)
+        for model, cost, optimality_proven in models.discard_quotes.by_arity.with_optimality:
+            if on_model:
+                on_model(model, cost)
+            yield model, cost, optimality_proven
+
+
+def models_with_optimization(files=None, grounding=None, options='', nb_model=0, backend='binary'):
+    """Solve ASP files or a grounding with a backend
+
+    Args:
+        files (list, optional): Defaults to None. ASP files
+        grounding (str, optional): Defaults to None. grounded model, used if files is None
+        options (str, optional): Defaults to ''. solver options
+        nb_model (int, optional): Defaults to 0. number of models to compute, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+
+    Yields:
+        (dict, tuple): model grouped by arity and its cost
+    """
+    for model, cost, _ in models_with_optimality(files, grounding, options, nb_model, backend):
+        yield model, cost
+
+
+def optimal_models(files=None, grounding=None, options='', nb_model=0, backend='binary', time_limit=0):
+    """Get the optimal models of ASP files or of a grounding, solved with --opt-mode=optN
+
+    Args:
+        files (list, optional): Defaults to None. ASP files
+        grounding (str, optional): Defaults to None. grounded model, used if files is None
+        options (str, optional): Defaults to ''. solver options, including --opt-mode=optN
+        nb_model (int, optional): Defaults to 0. number of models to compute, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+
+    Returns:
+        generator: optimal models grouped by arity
+    """
+    check_backend(backend)
+    if backend == 'module':
+        return optimal_clingo_models(files, grounding, options, nb_model, time_limit)
+    if files is None:
+        models = clyngor.solve_from_grounded(grounding, options=options, nb_model=nb_model, time_limit=time_limit, use_clingo_module=False)
+    else:
+        models = clyngor.solve(files, options=options, nb_model=nb_model, time_limit=time_limit, use_clingo_module=False)
+    return clyngor.opt_models_from_clyngor_answers(models.by_arity.discard_quotes)
+
+
+def optimal_clingo_models(files, grounding, options, nb_model, time_limit=0):
+    """Generator of the optimal models found by the clingo Python API, see optimal_models
+    """
+    aspif_file = grounding_file(grounding) if files is None else None
+    try:
+        for model, _, optimality_proven in clingo_models(files if files is not None else [aspif_file], options, nb_model, time_limit):
+            if optimality_proven:
+                yield model
+    finally:
+        if aspif_file:
+            os.remove(aspif_file)
+
+
+def last_model(models):
+    """Get the last model of a solve, the optimal one or the consequences in brave and cautious modes
+
+    Args:
+        models (iterable): models of the solve
+
+    Returns:
+        last model, None if there is no model
+    """
+    best_model = None
+    for model in models:
+        best_model = model
+    return best_model
+
+
+def get_scopes(instances, encoding, backend='binary', options=''):
     """Get metabolic scope of a microbiota
     
     Args:
         instance_f (list): list containing ASP instance files paths
         encoding (str): ASP model encoding
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        options (str, optional): Defaults to ''. solver options, e.g. constants of the encoding
     
     Returns:
         TermSet: ASP model
@@ -30,175 +315,403 @@ def get_scopes(instances, encoding):
     # add the encoding to the list of instances
     prg = instances
     prg.append(encoding)
-    options = ''
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity:
-        best_model = model
+    best_model = last_model(models_with_optimization(files=prg, options=options, backend=backend))
+    if best_model is None:
+        return None
+    return best_model[0]
 
-    return best_model
 
 
+def get_grounded_communities_from_file(instances, encoding, cache_dir=None, options=''):
+    """Ground the model, from a file.
+    With a cache, the grounding of the same files with the same options is read
+    from the cache instead of being computed again.
 
-def get_grounded_communities_from_file(instances, encoding):
-    """Ground the model, from a file
-    
     Args:
         instances (list): list containing ASP instance files paths
         encoding (str): ASP model encoding
-    
+        cache_dir (str, optional): Defaults to None. cache of groundings, not used if None
+        options (str, optional): Defaults to ''. grounder options
+
     Returns:
         bytes: grounded model
     """
     prg = instances
     prg.append(encoding)
-    grounding = clyngor.grounded_program(prg)
+    if cache_dir:
+        key = cache.grounding_key(prg, options, solver_version())
+        grounding = cache.get_grounding(cache_dir, key)
+        if grounding is not None:
+            logger.info('Grounding read from cache ' + cache_dir)
+            return grounding
+
+    grounding = clyngor.grounded_program(prg, options=options)
+
+    if cache_dir:
+        try:
+            cache.put_grounding(cache_dir, key, grounding)
+        except OSError:
+            pass
+        nb_evicted, evicted_size = cache.prune_section(cache_dir, cache.GROUNDINGS_DIR, commons.CACHE_GROUNDINGS_MAX_SIZE)
+        if nb_evicted:
+            logger.info('%d entries (%d bytes) evicted from cache %s' % (nb_evicted, evicted_size, cache_dir))
 
     return grounding
 
-def get_communities_from_g(grounding):
-    """Get optimal community, from grounding
+class CommunitySession:
+    """Solver session on the grounding of a community selection problem, with the
+    clingo Python API. One clingo Control is kept alive between the optimization,
+    union, intersection and enumeration solves: the grounding is loaded once, and
+    the optimum and learned nogoods of a solve are reused by the next ones.
+    The enumeration mode, optimization mode and bound and the number of models
+    are switched between solves through the configuration of the Control.
+    """
+
+    def __init__(self, grounding, threads=1, parallel_mode=None):
+        """Load a grounding in a new clingo Control. With several threads, the
+        portfolio of the optimization is used by all the solves in compete mode.
+
+        Args:
+            grounding (str): grounded model
+            threads (int, optional): Defaults to 1. number of solver threads
+            parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of each phase if None
+        """
+        check_backend('module')
+        self.threads = threads
+        self.parallel_mode = parallel_mode
+        options = solver_options('--configuration=jumpy --opt-strategy=usc,5', 'optimization', threads, parallel_mode)
+        # the optimization strategy of each thread is set by the portfolio
+        self.portfolio = '--configuration=jumpy' not in options
+        self.ctl = clingo.Control(shlex.split(options), logger=lambda code, message: None)
+        aspif_file = grounding_file(grounding)
+        try:
+            self.ctl.load(aspif_file)
+        finally:
+            os.remove(aspif_file)
+        self.ctl.ground([('base', [])])
+        self.optimum = None
+
+    def opt_mode(self):
+        """Get the optimization mode enumerating optimal models, bounded by the optimum if known
+
+        Returns:
+            str: optN optimization mode
+        """
+        if self.optimum:
+            return 'optN,' + self.optimum
+        return 'optN'
+
+    def solve(self, phase, enum_mode, opt_mode, opt_strategy='usc,5', nb_model=0, time_limit=0, on_model=None):
+        """Solve the grounding with the given configuration. The optimum is
+        recorded as soon as a model is proven optimal.
+
+        Args:
+            phase (str): 'optimization', 'consequences' or 'enumeration', for the parallel mode
+            enum_mode (str): enumeration mode, auto, brave or cautious
+            opt_mode (str): optimization mode
+            opt_strategy (str, optional): Defaults to 'usc,5'. optimization strategy, unless set by a portfolio
+            nb_model (int, optional): Defaults to 0. number of models to compute, 0 = all
+            time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+            on_model (function, optional): Defaults to None. called with each model and its cost as soon as it is found
+
+        Yields:
+            (dict, tuple, bool): model grouped by arity, its cost and whether its optimality is proven
+        """
+        configuration = self.ctl.configuration
+        configuration.solve.enum_mode = enum_mode
+        configuration.solve.opt_mode = opt_mode
+        configuration.solve.models = str(nb_model)
+        if self.threads > 1:
+            configuration.solve.parallel_mode = str(self.threads) + ',' + (self.parallel_mode or commons.PHASE_PARALLEL_MODES[phase])
+        if not self.portfolio:
+            configuration.solver.opt_strategy = opt_strategy
+        for model, cost, optimality_proven in handle_models(self.ctl, time_limit, on_model):
+            if optimality_proven:
+                self.optimum = ','.join(map(str, cost))
+            yield model, cost, optimality_proven
+
+    def set_targets(self, targets):
+        """Set the targets of the next solves, on a grounding whose targets are
+        external atoms, see commons.ASP_SRC_PER_TARGET
+
+        Args:
+            targets (list): targets, as written in the instance
+        """
+        wanted = {clingo.parse_term(target) for target in targets}
+        for atom in self.ctl.symbolic_atoms.by_signature('target', 1):
+            self.ctl.assign_external(atom.literal, atom.symbol.arguments[0] in wanted)
+
+    def get_communities(self, time_limit=0, on_model=None, bound=None, heuristic=False):
+        """Get optimal community, see get_communities_from_g_with_optimality
+
+        Args:
+            time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+            on_model (function, optional): Defaults to None. called with each improving solution and its score
+            bound (str, optional): Defaults to None. initial bound of the optimization
+            heuristic (bool, optional): Defaults to False. use the #heuristic directives of the grounding
+
+        Returns:
+            (dict, tuple, bool): best solution found, its score and whether its optimality is proven
+        """
+        opt_mode = 'opt'
+        if bound:
+            opt_mode += ',' + bound
+        previous_heuristic = self.ctl.configuration.solver.heuristic
+        if heuristic:
+            self.ctl.configuration.solver.heuristic = 'Domain'
+        try:
+            best_model = last_model(self.solve('optimization', 'auto', opt_mode, 'usc,oll', time_limit=time_limit, on_model=on_model))
+        finally:
+            # the #heuristic directives only guide the optimization, not the next solves
+            self.ctl.configuration.solver.heuristic = previous_heuristic
+        if best_model:
+            # even if not proven optimal, the score bounds the next solves
+            self.optimum = ','.join(map(str, best_model[1]))
+        return best_model
+
+    def get_union_communities(self, time_limit=0):
+        """Get union of all community solutions, see get_union_communities_from_g_with_optimality
+
+        Args:
+            time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+
+        Returns:
+            (dict, tuple, bool): union, the optimal score and whether the union is complete
+        """
+        return last_model(self.solve('consequences', 'brave', self.opt_mode(), time_limit=time_limit))
+
+    def get_intersection_communities(self, time_limit=0):
+        """Get intersection of all community solutions, see get_intersection_communities_from_g_with_optimality
+
+        Args:
+            time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+
+        Returns:
+            (dict, tuple, bool): intersection, the optimal score and whether the intersection is complete
+        """
+        return last_model(self.solve('consequences', 'cautious', self.opt_mode(), time_limit=time_limit))
+
+    def get_all_communities(self, nmodels=0, time_limit=0):
+        """Get all optimal communities, see get_all_communities_from_g
+
+        Args:
+            nmodels (int, optional): Defaults to 0. number of models to compute, 0 = all
+            time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+
+        Yields:
+            dict: optimal solution
+        """
+        for model, _, optimality_proven in self.solve('enumeration', 'auto', self.opt_mode(), nb_model=nmodels, time_limit=time_limit):
+            if optimality_proven:
+                yield model
+
+
+def get_communities_from_g_with_optimality(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0, on_model=None, bound=None, heuristic=False):
+    """Get optimal community, from grounding, with whether the search completed
     
     Args:
         grounding (bytes): grounded model
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+        on_model (function, optional): Defaults to None. called with each improving solution and its score
+        bound (str, optional): Defaults to None. initial bound of the optimization
+        heuristic (bool, optional): Defaults to False. use the #heuristic directives of the grounding
     
     Returns:
-        TermSet: solution
+        (TermSet, tuple, bool): best solution found, its score and whether its optimality is proven
     """
     options = '--configuration jumpy --opt-strategy=usc,oll'
-    best_model = None
-    models = clyngor.solve_from_grounded(grounding, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
-    return best_model
+    if heuristic:
+        options += ' --heuristic=Domain'
+    if bound:
+        options += ' --opt-mode=opt,' + bound
+    options = solver_options(options, 'optimization', threads, parallel_mode)
+    return last_model(models_with_optimality(grounding=grounding, options=options, backend=backend, time_limit=time_limit, on_model=on_model))
 
+def get_communities_from_g(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0, on_model=None, bound=None, heuristic=False):
+    """Get optimal community, from grounding, see get_communities_from_g_with_optimality
+    
+    Args:
+        grounding (bytes): grounded model
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+        on_model (function, optional): Defaults to None. called with each improving solution and its score
+        bound (str, optional): Defaults to None. initial bound of the optimization
+        heuristic (bool, optional): Defaults to False. use the #heuristic directives of the grounding
+    
+    Returns:
+        (TermSet, tuple): best solution found and its score, None if there is no model
+    """
+    best_model = get_communities_from_g_with_optimality(grounding, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit, on_model=on_model, bound=bound, heuristic=heuristic)
+    return best_model[:2] if best_model else None
 
-def get_communities(lp_instance, encoding):
+
+def get_communities(lp_instance, encoding, backend='binary', threads=1, parallel_mode=None):
     """Get optimal community, from TermSet
     
     Args:
         lp_instance (TermSet): microbiota model
         encoding (str): ASP model encoding
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
     
     Returns:
         TermSet: solution
     """
     options = '--configuration jumpy --opt-strategy=usc,5'
+    options = solver_options(options, 'optimization', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
-
-    return best_model
+    return last_model(models_with_optimization(files=prg, options=options, backend=backend))
 
-def get_intersection_communities_from_g(grounding, optimum):
-    """Get intersection of solutions, from grounding
+def get_intersection_communities_from_g_with_optimality(grounding, optimum, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get intersection of solutions, from grounding, with whether the search completed
     
     Args:
         grounding (bytes): grounded model
         optimum (str): optimal score
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
     
     Returns:
-        TermSet: intersection
+        (TermSet, tuple, bool): intersection, the optimal score and whether the search completed
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode cautious --opt-mode=optN,' +str(optimum)
-    models = clyngor.solve_from_grounded(grounding, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
+    options = solver_options(options, 'consequences', threads, parallel_mode)
+    return last_model(models_with_optimality(grounding=grounding, options=options, backend=backend, time_limit=time_limit))
 
-    return best_model
+def get_intersection_communities_from_g(grounding, optimum, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get intersection of solutions, from grounding, see get_intersection_communities_from_g_with_optimality
+    
+    Args:
+        grounding (bytes): grounded model
+        optimum (str): optimal score
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+    
+    Returns:
+        (TermSet, tuple): intersection and the optimal score, None if there is no model
+    """
+    best_model = get_intersection_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    return best_model[:2] if best_model else None
 
-def get_intersection_communities_from_g_noopti(grounding):
-    """Get intersection of solutions, from grounding, without optimal score
+def get_intersection_communities_from_g_noopti_with_optimality(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get intersection of solutions, from grounding, without optimal score, with whether the search completed
     
     Args:
         grounding (bytes): grounded model
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
     
     Returns:
-        TermSet: intersection
+        (TermSet, tuple, bool): intersection, the optimal score and whether the search completed
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode cautious --opt-mode=optN'
-    models = clyngor.solve_from_grounded(grounding, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
+    options = solver_options(options, 'consequences', threads, parallel_mode)
+    return last_model(models_with_optimality(grounding=grounding, options=options, backend=backend, time_limit=time_limit))
 
-    return best_model
+def get_intersection_communities_from_g_noopti(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get intersection of solutions, from grounding, without optimal score, see get_intersection_communities_from_g_noopti_with_optimality
+    
+    Args:
+        grounding (bytes): grounded model
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+    
+    Returns:
+        (TermSet, tuple): intersection and the optimal score, None if there is no model
+    """
+    best_model = get_intersection_communities_from_g_noopti_with_optimality(grounding, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    return best_model[:2] if best_model else None
 
-def get_intersection_communities_opti(lp_instance, optimum, encoding):
+def get_intersection_communities_opti(lp_instance, optimum, encoding, backend='binary', threads=1, parallel_mode=None):
     """Get intersection of solutions, from TermSet
     
     Args:
         lp_instance (TermSet): microbiota model
         optimum (str): optimal score
         encoding (str): ASP model encoding
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
 
     Returns:
         TermSet: intersection
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode cautious --opt-mode=optN,' + str(optimum)
+    options = solver_options(options, 'consequences', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
-
-    return best_model
+    return last_model(models_with_optimization(files=prg, options=options, backend=backend))
 
-def get_intersection_communities(lp_instance, encoding):
+def get_intersection_communities(lp_instance, encoding, backend='binary', threads=1, parallel_mode=None):
     """Get intersection of solutions, from TermSet
     
     Args:
         lp_instance (TermSet): microbiota model
         optimum (str): optimal score
         encoding (str): ASP model encoding
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
 
     Returns:
         TermSet: intersection
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode cautious --opt-mode=optN'
+    options = solver_options(options, 'consequences', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
+    return last_model(models_with_optimization(files=prg, options=options, backend=backend))
 
-    return best_model
-
-def get_all_communities_from_g(grounding, optimum, nmodels=0):
+def get_all_communities_from_g(grounding, optimum, nmodels=0, backend='binary', threads=1, parallel_mode=None, time_limit=0):
     """Get all optimal communities, from grounding
     
     Args:
         grounding (bytes): grounded model
         optimum (str): optimal score
         nmodels (int, optional): Defaults to 0. number of models to compute, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
     
     Returns:
         list: list of Termsets
     """
     options = '--configuration handy --opt-strategy=usc,5 --opt-mode=optN,' +str(optimum)
-    models = clyngor.solve_from_grounded(grounding, options=options, nb_model=nmodels, use_clingo_module=False).by_arity.discard_quotes
-    opt_models = clyngor.opt_models_from_clyngor_answers(models)
-
-    return opt_models
+    options = solver_options(options, 'enumeration', threads, parallel_mode)
+    return optimal_models(grounding=grounding, options=options, nb_model=nmodels, backend=backend, time_limit=time_limit)
 
-def get_all_communities_from_g_noopti(grounding, nmodels=0):
+def get_all_communities_from_g_noopti(grounding, nmodels=0, backend='binary', threads=1, parallel_mode=None, time_limit=0):
     """Get all optimal communities, from grounding, without optimal score
     
     Args:
         grounding (bytes): grounded model
         nmodels (int, optional): Defaults to 0. number of models, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
 
     Returns:
         list: list of TermSets
     """
     options = '--configuration handy --opt-strategy=usc,5 --opt-mode=optN'
-    models = clyngor.solve_from_grounded(grounding, options=options, nb_model=nmodels, use_clingo_module=False).by_arity.discard_quotes
-    opt_models = clyngor.opt_models_from_clyngor_answers(models)
+    options = solver_options(options, 'enumeration', threads, parallel_mode)
+    return optimal_models(grounding=grounding, options=options, nb_model=nmodels, backend=backend, time_limit=time_limit)
 
-    return opt_models
-
-def get_all_communities_opti(lp_instance, optimum, encoding, nmodels=0):
+def get_all_communities_opti(lp_instance, optimum, encoding, nmodels=0, backend='binary', threads=1, parallel_mode=None):
     """Get all communities, from TermSet
 
     Args:
@@ -206,18 +719,19 @@ def get_all_communities_opti(lp_instance, optimum, encoding, nmodels=0):
         optimum (str): optimal score
         encoding (str): ASP model encoding file
         nmodels (int, optional): Defaults to 0. number of models, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
 
     Returns:
         list: list of TermSets
     """
     options = '--configuration handy --opt-strategy=usc,0 --opt-mode=optN,' + str(optimum)
+    options = solver_options(options, 'enumeration', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    models = clyngor.solve(prg, options=options, nb_model=nmodels, use_clingo_module=False).by_arity.discard_quotes
-    opt_models = clyngor.opt_models_from_clyngor_answers(models)
-
-    return opt_models
+    return optimal_models(files=prg, options=options, nb_model=nmodels, backend=backend)
 
-def get_all_communities(lp_instance, encoding, nmodels=0):
+def get_all_communities(lp_instance, encoding, nmodels=0, backend='binary', threads=1, parallel_mode=None):
     """Get all communities, from TermSet
     
     Args:
@@ -225,90 +739,123 @@ def get_all_communities(lp_instance, encoding, nmodels=0):
         optimum (str): optimal score
         encoding (str): ASP model encoding file
         nmodels (int, optional): Defaults to 0. number of models, 0 = all
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
     
     Returns:
         list: list of TermSets
     """
     options = '--configuration handy --opt-strategy=usc,0 --opt-mode=optN'
+    options = solver_options(options, 'enumeration', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    opt_models = clyngor.opt_models_from_clyngor_answers(clyngor.solve(prg, options=options, nb_model=nmodels, use_clingo_module=False).by_arity.discard_quotes)
+    return optimal_models(files=prg, options=options, nb_model=nmodels, backend=backend)
 
-    return opt_models
-
-def get_union_communities_from_g(grounding, optimum):
-    """Get union of all community solutions
+def get_union_communities_from_g_with_optimality(grounding, optimum, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get union of all community solutions, with whether the search completed
     
     Args:
         grounding (bytes): grounded model
         optimum (str): optimal score
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
     
     Returns:
-        TermSet: union
+        (TermSet, tuple, bool): union, the optimal score and whether the search completed
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode=brave --opt-mode=optN,' + str(optimum)
-    models = clyngor.solve_from_grounded(grounding, options=options, use_clingo_module=False)
-    best_model = None
-    for model in models.by_arity.discard_quotes.with_optimization:
-        best_model = model
+    options = solver_options(options, 'consequences', threads, parallel_mode)
+    return last_model(models_with_optimality(grounding=grounding, options=options, backend=backend, time_limit=time_limit))
 
-    return best_model
+def get_union_communities_from_g(grounding, optimum, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get union of all community solutions, see get_union_communities_from_g_with_optimality
+    
+    Args:
+        grounding (bytes): grounded model
+        optimum (str): optimal score
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+    
+    Returns:
+        (TermSet, tuple): union and the optimal score, None if there is no model
+    """
+    best_model = get_union_communities_from_g_with_optimality(grounding, optimum, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    return best_model[:2] if best_model else None
 
-def get_union_communities_from_g_noopti(grounding):
-    """Get union of all community solutions, from grounding, without optimal score
+def get_union_communities_from_g_noopti_with_optimality(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get union of all community solutions, from grounding, without optimal score, with whether the search completed
     
     Args:
         grounding (bytes): grounded instance
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
     
     Returns:
-        TermSet: union
+        (TermSet, tuple, bool): union, the optimal score and whether the search completed
     """
     options = '--configuration jumpy --opt-strategy=usc,5 --enum-mode brave --opt-mode=optN'
-    models = clyngor.solve_from_grounded(grounding, options=options, use_clingo_module=False)
-    best_model = None
-    for model in models.by_arity.discard_quotes.with_optimization:
-        best_model = model
+    options = solver_options(options, 'consequences', threads, parallel_mode)
+    return last_model(models_with_optimality(grounding=grounding, options=options, backend=backend, time_limit=time_limit))
 
-    return best_model
+def get_union_communities_from_g_noopti(grounding, backend='binary', threads=1, parallel_mode=None, time_limit=0):
+    """Get union of all community solutions, from grounding, without optimal score, see get_union_communities_from_g_noopti_with_optimality
+    
+    Args:
+        grounding (bytes): grounded instance
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
+        time_limit (int, optional): Defaults to 0. time limit in seconds, 0 = no limit
+    
+    Returns:
+        (TermSet, tuple): union and the optimal score, None if there is no model
+    """
+    best_model = get_union_communities_from_g_noopti_with_optimality(grounding, backend=backend, threads=threads, parallel_mode=parallel_mode, time_limit=time_limit)
+    return best_model[:2] if best_model else None
 
-def get_union_communities_optimum(lp_instance, optimum, encoding):
+def get_union_communities_optimum(lp_instance, optimum, encoding, backend='binary', threads=1, parallel_mode=None):
     """Get union of community solutions, from TermSet
 
     Args:
         lp_instance (TermSet): microbiota model
         optimum (str): optimal score
         encoding (str): ASP encoding model file
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
     
     Returns:
         TermSet: union
     """
     options ='--configuration jumpy --opt-strategy=usc,5 --enum-mode=brave --opt-mode=optN --opt-bound='+str(optimum)
+    options = solver_options(options, 'consequences', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
-
-    return best_model
+    return last_model(models_with_optimization(files=prg, options=options, backend=backend))
 
-def get_union_communities(lp_instance, encoding):
+def get_union_communities(lp_instance, encoding, backend='binary', threads=1, parallel_mode=None):
     """Get union of community solutions, from TermSet
 
     Args:
         lp_instance (TermSet): microbiota model
         optimum (str): optimal score
         encoding (str): ASP encoding model file
+        backend (str, optional): Defaults to 'binary'. solver backend, see check_backend
+        threads (int, optional): Defaults to 1. number of solver threads
+        parallel_mode (str, optional): Defaults to None. 'compete' or 'split', default mode of the phase if None
     
     Returns:
         TermSet: union
     """
     options ='--configuration jumpy --opt-strategy=usc,5 --enum-mode=brave --opt-mode=optN'
+    options = solver_options(options, 'consequences', threads, parallel_mode)
     prg = [encoding, lp_instance]
-    best_model = None
-    models = clyngor.solve(prg, options=options, use_clingo_module=False)
-    for model in models.discard_quotes.by_arity.with_optimization:
-        best_model = model
-
-    return best_model
+    return last_model(models_with_optimization(files=prg, options=options, backend=backend))
 
 def get_unproducible(draft, seeds, targets, encoding):
     """Get unproducible targets in a microbiota
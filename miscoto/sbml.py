@@ -15,12 +15,18 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
+import logging
 import re
 import sys
 import xml.etree.ElementTree as etree
 from xml.etree.ElementTree import XML, fromstring, tostring
 from clyngor.as_pyasp import TermSet, Atom
 
+logger = logging.getLogger(__name__)
+
+# Version of the facts produced by the readers, to be increased when they change
+READER_VERSION = 2
+
 def get_model(sbml):
     """Get the model of a SBML
 
@@ -197,56 +203,70 @@ def readSBMLnetwork_symbionts(filename, name) :
 
     return lpfacts
 
-def readSBMLnetwork_symbionts_clyngor(filename, name) :
-    """Read a SBML metabolic network
-    
+def local_tag(element):
+    """Get the tag of an element without its namespace
+
     Args:
-        filename (str): SBML file
-        name (str): suffix to identify the type of network
-    
+        element (xml.etree.ElementTree.Element): SBML element
+
     Returns:
-        TermSet: metabolic model
+        str: tag of the element
     """
-    all_atoms = set()
+    if element.tag[0] == "{":
+        return element.tag[1:].split("}")[1]
+    return element.tag
 
-    tree = etree.parse(filename)
-    sbml = tree.getroot()
-    model = get_model(sbml)
-
-    listOfReactions = get_listOfReactions(model)
-    if listOfReactions is None:
-        logger.critical('No reaction in SBML '+filename)
-        sys.exit(1)
-    for e in listOfReactions:
-        if e.tag[0] == "{":
-            uri, tag = e.tag[1:].split("}")
-        else:
-            tag = e.tag
-        if tag == "reaction":
-            reactionId = e.attrib.get("id")
-            all_atoms.add(Atom('reaction', ["\""+reactionId+"\"", "\""+name+"\""])) 
-            if(e.attrib.get("reversible")=="true"):
-                all_atoms.add(Atom('reversible', ["\""+reactionId+"\"", "\""+name+"\""]))
+def iterSBMLnetwork_symbionts(filename, name) :
+    """Stream the facts of a SBML metabolic network.
+    The file is read with iterparse and every element is released once its
+    facts are emitted, so that memory does not depend on the size of the model.
+    Facts are the same as the ones of readSBMLnetwork_symbionts_clyngor.
 
-            listOfReactants = get_listOfReactants(e)
-            # if listOfReactants == None :
-            #     print("\n Warning:" + reactionId + "listOfReactants=None")
-            if listOfReactants != None:
-                for r in listOfReactants:
-                    all_atoms.add(Atom('reactant', ["\""+r.attrib.get("species").replace('"','')+"\"", "\""+reactionId+"\"", "\""+name+"\""])) #,"\""+name+"\""
+    Args:
+        filename (str): SBML file
+        name (str): suffix to identify the type of network
 
-            listOfProducts = get_listOfProducts(e)
-            # if listOfProducts == None:
-            #     print("\n Warning:" + reactionId + "listOfProducts=None")
-            if listOfProducts != None:
-                for p in listOfProducts:
-                    all_atoms.add(Atom('product', ["\""+p.attrib.get("species").replace('"','')+"\"", "\""+reactionId+"\"", "\""+name+"\""])) #,"\""+name+"\""
-    listofspecies = get_listOfSpecies(model)
-    for e in listofspecies:
-        if e.tag[0] == "{":
-            uri, tag = e.tag[1:].split("}")
-        else: tag = e.tag
-        if tag == "species":
+    Yields:
+        (str, list): predicate and quoted arguments of each fact
+    """
+    quoted_name = "\""+name+"\""
+    # context of each open element: which part of the model it belongs to
+    contexts = []
+    elements = []
+    # only the first model, list of reactions, list of species... are read
+    found = set()
+    for event, e in etree.iterparse(filename, events=("start", "end")):
+        if event == "end":
+            contexts.pop()
+            elements.pop()
+            if elements:
+                # the element is processed, detach it from its parent
+                elements[-1].remove(e)
+            continue
+        parent = contexts[-1] if contexts else "document"
+        tag = local_tag(e)
+        context = None
+        if parent == "document":
+            context = "sbml"
+        elif parent == "sbml" and tag == "model" and "model" not in found:
+            context = "model"
+        elif parent == "model" and tag in ("listOfReactions", "listOfSpecies") and tag not in found:
+            context = tag
+        elif parent == "listOfReactions" and tag == "reaction":
+            context = "reaction"
+            found.discard("listOfReactants")
+            found.discard("listOfProducts")
+            reactionId = e.attrib.get("id")
+            yield 'reaction', ["\""+reactionId+"\"", quoted_name]
+            if e.attrib.get("reversible") == "true":
+                yield 'reversible', ["\""+reactionId+"\"", quoted_name]
+        elif parent == "reaction" and tag in ("listOfReactants", "listOfProducts") and tag not in found:
+            context = tag
+        elif parent == "listOfReactants":
+            yield 'reactant', ["\""+e.attrib.get("species").replace('"','')+"\"", "\""+reactionId+"\"", quoted_name]
+        elif parent == "listOfProducts":
+            yield 'product', ["\""+e.attrib.get("species").replace('"','')+"\"", "\""+reactionId+"\"", quoted_name]
+        elif parent == "listOfSpecies" and tag == "species":
             try:
                 speciesId = e.attrib.get("id").replace('"','')
             except AttributeError:
@@ -255,11 +275,58 @@ def readSBMLnetwork_symbionts_clyngor(filename, name) :
                 speciesNm = e.attrib.get("name").replace('"','')
             except AttributeError:
                 sys.exit("Empty name field for species in the following SBML: " + filename)
-            try:
-                compartment = e.attrib.get("compartment")
-            except AttributeError:
-                sys.exit("Empty compartment field for species in the following SBML: " + filename)
-            all_atoms.add(Atom('species', ["\""+speciesId+"\"", "\""+speciesNm+"\"", "\""+compartment+"\"", "\""+name+"\""]))
+            compartment = e.attrib.get("compartment")
+            yield 'species', ["\""+speciesId+"\"", "\""+speciesNm+"\"", "\""+compartment+"\"", quoted_name]
+        if context is not None:
+            found.add(context)
+        contexts.append(context)
+        elements.append(e)
+
+    if "listOfReactions" not in found:
+        logger.critical('No reaction in SBML '+filename)
+        sys.exit(1)
+    if "listOfSpecies" not in found:
+        sys.exit("Invalid SBML (missing species or listOfSpecies) " + filename)
+
+def writeSBMLnetwork_symbionts(filename, name, output) :
+    """Write the facts of a SBML metabolic network in a file, as they are read.
+    No Atom nor TermSet is built: fact lines are written in the order of the
+    document, with the quoting of readSBMLnetwork_symbionts_clyngor. A species
+    referenced several times in a reaction is written once.
+
+    Args:
+        filename (str): SBML file
+        name (str): suffix to identify the type of network
+        output (file): opened file where facts are written
+
+    Returns:
+        int: number of facts written
+    """
+    nb_facts = 0
+    reaction_references = set()
+    for predicate, args in iterSBMLnetwork_symbionts(filename, name):
+        line = predicate + '(' + ','.join(args) + ').\n'
+        if predicate == 'reaction':
+            reaction_references.clear()
+        elif predicate == 'reactant' or predicate == 'product':
+            if line in reaction_references:
+                continue
+            reaction_references.add(line)
+        output.write(line)
+        nb_facts += 1
+    return nb_facts
+
+def readSBMLnetwork_symbionts_clyngor(filename, name) :
+    """Read a SBML metabolic network
+    
+    Args:
+        filename (str): SBML file
+        name (str): suffix to identify the type of network
+    
+    Returns:
+        TermSet: metabolic model
+    """
+    all_atoms = set(Atom(predicate, args) for predicate, args in iterSBMLnetwork_symbionts(filename, name))
 
     lpfacts = TermSet(all_atoms)
 
@@ -17,8 +17,13 @@
 
 import json
 import os
+import re
 import tempfile
 
+# quoted ASP strings, with possibly escaped characters
+QUOTED_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+SYMBOLS_EXTENSION = '.symbols.json'
+
 def clean_up() :
     if os.path.isfile("parser.out"): os.remove("parser.out")
     if os.path.isfile("parsetab.py"): os.remove("parsetab.py")
@@ -46,6 +51,111 @@ def to_file(termset, outputfile=None):
     return outputfile
 
 
+def symbols_file(instance_file):
+    """Get the path of the symbol table of an interned instance
+
+    Args:
+        instance_file (str): ASP instance file
+
+    Returns:
+        str: path of the symbol table
+    """
+    return instance_file + SYMBOLS_EXTENSION
+
+
+def read_symbols(instance_file):
+    """Read the symbol table of an interned instance
+
+    Args:
+        instance_file (str): ASP instance file
+
+    Returns:
+        dict: integer identifier of each name, None if the instance is not interned
+    """
+    return read_symbol_table(symbols_file(instance_file))
+
+
+def read_symbol_table(symbols_path):
+    """Read a symbol table
+
+    Args:
+        symbols_path (str): JSON file listing the name of each identifier
+
+    Returns:
+        dict: integer identifier of each name, None if the file does not exist
+    """
+    if not os.path.isfile(symbols_path):
+        return None
+    with open(symbols_path, 'r') as f:
+        names = json.load(f)
+    return {name: identifier for identifier, name in enumerate(names)}
+
+
+def write_symbols(symbols, instance_file):
+    """Write the symbol table of an interned instance
+
+    Args:
+        symbols (dict): integer identifier of each name
+        instance_file (str): ASP instance file
+    """
+    write_symbol_table(symbols, symbols_file(instance_file))
+
+
+def write_symbol_table(symbols, symbols_path):
+    """Write a symbol table
+
+    Args:
+        symbols (dict): integer identifier of each name
+        symbols_path (str): JSON file listing the name of each identifier
+    """
+    with open(symbols_path, 'w') as f:
+        json.dump(list(symbols), f)
+
+
+def intern_file(input_file, symbols, output_file=None):
+    """Replace the quoted strings of ASP facts by integer identifiers.
+    Names missing from the symbol table are added to it.
+
+    Args:
+        input_file (str): ASP facts file
+        symbols (dict): integer identifier of each name, updated
+        output_file (str, optional): Defaults to None. interned file, input_file is replaced if None
+
+    Returns:
+        str: interned file
+    """
+    def intern_string(match):
+        name = match.group(1)
+        if name not in symbols:
+            symbols[name] = len(symbols)
+        return str(symbols[name])
+
+    fd, interned_file = tempfile.mkstemp(suffix='.lp', prefix='miscoto_', dir=os.path.dirname(os.path.abspath(output_file or input_file)))
+    with open(input_file, 'r') as infile, os.fdopen(fd, 'w') as outfile:
+        for line in infile:
+            outfile.write(QUOTED_STRING.sub(intern_string, line))
+    if output_file is None:
+        output_file = input_file
+    os.replace(interned_file, output_file)
+    return output_file
+
+
+def unintern_model(model, names):
+    """Replace the integer identifiers of an answer set by their names
+
+    Args:
+        model (dict): answer set grouped by predicate, as returned by clyngor
+        names (list): name of each identifier
+
+    Returns:
+        dict: answer set with names
+    """
+    def unintern_args(args):
+        return tuple(names[arg] if isinstance(arg, int) else arg for arg in args)
+
+    return {pred: frozenset(unintern_args(args) for args in all_args) for pred, all_args in model.items()}
+
+
 def to_json(input_dictionary, output_json):
     """write the content of miscoto results into a json.
     As results of opt_sol are already in the dictionary delete one_model.
@@ -120,6 +230,10 @@ def to_json(input_dictionary, output_json):
     if 'exchanged' in input_dictionary:
         alter_dict(input_dictionary, 'exchanged')
 
+    if 'per_target' in input_dictionary:
+        for target in input_dictionary['per_target']:
+            alter_dict(input_dictionary['per_target'][target], 'exchanged')
+
     if 'union_bacteria' in input_dictionary and 'inter_bacteria' in input_dictionary:
         input_dictionary['key_species'] = input_dictionary['union_bacteria']
         input_dictionary['essential_symbionts'] = input_dictionary['inter_bacteria']
@@ -1,11 +1,21 @@
 #!/usr/bin/python
 #-*- coding: utf-8 -*-
 
+import io
+import itertools
 import json
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from miscoto import run_instance, run_mincom, run_scopes, run_focus
+import pytest
+
+from miscoto import run_instance, run_mincom, run_scopes, run_focus, run_cache, query, sbml
+from miscoto import miscoto_mincom, pruning, cache
+from miscoto.miscoto_instance import read_instance
 
 
 def test_instance():
@@ -18,6 +28,156 @@ def test_instance():
         assert sorted(lp_instances) == sorted(expected_lp_instances)
 
 
+def test_instance_parallel(tmp_path):
+    serial_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'serial_test.lp'))
+    parallel_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'parallel_test.lp'), jobs=3)
+
+    with open(serial_instance, 'r') as serial_file, open(parallel_instance, 'r') as parallel_file:
+        serial_content = serial_file.read()
+        parallel_content = parallel_file.read()
+    assert parallel_content == serial_content
+    assert not os.path.exists(serial_instance + '.sources.json')
+
+
+def test_instance_cache(tmp_path):
+    cache_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'cache_test.lp'), cache_dir=str(tmp_path / 'cache_test'))
+    cache_results = run_cache(str(tmp_path / 'cache_test'))
+    cached_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'cached_test.lp'), cache_dir=str(tmp_path / 'cache_test'))
+
+    with open(cache_instance, 'r') as cache_file, open(cached_instance, 'r') as cached_file:
+        assert cache_file.read() == cached_file.read()
+    assert cache_results['entries'] == 3
+    assert run_cache(str(tmp_path / 'cache_test'), clear=True)['entries'] == 0
+
+
+def test_cache_foreign_files(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'instance.lp'), cache_dir=cache_dir)
+    foreign_files = [tmp_path / 'cache' / 'notes.txt', tmp_path / 'cache' / 'facts' / 'notes.lp']
+    for foreign_file in foreign_files:
+        foreign_file.write_text('not a cache entry')
+    cache_results = run_cache(cache_dir, clear=True)
+    assert cache_results['evicted_entries'] == 3
+    assert cache_results['entries'] == 0
+    for foreign_file in foreign_files:
+        assert foreign_file.exists()
+    user_dir = tmp_path / 'user'
+    user_dir.mkdir()
+    (user_dir / 'data.lp').write_text('not a cache entry')
+    with pytest.raises(SystemExit):
+        run_cache(str(user_dir), clear=True)
+    assert (user_dir / 'data.lp').exists()
+
+
+def test_cache_section_budget(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'instance.lp'), cache_dir=cache_dir)
+    facts_size = sum(size for _, size, _ in cache.list_entries(cache_dir, [cache.FACTS_DIR]))
+    assert cache.read_usage(cache_dir, cache.FACTS_DIR) == facts_size
+    cache.put_grounding(cache_dir, 'f' * 64, 'grounding')
+    assert cache.prune_section(cache_dir, cache.FACTS_DIR, facts_size) == (0, 0)
+    assert cache.prune_section(cache_dir, cache.GROUNDINGS_DIR, 0) == (1, len('grounding'))
+    assert len(cache.list_entries(cache_dir)) == 3
+    # concurrent writers and rewritten keys keep the recorded size exact
+    keys = ['%064x' % (index % 50) for index in range(200)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda key: cache.put_grounding(cache_dir, key, key), keys))
+    assert cache.read_usage(cache_dir, cache.GROUNDINGS_DIR) == sum(size for _, size, _ in cache.list_entries(cache_dir, [cache.GROUNDINGS_DIR])) == 50 * 64
+
+
+def test_instance_interned(tmp_path):
+    plain_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'plain_test.lp'))
+    interned_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'interned_test.lp'), interned=True)
+
+    assert os.path.getsize(interned_instance) < os.path.getsize(plain_instance)
+    for option in ['soup', 'minexch']:
+        plain_results = run_mincom(option=option, lp_instance_file=plain_instance, optsol=True, union=True, intersection=True)
+        interned_results = run_mincom(option=option, lp_instance_file=interned_instance, optsol=True, union=True, intersection=True)
+        assert set(interned_results['union_bacteria']) == set(plain_results['union_bacteria'])
+        assert set(interned_results['inter_bacteria']) == set(plain_results['inter_bacteria'])
+        assert set(interned_results['newly_prod']) == set(plain_results['newly_prod'])
+        assert interned_results['union_exchanged'] == plain_results['union_exchanged']
+    plain_scopes = run_scopes(lp_instance_file=plain_instance)
+    interned_scopes = run_scopes(lp_instance_file=interned_instance)
+    for result_key in plain_scopes:
+        if isinstance(plain_scopes[result_key], list):
+            assert set(interned_scopes[result_key]) == set(plain_scopes[result_key])
+        else:
+            assert interned_scopes[result_key] == plain_scopes[result_key]
+
+
+def test_instance_sharded(tmp_path):
+    plain_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'plain_test.lp'))
+    sharded_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'sharded_test'), sharded=True)
+
+    with open(os.path.join(sharded_instance, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    assert sorted(manifest['organisms']) == ['orgB1', 'orgB2', 'orgB3']
+    with open(plain_instance, 'r') as f:
+        nb_plain_facts = sum(1 for _ in f)
+    assert nb_plain_facts == sum(manifest[fragment]['facts'] for fragment in ['seeds', 'targets', 'host']) + sum(organism['facts'] for organism in manifest['organisms'].values())
+    assert read_instance(sharded_instance, organisms=['orgB1', 'orgB3'])['bacteria'] == ['orgB1', 'orgB3']
+
+    for option in ['soup', 'minexch']:
+        plain_results = run_mincom(option=option, lp_instance_file=plain_instance, optsol=True, union=True, intersection=True)
+        sharded_results = run_mincom(option=option, lp_instance_file=os.path.join(sharded_instance, 'manifest.json'), optsol=True, union=True, intersection=True)
+        assert set(sharded_results['union_bacteria']) == set(plain_results['union_bacteria'])
+        assert set(sharded_results['inter_bacteria']) == set(plain_results['inter_bacteria'])
+        assert sharded_results['union_exchanged'] == plain_results['union_exchanged']
+    plain_focus = run_focus(seeds_file=None, bacteria_dir=None, focus_bact=[], all_networks=True, lp_instance_file=plain_instance)
+    sharded_focus = run_focus(seeds_file=None, bacteria_dir=None, focus_bact=[], all_networks=True, lp_instance_file=sharded_instance)
+    assert sharded_focus == plain_focus
+
+
+def test_instance_update(tmp_path):
+    symbionts_dir = str(tmp_path / 'symbionts')
+    shutil.copytree('../toy/symbionts/', symbionts_dir)
+    os.remove(os.path.join(symbionts_dir, 'orgB3.xml'))
+    for sharded, output in [(False, str(tmp_path / 'update_test.lp')), (True, str(tmp_path / 'update_test'))]:
+        run_instance(host_file='../toy/orgA.xml', bacteria_dir=symbionts_dir, seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=output, sharded=sharded, track_sources=True)
+        assert read_instance(output)['bacteria'] == ['orgB1', 'orgB2']
+    # add orgB3, modify orgB1 keeping the older modification time of orgB2, and remove orgB2
+    shutil.copy('../toy/symbionts/orgB3.xml', symbionts_dir)
+    shutil.copy2('../toy/symbionts/orgB2.xml', os.path.join(symbionts_dir, 'orgB1.xml'))
+    os.utime(os.path.join(symbionts_dir, 'orgB1.xml'), (0, 0))
+    os.remove(os.path.join(symbionts_dir, 'orgB2.xml'))
+    expected_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir=symbionts_dir, seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'expected_update_test.lp'))
+    with open(expected_instance, 'r') as f:
+        expected_facts = set(f.read().splitlines())
+
+    updated_file = run_instance(host_file='../toy/orgA.xml', bacteria_dir=symbionts_dir, seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'update_test.lp'), update=True)
+    with open(updated_file, 'r') as f:
+        assert set(f.read().splitlines()) == expected_facts
+    updated_dir = run_instance(host_file='../toy/orgA.xml', bacteria_dir=symbionts_dir, seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'update_test'), update=True)
+    updated_facts = set()
+    for fragment in read_instance(updated_dir)['files']:
+        with open(fragment, 'r') as f:
+            updated_facts.update(f.read().splitlines())
+    assert updated_facts == expected_facts
+    assert sorted(os.listdir(os.path.join(updated_dir, 'organisms'))) == ['orgB1.lp', 'orgB3.lp']
+
+
+def test_stream_sbml_network():
+    with open('../toy/instance_toy.lp', 'r') as expected_file:
+        expected_facts = set(line for line in expected_file.read().splitlines()
+                                if line.endswith('"host_metab_mod").') and not line.startswith('draft'))
+    streamed_facts = set(predicate + '(' + ','.join(args) + ').'
+                            for predicate, args in sbml.iterSBMLnetwork_symbionts('../toy/orgA.xml', 'host_metab_mod'))
+    read_facts = set(str(atom) + '.' for atom in sbml.readSBMLnetwork_symbionts_clyngor('../toy/orgA.xml', 'host_metab_mod'))
+
+    assert streamed_facts == expected_facts
+    assert read_facts == expected_facts
+
+
+def test_write_sbml_network():
+    read_facts = sorted(str(atom) + '.' for atom in sbml.readSBMLnetwork_symbionts_clyngor('../toy/symbionts/orgB3.xml', 'orgB3'))
+    written_facts = io.StringIO()
+    nb_facts = sbml.writeSBMLnetwork_symbionts('../toy/symbionts/orgB3.xml', 'orgB3', written_facts)
+
+    assert sorted(written_facts.getvalue().splitlines()) == read_facts
+    assert nb_facts == len(read_facts)
+
+
 def test_mincom_minexch():
     expected_newly_productible = set(['f'])
     expected_bacteria = set(['orgB3'])
@@ -176,6 +336,266 @@ def test_mincom_key_stones():
     os.remove('test.json')
 
 
+def test_mincom_grounding_cache(tmp_path):
+    results = run_mincom(option='minexch', bacteria_dir='../toy/symbionts/', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True, cache_dir=str(tmp_path / 'grounding_cache_test'))
+    assert run_cache(str(tmp_path / 'grounding_cache_test'))['entries'] == 1
+    cached_results = run_mincom(option='minexch', bacteria_dir='../toy/symbionts/', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True, cache_dir=str(tmp_path / 'grounding_cache_test'))
+    assert run_cache(str(tmp_path / 'grounding_cache_test'))['entries'] == 1
+    for result_key in ['bacteria', 'union_bacteria', 'inter_bacteria']:
+        assert set(cached_results[result_key]) == set(results[result_key])
+    assert cached_results['score_optimum_union'] == results['score_optimum_union']
+    assert len(cached_results['enum_bacteria']) == len(results['enum_bacteria'])
+
+
+def test_module_backend():
+    for option in ['soup', 'minexch']:
+        binary_results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True)
+        module_results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True, backend='module')
+        for result_key in ['bacteria', 'union_bacteria', 'inter_bacteria', 'newly_prod', 'still_unprod']:
+            assert set(module_results[result_key]) == set(binary_results[result_key])
+        assert module_results['union_exchanged'] == binary_results['union_exchanged']
+        assert module_results['score_optimum_union'] == binary_results['score_optimum_union']
+        assert sorted(map(sorted, module_results['enum_bacteria'].values())) == sorted(map(sorted, binary_results['enum_bacteria'].values()))
+    binary_scopes = run_scopes(lp_instance_file='../toy/instance_toy.lp')
+    module_scopes = run_scopes(lp_instance_file='../toy/instance_toy.lp', backend='module')
+    for result_key in binary_scopes:
+        if isinstance(binary_scopes[result_key], list):
+            assert set(module_scopes[result_key]) == set(binary_scopes[result_key])
+        else:
+            assert module_scopes[result_key] == binary_scopes[result_key]
+    binary_focus = run_focus(seeds_file=None, bacteria_dir=None, focus_bact=[], all_networks=True, lp_instance_file='../toy/instance_toy.lp')
+    module_focus = run_focus(seeds_file=None, bacteria_dir=None, focus_bact=[], all_networks=True, lp_instance_file='../toy/instance_toy.lp', backend='module')
+    assert {ts: {key: set(value) for key, value in res.items()} for ts, res in module_focus.items()} == {ts: {key: set(value) for key, value in res.items()} for ts, res in binary_focus.items()}
+
+
+def test_community_session():
+    grounding = query.get_grounded_communities_from_file(['../toy/instance_toy.lp'], '../miscoto/encodings/community_minexch.lp')
+    session = query.CommunitySession(grounding)
+    union_m, union_score, union_complete = session.get_union_communities()
+    assert session.optimum == ','.join(map(str, union_score))
+    assert union_m == query.get_union_communities_from_g_noopti(grounding)[0]
+    model, score, proven = session.get_communities()
+    assert score == union_score
+    assert proven and union_complete
+    assert [sorted(model['chosen_bacteria', 1]) for model in session.get_all_communities()] == [[('orgB3',)]]
+    assert session.get_intersection_communities()[0]['chosen_bacteria', 1] == {('orgB3',)}
+
+
+def test_query_return_values():
+    grounding = query.get_grounded_communities_from_file(['../toy/instance_toy.lp'], '../miscoto/encodings/community_minexch.lp')
+    model, score = query.get_communities_from_g(grounding)
+    assert query.get_communities_from_g_with_optimality(grounding) == (model, score, True)
+    optimum = ','.join(map(str, score))
+    for get_models in [query.get_union_communities_from_g, query.get_intersection_communities_from_g]:
+        assert len(get_models(grounding, optimum)) == 2
+    for get_models in [query.get_union_communities_from_g_noopti_with_optimality, query.get_intersection_communities_from_g_noopti_with_optimality]:
+        assert get_models(grounding)[2]
+
+
+def test_mincom_threads():
+    results = run_mincom(option='minexch', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True)
+    for backend in ['binary', 'module']:
+        for parallel_mode in [None, 'compete', 'split']:
+            threaded_results = run_mincom(option='minexch', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True, enumeration=True,
+                                          backend=backend, threads=4, parallel_mode=parallel_mode)
+            for result_key in ['bacteria', 'union_bacteria', 'inter_bacteria']:
+                assert set(threaded_results[result_key]) == set(results[result_key])
+            assert threaded_results['score_optimum_inter'] == results['score_optimum_inter']
+            assert sorted(map(sorted, threaded_results['enum_bacteria'].values())) == sorted(map(sorted, results['enum_bacteria'].values()))
+
+
+def test_mincom_time_limit(tmp_path):
+    results = run_mincom(option='minexch', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True)
+    for backend in ['binary', 'module']:
+        timed_results = run_mincom(option='minexch', lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, intersection=True,
+                                   backend=backend, time_limit=60, progress_file=str(tmp_path / 'progress_test.jsonl'))
+        assert timed_results['optimality_proven'] and timed_results['union_optimality_proven'] and timed_results['inter_optimality_proven']
+        assert set(timed_results['bacteria']) == set(results['bacteria'])
+        assert set(timed_results['union_bacteria']) == set(results['union_bacteria'])
+        with open(str(tmp_path / 'progress_test.jsonl')) as f:
+            progress = [json.loads(line) for line in f]
+        assert progress[-1]['bacteria'] == sorted(results['bacteria'])
+        assert [solution['score'] for solution in progress] == sorted(solution['score'] for solution in progress)[::-1]
+    with pytest.raises(SystemExit):
+        run_mincom(option='minexch', lp_instance_file='../toy/instance_toy.lp', union=True, progress_file=str(tmp_path / 'no_optsol_test.jsonl'))
+    assert not os.path.exists(str(tmp_path / 'no_optsol_test.jsonl'))
+
+
+def test_mincom_enum_output(tmp_path):
+    results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True)
+    for backend in ['binary', 'module']:
+        streamed_results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True, backend=backend, enum_output=str(tmp_path / 'enum_test.jsonl'))
+        assert 'enum_bacteria' not in streamed_results
+        assert streamed_results['enum_count'] == results['enum_count'] == len(results['enum_bacteria'])
+        with open(str(tmp_path / 'enum_test.jsonl')) as f:
+            solutions = [json.loads(line) for line in f]
+        assert sorted(map(sorted, (solution['bacteria'] for solution in solutions))) == sorted(map(sorted, results['enum_bacteria'].values()))
+    grounding = query.get_grounded_communities_from_file(['../toy/instance_toy.lp'], '../miscoto/encodings/community_soup.lp')
+    solutions = miscoto_mincom.iter_communities(grounding)
+    assert next(solutions)['bacteria'] in results['enum_bacteria'].values()
+
+
+def test_mincom_enum_limits():
+    for backend in ['binary', 'module']:
+        results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True, backend=backend)
+        assert results['enum_stop_reason'] == 'complete'
+        bounded_results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True, backend=backend, enum_max=2)
+        assert bounded_results['enum_stop_reason'] == 'max_solutions'
+        assert bounded_results['enum_count'] == 2
+        assert all(bacteria in results['enum_bacteria'].values() for bacteria in bounded_results['enum_bacteria'].values())
+        exact_results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True, backend=backend, enum_max=results['enum_count'])
+        assert exact_results['enum_stop_reason'] == 'complete'
+        assert exact_results['enum_count'] == results['enum_count']
+        converged_results = run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', enumeration=True, backend=backend, enum_convergence=1, enum_time_limit=60)
+        assert converged_results['enum_count'] == 3
+
+
+def test_mincom_prune(tmp_path):
+    shutil.copy('../toy/instance_toy.lp', str(tmp_path / 'pruning_test.lp'))
+    with open(str(tmp_path / 'pruning_test.lp'), 'a') as f:
+        # orgB8 only produces y, useless for the target, orgB9 needs z, out of the scope
+        f.write('bacteria("orgB8").\nreaction("R_R8","orgB8").\nreactant("a","R_R8","orgB8").\nproduct("y","R_R8","orgB8").\n'
+                'species("a","a","c","orgB8").\nspecies("y","y","c","orgB8").\n'
+                'bacteria("orgB9").\nreaction("R_R9","orgB9").\nreactant("z","R_R9","orgB9").\nproduct("e","R_R9","orgB9").\n'
+                'species("z","z","c","orgB9").\nspecies("e","e","c","orgB9").\n')
+    with open(str(tmp_path / 'show_allscope_test.lp'), 'w') as f:
+        f.write('#show allscope/1.\n')
+    asp_scope = query.last_model(query.models_with_optimization(files=[str(tmp_path / 'pruning_test.lp'), '../miscoto/encodings/scopes.lp', str(tmp_path / 'show_allscope_test.lp')]))[0]
+    scope, _ = pruning.community_scope(pruning.community_network(pruning.read_facts([str(tmp_path / 'pruning_test.lp')])))
+    assert {'"' + metabolite + '"' for metabolite, in asp_scope['allscope', 1]} == scope
+
+    for option in ['soup', 'minexch']:
+        results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'pruning_test.lp'), optsol=True, union=True, intersection=True, enumeration=True)
+        pruned_results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'pruning_test.lp'), optsol=True, union=True, intersection=True, enumeration=True, prune=True)
+        assert sorted(pruned_results['pruned_bacteria']) == ['orgB8', 'orgB9']
+        for result_key in ['union_bacteria', 'inter_bacteria']:
+            assert set(pruned_results[result_key]) == set(results[result_key])
+        assert sorted(map(sorted, pruned_results['enum_bacteria'].values())) == sorted(map(sorted, results['enum_bacteria'].values()))
+
+
+def test_mincom_reduce(tmp_path):
+    with open('../toy/instance_toy.lp') as f:
+        lines = f.readlines()
+    with open(str(tmp_path / 'reduce_test.lp'), 'w') as f:
+        f.writelines(lines)
+        # orgB7 is identical to orgB3, orgB6 is orgB3 without the reaction R_R4
+        f.writelines(line.replace('"orgB3"', '"orgB7"') for line in lines if '"orgB3"' in line)
+        f.writelines(line.replace('"orgB3"', '"orgB6"') for line in lines if '"orgB3"' in line and 'R_R4' not in line)
+        # orgB5 is orgB3 with an extra reactant x in R_R4, it can not replace orgB3
+        f.writelines(line.replace('"orgB3"', '"orgB5"') for line in lines if '"orgB3"' in line)
+        f.write('reactant("x","R_R4","orgB5").\nspecies("x","x","c","orgB5").\n')
+    for option in ['soup', 'minexch']:
+        results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'reduce_test.lp'), optsol=True, union=True, intersection=True, enumeration=True)
+        reduced_results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'reduce_test.lp'), optsol=True, union=True, intersection=True, enumeration=True,
+                                     reduce_symbionts=True)
+        assert reduced_results['equivalent_bacteria'] == {'orgB3': ['orgB7']}
+        for result_key in ['union_bacteria', 'inter_bacteria']:
+            assert set(reduced_results[result_key]) == set(results[result_key])
+        assert reduced_results['union_exchanged'] == results['union_exchanged']
+        assert sorted(map(sorted, reduced_results['enum_bacteria'].values())) == sorted(map(sorted, results['enum_bacteria'].values()))
+        bounded_results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'reduce_test.lp'), enumeration=True, reduce_symbionts=True, enum_max=1)
+        assert bounded_results['enum_count'] == 1
+        assert bounded_results['enum_stop_reason'] == 'max_solutions'
+        dominance_results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'reduce_test.lp'), optsol=True, remove_dominated=True)
+        assert 'orgB3' not in dominance_results['dominated_bacteria']
+        assert dominance_results['dominated_bacteria']['orgB5'] == dominance_results['dominated_bacteria']['orgB6'] == 'orgB3'
+        assert len(dominance_results['bacteria']) == len(results['bacteria'])
+
+
+def test_mincom_decompose(tmp_path):
+    with open('../toy/instance_toy.lp') as f:
+        lines = f.readlines()
+    with open(str(tmp_path / 'decompose_test.lp'), 'w') as f:
+        f.writelines(lines)
+        # disjoint copy of the community sharing the host, with its own seeds and targets
+        f.writelines(re.sub(r'"([^"]*)"', lambda m: m.group(0) if m.group(1) == 'host_metab_mod' else '"' + m.group(1) + '_2"', line)
+                     for line in lines if not line.startswith('draft('))
+    for option in ['soup', 'minexch']:
+        results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'decompose_test.lp'), optsol=True, union=True, intersection=True, enumeration=True)
+        decomposed_results = run_mincom(option=option, lp_instance_file=str(tmp_path / 'decompose_test.lp'), optsol=True, union=True, intersection=True, enumeration=True,
+                                        decompose=True, jobs=2)
+        assert len(decomposed_results['target_components']) == 2
+        assert len(decomposed_results['bacteria']) == len(results['bacteria'])
+        for result_key in ['union_bacteria', 'inter_bacteria', 'newly_prod']:
+            assert set(decomposed_results[result_key]) == set(results[result_key])
+        assert decomposed_results['score_optimum_union'] == results['score_optimum_union']
+        assert sorted(map(sorted, decomposed_results['enum_bacteria'].values())) == sorted(map(sorted, results['enum_bacteria'].values()))
+
+
+def test_component_models():
+    groups = [[{'chosen_bacteria': frozenset({(bacterium,)}), ('chosen_bacteria', 1): frozenset({(bacterium,)}), 'seed': frozenset({('s',)})}
+               for bacterium in bacteria] for bacteria in (['a', 'b'], ['c', 'd', 'e'])]
+    models_files = [miscoto_mincom.write_models(models) for models in groups]
+    expected = [tuple({pred: atoms for pred, atoms in model.items() if pred != 'seed'} for model in models) for models in itertools.product(*groups)]
+    assert list(miscoto_mincom.iter_component_models(models_files)) == expected
+    for models_file in models_files:
+        os.remove(models_file)
+    assert miscoto_mincom.merge_component_models([({}, [0, 1, 2], True), ({}, [1, 0, 1], True)])[1] == [1, 1, 3]
+    with pytest.raises(ValueError):
+        miscoto_mincom.merge_component_models([({}, [0, 1, 2], True), ({}, [1], True)])
+
+
+def test_mincom_greedy():
+    for option in ['soup', 'minexch']:
+        for backend in ['binary', 'module']:
+            results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, backend=backend)
+            greedy_results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=True, union=True, backend=backend, greedy=True)
+            assert greedy_results['greedy_bacteria'] == ['orgB2']
+            assert greedy_results['optimality_proven']
+            assert len(greedy_results['bacteria']) == len(results['bacteria'])
+            assert set(greedy_results['union_bacteria']) == set(results['union_bacteria'])
+            compared_results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=True, backend=backend, greedy=True, greedy_compare=True)
+            assert compared_results['optimization_solutions'] >= 1 and compared_results['baseline_optimization_solutions'] >= 1
+            assert compared_results['greedy_time_saved'] == round(compared_results['baseline_optimization_time'] - compared_results['optimization_time'] - compared_results['greedy_time'], 3)
+    with pytest.raises(SystemExit):
+        run_mincom(option='soup', lp_instance_file='../toy/instance_toy.lp', optsol=True, greedy_compare=True)
+    grounding = query.get_grounded_communities_from_file(['../toy/instance_toy.lp'], '../miscoto/encodings/community_soup.lp')
+    session = query.CommunitySession(grounding)
+    default_heuristic = session.ctl.configuration.solver.heuristic
+    session.get_communities(heuristic=True)
+    assert session.ctl.configuration.solver.heuristic == default_heuristic
+
+
+def test_mincom_exchange_pruning():
+    producers, consumers = pruning.exchange_candidates(['../toy/instance_toy.lp'])
+    assert ('"e"', '"orgB3"') in producers
+    assert ('"e"', '"host_metab_mod"') in consumers
+    for kwargs in [{'lp_instance_file': '../toy/instance_toy.lp'},
+                   {'bacteria_dir': '../toy/symbionts_nohost/', 'seeds_file': '../toy/seeds.xml', 'targets_file': '../toy/targets.xml'}]:
+        results = run_mincom(option='minexch', optsol=True, union=True, intersection=True, enumeration=True, **kwargs)
+        pruned_results = run_mincom(option='minexch', optsol=True, union=True, intersection=True, enumeration=True, exchange_pruning=True, **kwargs)
+        for result_key in ['union_bacteria', 'inter_bacteria']:
+            assert set(pruned_results[result_key]) == set(results[result_key])
+        assert pruned_results['score_optimum_union'] == results['score_optimum_union']
+        assert pruned_results['union_exchanged'] == results['union_exchanged']
+        assert pruned_results['enum_count'] == results['enum_count']
+
+
+def test_mincom_per_target(tmp_path):
+    interned_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets.xml', output=str(tmp_path / 'per_target_test.lp'), interned=True)
+    for option in ['soup', 'minexch']:
+        for jobs in [1, 2]:
+            results = run_mincom(option=option, lp_instance_file=interned_instance, per_target=True, jobs=jobs, per_target_table=str(tmp_path / 'per_target_test.tsv'))
+            assert sorted(results['per_target']) == ['c', 'f']
+            assert results['per_target']['c']['bacteria'] == []
+            # c is produced by the host, f alone needs as many bacteria as both targets
+            all_results = run_mincom(option=option, lp_instance_file=interned_instance, optsol=True)
+            assert len(results['per_target']['f']['bacteria']) == len(all_results['bacteria'])
+            with open(str(tmp_path / 'per_target_test.tsv')) as f:
+                assert len(f.readlines()) == 3
+
+
+def test_mincom_concurrent_consequences():
+    for option in ['soup', 'minexch']:
+        for backend, optsol in [('binary', True), ('binary', False), ('module', True)]:
+            results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=optsol, union=True, intersection=True, backend=backend)
+            concurrent_results = run_mincom(option=option, lp_instance_file='../toy/instance_toy.lp', optsol=optsol, union=True, intersection=True, backend=backend, concurrent=True)
+            for result_key in ['union_bacteria', 'inter_bacteria']:
+                assert set(concurrent_results[result_key]) == set(results[result_key])
+            for result_key in ['union_exchanged', 'inter_exchanged', 'score_optimum_union', 'score_optimum_inter']:
+                assert concurrent_results[result_key] == results[result_key]
+
+
 def test_scopes():
     producible_targets = set()
     unproducible_targets = set(['f'])
@@ -196,6 +616,46 @@ def test_scopes():
     assert results['targets_producers'] == expected_producer
 
 
+def test_scopes_native_engine(tmp_path):
+    interned_instance = run_instance(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'native_test.lp'), interned=True)
+    for kwargs in [{'lp_instance_file': '../toy/instance_toy.lp'}, {'lp_instance_file': interned_instance},
+                   {'host_file': '../toy/orgA.xml', 'bacteria_dir': '../toy/symbionts/', 'seeds_file': '../toy/seeds.xml', 'targets_file': '../toy/targets_A.xml'},
+                   {'bacteria_dir': '../toy/symbionts/', 'seeds_file': '../toy/seeds.xml', 'targets_file': '../toy/targets_A.xml'}]:
+        asp_scopes = run_scopes(**kwargs)
+        native_scopes = run_scopes(engine='native', **kwargs)
+        assert native_scopes.keys() == asp_scopes.keys()
+        for result_key in asp_scopes:
+            if isinstance(asp_scopes[result_key], list):
+                assert sorted(native_scopes[result_key]) == sorted(asp_scopes[result_key])
+            else:
+                assert {target: sorted(producers) for target, producers in native_scopes[result_key].items()} == {target: sorted(producers) for target, producers in asp_scopes[result_key].items()}
+
+
+def test_scopes_seeds_batch(tmp_path):
+    seeds_dir = tmp_path / 'seeds'
+    seeds_dir.mkdir()
+    shutil.copy('../toy/seeds.xml', str(seeds_dir / 'full.xml'))
+    with open('../toy/seeds.xml') as f, open(str(seeds_dir / 'only_a.xml'), 'w') as out:
+        out.writelines(line for line in f if 'id="b"' not in line)
+    inputs = {'host_file': '../toy/orgA.xml', 'bacteria_dir': '../toy/symbionts/', 'targets_file': '../toy/targets_A.xml'}
+    for engine in ['asp', 'native']:
+        batch_results = run_scopes(seeds_batch=str(seeds_dir), output_dir=str(tmp_path / 'seeds_batch_output_test'), output_table=str(tmp_path / 'seeds_batch_test.tsv'), engine=engine, **inputs)
+        assert sorted(batch_results) == ['full', 'only_a']
+        for seeds_name in batch_results:
+            results = run_scopes(seeds_file=str(seeds_dir / (seeds_name + '.xml')), **inputs)
+            assert {key: sorted(value) for key, value in batch_results[seeds_name].items()} == {key: sorted(value) for key, value in results.items()}
+            with open(str(tmp_path / 'seeds_batch_output_test' / (seeds_name + '.json'))) as f:
+                assert sorted(json.load(f)['host_scope']) == sorted(results['host_scope'])
+        with open(str(tmp_path / 'seeds_batch_test.tsv')) as f:
+            assert len(f.readlines()) == 3
+        assert batch_results['full']['com_prodtargets'] == ['f'] and batch_results['only_a']['com_prodtargets'] == []
+        # the seed sets replace the seeds a and b of the instance, unless they are kept
+        instance_results = run_scopes(lp_instance_file='../toy/instance_toy.lp', seeds_batch=str(seeds_dir), engine=engine)
+        assert instance_results['only_a']['com_prodtargets'] == []
+        kept_results = run_scopes(lp_instance_file='../toy/instance_toy.lp', seeds_batch=str(seeds_dir), engine=engine, keep_instance_seeds=True)
+        assert kept_results['only_a']['com_prodtargets'] == kept_results['full']['com_prodtargets'] == ['f']
+
+
 def test_create_json_scopes():
     results = run_scopes(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output_json='test.json')
     dict_results = json.loads(open('test.json', 'r').read())
@@ -244,6 +704,7 @@ def test_scopes_json_instance_cli():
     os.remove('test.json')
     os.remove('test.lp')
 
+
 def test_scopes_json_instance_no_host_cli():
     subprocess.call(['miscoto', 'instance', '-b', '../toy/symbionts/',
                     '-s', '../toy/seeds.xml', '-t', '../toy/targets.xml', '--output', 'instance_nohost_test.lp'])
@@ -271,6 +732,7 @@ def test_scopes_json_instance_no_host_cli():
     os.remove('instance_nohost_test.json')
     os.remove('instance_nohost_test.lp')
 
+
 def test_focus_cli_json():
     subprocess.call(['miscoto', 'focus', '-b', '../toy/symbionts_nohost/', '-s', '../toy/seeds.xml',
                     '-f', 'orgA', '--output', 'focus_res_test.json'])
@@ -283,6 +745,7 @@ def test_focus_cli_json():
         assert sorted(dict_results[result_key]) == sorted(expected_results[result_key])
     os.remove('focus_res_test.json')
 
+
 def test_focus_call():
     dict_results = run_focus(bacteria_dir='../toy/symbionts_nohost/', seeds_file='../toy/seeds.xml', focus_bact=['orgA'])
 
@@ -293,6 +756,7 @@ def test_focus_call():
     for result_key in expected_results:
         assert sorted(dict_results[result_key]) == sorted(expected_results[result_key])
 
+
 def test_focus_list():
     dict_results = run_focus(bacteria_dir='../toy/symbionts_nohost/', seeds_file='../toy/seeds.xml', focus_bact=['orgA', 'orgB1', 'orgB2'])
 
@@ -312,6 +776,7 @@ def test_focus_list():
         for result_key in expected_results[org]:
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
+
 def test_focus_all():
     dict_results = run_focus(bacteria_dir='../toy/symbionts_nohost/', seeds_file='../toy/seeds.xml', focus_bact=[], all_networks=True)
 
@@ -335,6 +800,7 @@ def test_focus_all():
         for result_key in expected_results[org]:
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
+
 def test_focus_all_instance_cli():
     subprocess.call(['miscoto', 'instance', '-b', '../toy/symbionts_nohost/',
                     '-s', '../toy/seeds.xml', '--output', 'instance_nohost_test.lp'])
@@ -361,6 +827,7 @@ def test_focus_all_instance_cli():
         for result_key in expected_results[org]:
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
+
 def test_focus_all_instance_json():
     subprocess.call(['miscoto', 'instance', '-b', '../toy/symbionts_nohost/',
                     '-s', '../toy/seeds.xml', '--output', 'instance_nohost_test.lp'])
@@ -388,6 +855,7 @@ def test_focus_all_instance_json():
         for result_key in expected_results[org]:
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
+
 def test_focus_all_instance_and_seeds():
     subprocess.call(['miscoto', 'instance', '-b', '../toy/symbionts_nohost/',
                     '--output', 'instance_nohost_test.lp'])
@@ -414,6 +882,7 @@ def test_focus_all_instance_and_seeds():
         for result_key in expected_results[org]:
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
+
 def test_focus_all_instance_and_seeds_json():
     subprocess.call(['miscoto', 'instance', '-b', '../toy/symbionts_nohost/',
                     '--output', 'instance_nohost_test.lp'])
@@ -442,6 +911,43 @@ def test_focus_all_instance_and_seeds_json():
             assert sorted(dict_results[org][result_key]) == sorted(expected_results[org][result_key])
 
 
+def test_focus_native_engine(tmp_path):
+    interned_instance = run_instance(bacteria_dir='../toy/symbionts_nohost/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'native_focus_test.lp'), interned=True)
+    # seeds of a name missing from the symbol table of the instance
+    new_seeds = tmp_path / 'new_seeds.xml'
+    with open('../toy/seeds.xml') as f:
+        new_seeds.write_text(f.read().replace('<species id="b"', '<species id="new_seed" name="new_seed" compartment="c" boundaryCondition="false"/>\n  <species id="b"'))
+    for kwargs in [{'seeds_file': '../toy/seeds.xml', 'bacteria_dir': '../toy/symbionts_nohost/', 'focus_bact': [], 'all_networks': True},
+                   {'seeds_file': '../toy/seeds.xml', 'bacteria_dir': '../toy/symbionts_nohost/', 'focus_bact': ['orgA', 'orgB1']},
+                   {'seeds_file': None, 'bacteria_dir': None, 'focus_bact': [], 'all_networks': True, 'lp_instance_file': interned_instance},
+                   {'seeds_file': str(new_seeds), 'bacteria_dir': None, 'focus_bact': [], 'all_networks': True, 'lp_instance_file': interned_instance}]:
+        asp_focus = run_focus(**kwargs)
+        native_focus = run_focus(engine='native', **kwargs)
+        assert {ts: {key: sorted(value) for key, value in res.items()} for ts, res in native_focus.items()} == {ts: {key: sorted(value) for key, value in res.items()} for ts, res in asp_focus.items()}
+
+
+def test_focus_chunks(tmp_path):
+    interned_instance = run_instance(bacteria_dir='../toy/symbionts_nohost/', seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml', output=str(tmp_path / 'chunk_focus_test.lp'), interned=True)
+    for kwargs in [{'seeds_file': '../toy/seeds.xml', 'bacteria_dir': '../toy/symbionts_nohost/', 'focus_bact': [], 'all_networks': True},
+                   {'seeds_file': None, 'bacteria_dir': None, 'focus_bact': [], 'all_networks': True, 'lp_instance_file': interned_instance}]:
+        single_focus = run_focus(**kwargs)
+        for engine in ['asp', 'native']:
+            chunk_focus = run_focus(engine=engine, chunk_size=2, jobs=2, **kwargs)
+            assert {ts: {key: sorted(value) for key, value in res.items()} for ts, res in chunk_focus.items()} == {ts: {key: sorted(value) for key, value in res.items()} for ts, res in single_focus.items()}
+
+
+def test_focus_temporary_files(tmp_path, monkeypatch):
+    temp_dir = tmp_path / 'temp'
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temp_dir))
+    for kwargs in [{'seeds_file': '../toy/seeds.xml', 'bacteria_dir': '../toy/symbionts_nohost/', 'focus_bact': ['orgB1']},
+                   {'seeds_file': '../toy/seeds.xml', 'bacteria_dir': None, 'focus_bact': ['orgB1'], 'lp_instance_file': '../toy/instance_toy.lp'}]:
+        run_focus(**kwargs)
+        assert os.listdir(str(temp_dir)) == []
+        with pytest.raises(SystemExit):
+            run_focus(**dict(kwargs, focus_bact=['unknown']))
+        assert os.listdir(str(temp_dir)) == []
+
 def test_create_json_mincom_minexch():
     results = run_mincom(host_file='../toy/orgA.xml', bacteria_dir='../toy/symbionts/',
                         seeds_file='../toy/seeds.xml', targets_file='../toy/targets_A.xml',